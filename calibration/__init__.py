@@ -1,13 +1,14 @@
 from individual_calibration import CalibradorCamara
 from stereo_calibration import CalibradorEstereo
+from calibration_bundle import CALIBRATION_DIR, DEFAULT_BUNDLE_PATH
 import os
 
 if __name__ == "__main__":
     chessboard_size = (8, 6)
-    left_folder = "../data/calibration/left"
-    right_folder = "../data/calibration/right"
-    left_calib_file = os.path.join(left_folder, "left_calib.npy")
-    right_calib_file = os.path.join(right_folder, "right_calib.npy")
+    left_folder = os.path.join(CALIBRATION_DIR, "left")
+    right_folder = os.path.join(CALIBRATION_DIR, "right")
+    left_calib_file = os.path.join(left_folder, "left_calib.npz")
+    right_calib_file = os.path.join(right_folder, "right_calib.npz")
 
     # Calibración individual
     cam_calib = CalibradorCamara(chessboard_size)
@@ -16,4 +17,4 @@ if __name__ == "__main__":
 
     # Calibración estéreo
     stereo_calib = CalibradorEstereo(chessboard_size)
-    stereo_calib.calibrar(left_calib_file, right_calib_file, left_folder, right_folder)
+    stereo_calib.calibrar(left_calib_file, right_calib_file, left_folder, right_folder, DEFAULT_BUNDLE_PATH)
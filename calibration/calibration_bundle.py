@@ -0,0 +1,111 @@
+import os
+
+import cv2
+import numpy as np
+
+SCHEMA_VERSION = 1
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+CALIBRATION_DIR = os.path.join(REPO_ROOT, "data", "calibration")
+DEFAULT_BUNDLE_PATH = os.path.join(CALIBRATION_DIR, "stereo_bundle.npz")
+
+CAMPOS_CAMARA = ("image_size", "camera_matrix", "dist_coeffs", "rms")
+CAMPOS_ESTEREO = ("image_size", "K1", "D1", "K2", "D2", "R", "T", "E", "F",
+                  "R1", "R2", "P1_rect", "P2_rect", "Q", "rms_l", "rms_r", "rms_estereo")
+
+
+class CalibracionEstereo:
+    """
+    Calibración estéreo completa cargada desde un bundle .npz: tamaño de
+    imagen, intrínsecos y distorsión de cada cámara, R/T/E/F, matrices de
+    rectificación y proyección rectificada, y errores RMS.
+    """
+
+    def __init__(self, path, campos):
+        self.path = path
+        self.schema_version = int(campos["schema_version"])
+        for nombre in CAMPOS_ESTEREO:
+            setattr(self, nombre, campos[nombre])
+        self.image_size = tuple(int(v) for v in self.image_size)
+
+    @property
+    def P1(self):
+        """Proyección de la cámara izquierda, K1 [I | 0]."""
+        return self.K1 @ np.hstack((np.eye(3), np.zeros((3, 1))))
+
+    @property
+    def P2(self):
+        """Proyección de la cámara derecha, K2 [R | T]."""
+        return self.K2 @ np.hstack((self.R, self.T.reshape(3, 1)))
+
+
+def _guardar(path, campos):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # np.savez sin compresión ni pickle: la carga es una lectura directa
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, schema_version=np.int64(SCHEMA_VERSION), **campos)
+    os.replace(tmp_path, path)
+
+
+def _cargar(path, campos_requeridos):
+    with np.load(path, allow_pickle=False) as data:
+        campos = {nombre: data[nombre] for nombre in data.files}
+    version = int(campos.get("schema_version", -1))
+    if version != SCHEMA_VERSION:
+        raise ValueError(f"Versión de esquema {version} no soportada en {path} (se espera {SCHEMA_VERSION})")
+    faltan = [nombre for nombre in campos_requeridos if nombre not in campos]
+    if faltan:
+        raise ValueError(f"Faltan campos en {path}: {', '.join(faltan)}")
+    return campos
+
+
+def guardar_camara(path, image_size, K, D, rms):
+    _guardar(path, {"image_size": np.asarray(image_size, dtype=np.int64),
+                    "camera_matrix": K, "dist_coeffs": D, "rms": np.float64(rms)})
+
+
+def cargar_camara(path):
+    """
+    Devuelve (K, D, image_size, rms) de una calibración individual. Acepta
+    también el formato antiguo .npy con un diccionario serializado, en cuyo
+    caso image_size y rms son None.
+    """
+    if path.endswith(".npy"):
+        data = np.load(path, allow_pickle=True).item()
+        return data["camera_matrix"], data["dist_coeffs"], None, None
+    campos = _cargar(path, CAMPOS_CAMARA)
+    return (campos["camera_matrix"], campos["dist_coeffs"],
+            tuple(int(v) for v in campos["image_size"]), float(campos["rms"]))
+
+
+def guardar_bundle(path, image_size, K1, D1, K2, D2, R, T, E, F, rms_l=np.nan, rms_r=np.nan, rms_estereo=np.nan):
+    """
+    Guarda la calibración estéreo completa, incluyendo la rectificación
+    calculada con cv2.stereoRectify para image_size (ancho, alto).
+    """
+    image_size = tuple(int(v) for v in image_size)
+    R1, R2, P1_rect, P2_rect, Q, _, _ = cv2.stereoRectify(K1, D1, K2, D2, image_size, R, T, alpha=0)
+    _guardar(path, {
+        "image_size": np.asarray(image_size, dtype=np.int64),
+        "K1": K1, "D1": D1, "K2": K2, "D2": D2,
+        "R": R, "T": T, "E": E, "F": F,
+        "R1": R1, "R2": R2, "P1_rect": P1_rect, "P2_rect": P2_rect, "Q": Q,
+        "rms_l": np.float64(rms_l), "rms_r": np.float64(rms_r), "rms_estereo": np.float64(rms_estereo),
+    })
+
+
+def cargar_bundle(path=DEFAULT_BUNDLE_PATH):
+    return CalibracionEstereo(path, _cargar(path, CAMPOS_ESTEREO))
+
+
+def convertir_legacy(left_calib_path, right_calib_path, stereo_calib_path, image_size, save_path=DEFAULT_BUNDLE_PATH):
+    """
+    Genera un bundle a partir de los tres .npy antiguos (diccionarios
+    serializados con pickle). Los errores RMS no se conocen y quedan a NaN.
+    """
+    K1, D1, _, _ = cargar_camara(left_calib_path)
+    K2, D2, _, _ = cargar_camara(right_calib_path)
+    stereo = np.load(stereo_calib_path, allow_pickle=True).item()
+    guardar_bundle(save_path, image_size, K1, D1, K2, D2,
+                   stereo["R"], stereo["T"], stereo["E"], stereo["F"])
+    return cargar_bundle(save_path)
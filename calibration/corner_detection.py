@@ -0,0 +1,104 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from calibration_bundle import REPO_ROOT
+
+DEFAULT_CACHE_DIR = os.path.join(REPO_ROOT, "data", "cache", "corners")
+
+FLAGS = (cv2.CALIB_CB_ADAPTIVE_THRESH |
+         cv2.CALIB_CB_NORMALIZE_IMAGE |
+         cv2.CALIB_CB_FAST_CHECK)
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+
+
+def _detectar_en_imagen(path, chessboard_size, escala_busqueda):
+    """
+    Busca el tablero en una versión reducida de la imagen y refina las
+    esquinas con cornerSubPix a resolución completa. Si no se encuentra en
+    la imagen reducida se reintenta a resolución completa.
+    Devuelve (esquinas o None, (ancho, alto)) o (None, None) si no se lee.
+    """
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None, None
+    image_size = gray.shape[::-1]
+
+    ret, corners = False, None
+    if escala_busqueda < 1.0:
+        small = cv2.resize(gray, None, fx=escala_busqueda, fy=escala_busqueda, interpolation=cv2.INTER_AREA)
+        ret, corners = cv2.findChessboardCorners(small, chessboard_size, FLAGS)
+        if ret:
+            corners = corners / escala_busqueda
+    if not ret:
+        ret, corners = cv2.findChessboardCorners(gray, chessboard_size, FLAGS)
+    if not ret:
+        return None, image_size
+
+    corners = cv2.cornerSubPix(gray, corners.astype(np.float32), winSize=(11, 11), zeroZone=(-1, -1),
+                               criteria=SUBPIX_CRITERIA)
+    return corners, image_size
+
+
+def _clave(path, chessboard_size, escala_busqueda):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        digest.update(f.read())
+    digest.update(f"{chessboard_size[0]}x{chessboard_size[1]}@{escala_busqueda}".encode())
+    return digest.hexdigest()
+
+
+def detectar_esquinas(image_paths, chessboard_size, procesos=None, escala_busqueda=0.5,
+                      cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Detecta las esquinas del tablero en todas las imágenes usando un pool de
+    procesos. Los resultados se guardan en cache_dir con clave el hash del
+    contenido de cada imagen, de modo que la calibración estéreo y las
+    ejecuciones posteriores reutilizan las esquinas ya encontradas.
+
+    Devuelve un diccionario ruta -> (esquinas o None, (ancho, alto)).
+    """
+    resultados, pendientes = {}, {}
+    for path in image_paths:
+        if not os.path.isfile(path):
+            resultados[path] = (None, None)
+            continue
+        clave = _clave(path, chessboard_size, escala_busqueda)
+        cache_path = os.path.join(cache_dir, f"{clave}.npz") if cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            with np.load(cache_path) as data:
+                corners = data["corners"] if bool(data["found"]) else None
+                resultados[path] = (corners, tuple(int(v) for v in data["image_size"]))
+        else:
+            pendientes[path] = cache_path
+
+    if pendientes:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            futuros = {path: pool.submit(_detectar_en_imagen, path, chessboard_size, escala_busqueda)
+                       for path in pendientes}
+            for path, futuro in futuros.items():
+                corners, image_size = futuro.result()
+                resultados[path] = (corners, image_size)
+                cache_path = pendientes[path]
+                if cache_path and image_size is not None:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    np.savez(cache_path, found=corners is not None,
+                             corners=corners if corners is not None else np.empty((0, 1, 2), np.float32),
+                             image_size=np.asarray(image_size))
+
+    return resultados
+
+
+def mostrar_esquinas(ventana, path, chessboard_size, corners):
+    """
+    Vista previa opcional de las esquinas detectadas.
+    """
+    img = cv2.imread(path)
+    if img is None:
+        return
+    cv2.drawChessboardCorners(img, chessboard_size, corners, True)
+    cv2.imshow(ventana, img)
+    cv2.waitKey(100)
@@ -2,10 +2,15 @@ import cv2
 import numpy as np
 import os
 import glob
+from calibration_bundle import guardar_camara, cargar_camara
+from corner_detection import detectar_esquinas, mostrar_esquinas
 
 class CalibradorCamara:
-    def __init__(self, chessboard_size=(8, 6)):
+    def __init__(self, chessboard_size=(8, 6), procesos=None, escala_busqueda=0.5, mostrar=False):
         self.chessboard_size = chessboard_size
+        self.procesos = procesos
+        self.escala_busqueda = escala_busqueda
+        self.mostrar = mostrar
 
     def calibrar(self, image_folder, save_path):
         nx, ny = self.chessboard_size
@@ -20,44 +25,38 @@ class CalibradorCamara:
             print(f"❌ No hay imágenes en {image_folder}")
             return None, None
 
-        flags = (cv2.CALIB_CB_ADAPTIVE_THRESH |
-                 cv2.CALIB_CB_NORMALIZE_IMAGE |
-                 cv2.CALIB_CB_FAST_CHECK)
+        # Detección en paralelo (y cacheada) de las esquinas de todas las imágenes
+        esquinas = detectar_esquinas(images, (nx, ny), self.procesos, self.escala_busqueda)
+        image_size = None
 
         for fname in images:
-            img = cv2.imread(fname)
-            if img is None:
+            corners, size = esquinas[fname]
+            if size is None:
                 print(f"⚠️ No pude leer {fname}")
                 continue
+            image_size = size
 
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            ret, corners = cv2.findChessboardCorners(gray, (nx, ny), flags)
-
-            if ret:
-                cv2.cornerSubPix(
-                    gray, corners, winSize=(11, 11), zeroZone=(-1, -1),
-                    criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
-                )
+            if corners is not None:
                 objpoints.append(objp)
                 imgpoints.append(corners)
-                cv2.drawChessboardCorners(img, (nx, ny), corners, ret)
-                cv2.imshow('Esquinas detectadas', img)
-                cv2.waitKey(100)
+                if self.mostrar:
+                    mostrar_esquinas('Esquinas detectadas', fname, (nx, ny), corners)
 
-        cv2.destroyAllWindows()
+        if self.mostrar:
+            cv2.destroyAllWindows()
 
         if not objpoints:
             print("❌ No se detectaron esquinas. Abortando.")
             return None, None
 
-        ret, K, D, _, _ = cv2.calibrateCamera(objpoints, imgpoints, gray.shape[::-1], None, None)
+        ret, K, D, _, _ = cv2.calibrateCamera(objpoints, imgpoints, image_size, None, None)
         print(f"✅ RMS error: {ret:.4f}")
 
-        np.save(save_path, {'camera_matrix': K, 'dist_coeffs': D})
+        guardar_camara(save_path, image_size, K, D, ret)
         print(f"📁 Guardado en {save_path}")
         return K, D
 
     @staticmethod
     def cargar_calibracion(calib_path):
-        data = np.load(calib_path, allow_pickle=True).item()
-        return data['camera_matrix'], data['dist_coeffs']
+        K, D, _, _ = cargar_camara(calib_path)
+        return K, D
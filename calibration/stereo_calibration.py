@@ -2,11 +2,15 @@ import cv2
 import numpy as np
 import os
 import glob
-from individual_calibration import CalibradorCamara
+from calibration_bundle import DEFAULT_BUNDLE_PATH, cargar_camara, guardar_bundle
+from corner_detection import detectar_esquinas, mostrar_esquinas
 
 class CalibradorEstereo:
-    def __init__(self, chessboard_size=(8, 6)):
+    def __init__(self, chessboard_size=(8, 6), procesos=None, escala_busqueda=0.5, mostrar=False):
         self.chessboard_size = chessboard_size
+        self.procesos = procesos
+        self.escala_busqueda = escala_busqueda
+        self.mostrar = mostrar
 
     def _obtener_puntos_estereo(self, folder_left, folder_right):
         nx, ny = self.chessboard_size
@@ -20,40 +24,38 @@ class CalibradorEstereo:
             left_images.extend(sorted(glob.glob(os.path.join(folder_left, f'*.{ext}'))))
             right_images.extend(sorted(glob.glob(os.path.join(folder_right, f'*.{ext}'))))
 
+        # Reutiliza las esquinas cacheadas por la calibración individual
+        esquinas = detectar_esquinas(left_images + right_images, (nx, ny), self.procesos, self.escala_busqueda)
+        img_shape = None
+
         for l_img, r_img in zip(left_images, right_images):
-            img_l = cv2.imread(l_img)
-            img_r = cv2.imread(r_img)
-            if img_l is None or img_r is None:
+            corners_l, size_l = esquinas[l_img]
+            corners_r, size_r = esquinas[r_img]
+            if size_l is None or size_r is None:
                 continue
+            img_shape = size_l
 
-            gray_l = cv2.cvtColor(img_l, cv2.COLOR_BGR2GRAY)
-            gray_r = cv2.cvtColor(img_r, cv2.COLOR_BGR2GRAY)
-
-            ret_l, corners_l = cv2.findChessboardCorners(gray_l, (nx, ny), None)
-            ret_r, corners_r = cv2.findChessboardCorners(gray_r, (nx, ny), None)
-
-            if ret_l and ret_r:
+            if corners_l is not None and corners_r is not None:
                 objpoints.append(objp)
                 imgpoints_l.append(corners_l)
                 imgpoints_r.append(corners_r)
 
-                cv2.drawChessboardCorners(img_l, (nx, ny), corners_l, ret_l)
-                cv2.drawChessboardCorners(img_r, (nx, ny), corners_r, ret_r)
-                cv2.imshow("Left", img_l)
-                cv2.imshow("Right", img_r)
-                cv2.waitKey(100)
+                if self.mostrar:
+                    mostrar_esquinas("Left", l_img, (nx, ny), corners_l)
+                    mostrar_esquinas("Right", r_img, (nx, ny), corners_r)
 
-        cv2.destroyAllWindows()
+        if self.mostrar:
+            cv2.destroyAllWindows()
 
         if not objpoints:
             print("❌ No se encontraron pares válidos de esquinas estéreo.")
             return None, None, None, None
 
-        return objpoints, imgpoints_l, imgpoints_r, gray_l.shape[::-1]
+        return objpoints, imgpoints_l, imgpoints_r, img_shape
 
-    def calibrar(self, left_calib_path, right_calib_path, folder_left, folder_right, save_path="./data/calibration/stereo_calib.npy"):
-        K1, D1 = CalibradorCamara.cargar_calibracion(left_calib_path)
-        K2, D2 = CalibradorCamara.cargar_calibracion(right_calib_path)
+    def calibrar(self, left_calib_path, right_calib_path, folder_left, folder_right, save_path=DEFAULT_BUNDLE_PATH):
+        K1, D1, _, rms_l = cargar_camara(left_calib_path)
+        K2, D2, _, rms_r = cargar_camara(right_calib_path)
 
         objpoints, imgpoints_l, imgpoints_r, img_shape = self._obtener_puntos_estereo(folder_left, folder_right)
         if objpoints is None:
@@ -73,5 +75,8 @@ class CalibradorEstereo:
         print("🎯 Matriz esencial:\n", E)
         print("📐 Matriz fundamental:\n", F)
 
-        np.save(save_path, {'R': R, 'T': T, 'E': E, 'F': F})
+        guardar_bundle(save_path, img_shape, K1, D1, K2, D2, R, T, E, F,
+                       rms_l=np.nan if rms_l is None else rms_l,
+                       rms_r=np.nan if rms_r is None else rms_r,
+                       rms_estereo=ret)
         print(f"📁 Parámetros estéreo guardados en {save_path}")
@@ -1,53 +1,56 @@
+import logging
 import os
 import cv2
+import instrumentation
 from yolo_detector import BallDetector
 from mediapipe_detector import FingerCounter
 from communication.mqtt_client import MQTTClient
-import time
-import paho.mqtt.client as mqtt
+from frame_sources import ImagePairDirectorySource
+from detection_cache import DetectionCache
+from paths import DATA_DIR
 
 # Rutas
-IMAGES_PATH_LEFT = "../data/captures/pelota/left"  # Carpeta con imágenes a procesar
-IMAGES_PATH_RIGHT = "../data/captures/pelota/right"
-IMAGES_PATH_DEDOS = "../data/captures/dedos"
+IMAGES_PATH_LEFT = os.path.join(DATA_DIR, "captures", "pelota", "left")  # Carpeta con imágenes a procesar
+IMAGES_PATH_RIGHT = os.path.join(DATA_DIR, "captures", "pelota", "right")
+IMAGES_PATH_DEDOS = os.path.join(DATA_DIR, "captures", "dedos")
+BATCH_SIZE = 4  # Pares estéreo por llamada al modelo
 
-# Inicialización de detectores
-yolo_detector = BallDetector()
-finger_counter = FingerCounter()
+# Mensajes por frame en nivel DEBUG; instrumentation.disable() los silencia todos
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger("v3d.offline")
+
+# Inicialización de detectores. Las detecciones se guardan en data/cache/detections:
+# al repetir el script sobre las mismas imágenes no se vuelve a ejecutar la inferencia
+detection_cache = DetectionCache()
+yolo_detector = BallDetector(cache=detection_cache)
+finger_counter = FingerCounter(cache=detection_cache)
 mqtt_object = MQTTClient()
-mqtt_object._connect()
-try: 
-    mqtt_object.client.is_connected()
-except: 
-    print("Ha habido un error")
-print(f"Conectandose, conectado: {mqtt_object.client.is_connected()}")
-while not mqtt_object.client.is_connected(): 
-    print(mqtt_object.client.is_connected())
-    time.sleep(1)
+# Conexión en segundo plano: los mensajes se guardan en buffer hasta conectar
+mqtt_object.connect()
 
 # Procesamiento
-image_files_left = sorted([f for f in os.listdir(IMAGES_PATH_LEFT) if f.lower().endswith(('.jpg', '.png'))])
-image_files_right = sorted([f for f in os.listdir(IMAGES_PATH_RIGHT) if f.lower().endswith(('.jpg', '.png'))])
 image_files_dedos = sorted([f for f in os.listdir(IMAGES_PATH_DEDOS) if f.lower().endswith(('.jpg', '.png'))])
+pares_pelota = ImagePairDirectorySource(IMAGES_PATH_LEFT, IMAGES_PATH_RIGHT)
 
-for i, filename in enumerate(image_files_dedos): 
+# Los pares estéreo se envían a YOLO en lotes de BATCH_SIZE pares por llamada
+for frame, centroide in yolo_detector.detect_stereo_frames(pares_pelota, BATCH_SIZE):
+    i = frame.frame_id
+    if i >= len(image_files_dedos):
+        break
+    filename = image_files_dedos[i]
     image_path = os.path.join(IMAGES_PATH_DEDOS, filename)
     # MediaPipe conteo de dedos
-    print(i, filename)
+    log.debug(f"{i} {filename}")
     fingers, annotated_img = finger_counter.count_fingers(image_path)
-    left_path = os.path.join(IMAGES_PATH_LEFT, f"img_{i:06d}.jpg")
-    right_path = os.path.join(IMAGES_PATH_RIGHT, f"img_{i:06d}.jpg")
     #cv2.imshow("Resultado combinado", annotated_img)
     #cv2.waitKey()
-    centroide = yolo_detector.detect_stereo_ball_position(left_path, right_path)
     #print(f"Numero de dedos: {fingers}, Centroide: {centroide}")
     if fingers and centroide:
-        print(fingers, centroide)
-        print(f"Conectado: {mqtt_object.client.is_connected()}")
+        log.debug(f"{fingers} {centroide} (conectado: {mqtt_object.is_connected()})")
         mqtt_object.publish_position(centroide[0], centroide[1], centroide[2])
         mqtt_object.publish_fingers(fingers)
     else:
-        print("🙌 No se detectaron manos o posicion")
+        log.debug("🙌 No se detectaron manos o posicion")
     # Mostrar imagen con anotaciones
     """
     cv2.imshow("Resultado combinado", annotated_img)
@@ -56,8 +59,15 @@ for i, filename in enumerate(image_files_dedos):
         break
     """
 
+log.info(f"⏱️ Métricas: {instrumentation.METRICS.snapshot()}")
+log.info(f"🗃️ Caché de detecciones: {detection_cache.stats()}")
+
 # Liberar recursos
+pares_pelota.close()
 finger_counter.close()
+# Los mensajes quedan en el buffer hasta que conecta el broker: se esperan antes de desconectar
+mqtt_object.flush(timeout=10)
+mqtt_object.disconnect()
 
 """
     image = cv2.imread(image_path)
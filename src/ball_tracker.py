@@ -0,0 +1,134 @@
+import numpy as np
+
+from kalman import ConstantVelocityKalman
+
+
+class ROIBallTracker:
+    """
+    Seguimiento de la pelota que solo ejecuta YOLO sobre una región de interés
+    alrededor de la posición predicha. La predicción se hace con un filtro de
+    Kalman de velocidad constante sobre el punto 3D triangulado, que se
+    reproyecta en cada vista (con su distorsión) para centrar el recorte.
+
+    Se vuelve a la detección sobre la imagen completa cuando el seguimiento se
+    pierde (más de max_misses frames sin detección) o cada refresh_every
+    frames. Expone la misma interfaz detect_stereo_frame /
+    detect_stereo_balls_frame que BallDetector. Mantiene estado entre
+    frames: una instancia debe recibir todos los frames en orden.
+    """
+
+    def __init__(self, detector, roi_size=320, refresh_every=30, max_misses=3,
+                 process_noise=1.0, measurement_noise=0.01):
+        if roi_size % 32 != 0:
+            raise ValueError("roi_size debe ser múltiplo de 32")
+        self.detector = detector
+        self.to_output_units = detector.to_output_units
+        self.roi_size = roi_size
+        self.refresh_every = refresh_every
+        self.max_misses = max_misses
+        self.kalman = ConstantVelocityKalman(3, process_noise, measurement_noise)
+
+        self.misses = 0
+        self.frames_since_refresh = 0
+        self.last_timestamp = None
+        self.pixels_inferred = 0
+        self.full_frame_detections = 0
+        self.roi_detections = 0
+
+    @property
+    def tracking(self):
+        return self.kalman.initialized and self.misses <= self.max_misses
+
+    def detect_stereo_frame(self, frame):
+        """
+        Devuelve la posición 3D filtrada en el formato de BallDetector, o una
+        lista vacía si no hubo detección en este frame.
+        """
+        pistas = self.detect_stereo_balls_frame(frame)
+        return self.to_output_units(pistas[0]['posicion']) if pistas else []
+
+    def detect_stereo_balls_frame(self, frame, imgsz=None):
+        """
+        Devuelve una lista con la pista seguida ('posicion' filtrada en float,
+        'medida' triangulada sin filtrar, 'confianza', 'centroide_l',
+        'centroide_r'), o vacía si no hubo
+        detección en este frame. imgsz solo afecta a la búsqueda en la imagen
+        completa; los recortes se infieren siempre a roi_size.
+        """
+        dt = 0.0 if self.last_timestamp is None else max(frame.timestamp - self.last_timestamp, 0.0)
+        self.last_timestamp = frame.timestamp
+
+        # El filtro avanza siempre hasta este frame, también si se busca en la imagen completa
+        if self.kalman.initialized:
+            self.kalman.predict(dt)
+
+        pistas = None
+        if self.tracking and self.frames_since_refresh < self.refresh_every:
+            pistas = self._detect_in_roi(frame)
+        if pistas is None:
+            pistas = self._detect_full_frame(frame, imgsz)
+        self.frames_since_refresh += 1
+
+        if not pistas:
+            self.misses += 1
+            return []
+
+        if self.tracking:
+            # Con varias pelotas se sigue la más cercana a la posición predicha
+            pista = min(pistas, key=lambda p: np.linalg.norm(p['posicion'] - self.kalman.position))
+            self.kalman.update(pista['posicion'])
+        else:
+            pista = pistas[0]
+            self.kalman.reset(pista['posicion'])
+        self.misses = 0
+        return [{
+            'posicion': self.kalman.position,
+            'medida': pista['posicion'],
+            'confianza': pista['confianza'],
+            'centroide_l': pista['centroide_l'],
+            'centroide_r': pista['centroide_r'],
+        }]
+
+    def _detect_full_frame(self, frame, imgsz=None):
+        self.frames_since_refresh = 0
+        self.full_frame_detections += 1
+        self.pixels_inferred += frame.left.shape[0] * frame.left.shape[1] * 2
+        detecciones_l, detecciones_r = self.detector.detect_balls_batch([frame.left, frame.right], imgsz)
+        return self.detector.match_and_triangulate(detecciones_l, detecciones_r)
+
+    def _detect_in_roi(self, frame):
+        """
+        Busca la pelota en un recorte de cada vista centrado en la proyección
+        (con la distorsión de cada cámara, como las imágenes) de la posición
+        predicha. Las detecciones se emparejan y filtran igual que en la
+        imagen completa (match_and_triangulate). Devuelve None si la
+        predicción cae fuera de la imagen, para forzar la búsqueda completa.
+        """
+        centers = self.detector.project_to_images(self.kalman.position)
+        if centers is None:
+            return None
+        crops, offsets = [], []
+        for center, image in zip(centers, (frame.left, frame.right)):
+            h, w = image.shape[:2]
+            if not (0 <= center[0] < w and 0 <= center[1] < h):
+                return None
+            x0, y0 = self._roi_origin(center, w, h)
+            crops.append(image[y0:y0 + self.roi_size, x0:x0 + self.roi_size])
+            offsets.append((x0, y0))
+
+        self.roi_detections += 1
+        self.pixels_inferred += sum(crop.shape[0] * crop.shape[1] for crop in crops)
+        resultados = self.detector.detect_balls_batch(crops, imgsz=self.roi_size)
+        # Coordenadas del recorte -> imagen completa
+        detecciones_l, detecciones_r = [[{
+            'centroide': (d['centroide'][0] + x0, d['centroide'][1] + y0),
+            'bbox': (d['bbox'][0] + x0, d['bbox'][1] + y0, d['bbox'][2] + x0, d['bbox'][3] + y0),
+            'confianza': d['confianza'],
+        } for d in detecciones_roi] for detecciones_roi, (x0, y0) in zip(resultados, offsets)]
+        return self.detector.match_and_triangulate(detecciones_l, detecciones_r)
+
+    def _roi_origin(self, center, width, height):
+        half = self.roi_size // 2
+        x0 = int(np.clip(center[0] - half, 0, max(width - self.roi_size, 0)))
+        y0 = int(np.clip(center[1] - half, 0, max(height - self.roi_size, 0)))
+        return x0, y0
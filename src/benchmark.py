@@ -0,0 +1,402 @@
+"""
+Benchmark del pipeline sobre los pares grabados en data/captures.
+
+Ejecuta cada etapa (decodificación, YOLO, MediaPipe, triangulación,
+publicación MQTT, detección de esquinas de calibración) y el pipeline
+completo sin cámara ni GPU, y escribe un JSON con latencias p50/p95/p99,
+frames por segundo, pico de memoria residente y asignaciones de memoria.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --stages triangulation,publish --compare base.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import instrumentation
+from paths import DATA_DIR, REPO_ROOT
+from latency import LatencyStats
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PELOTA_LEFT = os.path.join(DATA_DIR, "captures", "pelota", "left")
+PELOTA_RIGHT = os.path.join(DATA_DIR, "captures", "pelota", "right")
+DEDOS_DIR = os.path.join(DATA_DIR, "captures", "dedos")
+CALIBRATION_LEFT = os.path.join(DATA_DIR, "calibration", "left")
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS lo devuelve en bytes, Linux en KiB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure(items, fn, trace_alloc=False):
+    """
+    Llama a fn(item) para cada elemento y devuelve el resumen de latencias,
+    rendimiento y memoria de la etapa.
+    """
+    stats = LatencyStats(window=1_000_000)
+    if trace_alloc:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        stats.add(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    result = stats.summary()
+    result["elapsed_s"] = elapsed
+    result["fps"] = stats.count / elapsed if elapsed > 0 else None
+    result["peak_rss_kb"] = _peak_rss_kb()
+    if trace_alloc:
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        diff = after.compare_to(before, "filename")
+        result["alloc_blocks"] = sum(max(d.count_diff, 0) for d in diff)
+        result["alloc_peak_kb"] = peak // 1024
+    return result
+
+
+def _pairs(limit):
+    from frame_sources import ImagePairDirectorySource
+    with ImagePairDirectorySource(PELOTA_LEFT, PELOTA_RIGHT, fps=15) as source:
+        frames = list(source)
+    return frames[:limit] if limit else frames
+
+
+def bench_decode(args):
+    from frame_sources import ImagePairDirectorySource
+    source = ImagePairDirectorySource(PELOTA_LEFT, PELOTA_RIGHT, fps=15)
+    frames = iter(source)
+    count = min(len(source), args.limit or len(source))
+    try:
+        return measure(range(count), lambda _: next(frames), args.trace_alloc)
+    finally:
+        source.close()
+
+
+def bench_yolo(args):
+    from yolo_detector import BallDetector
+    detector = BallDetector(backend=args.backend, threads=args.threads, quantize=args.quantize)
+    frames = _pairs(args.limit)
+    detector.detect_stereo_frame(frames[0])  # calentamiento
+    return measure(frames, detector.detect_stereo_frame, args.trace_alloc)
+
+
+def bench_localization(args):
+    """
+    Triangulación (YOLO en ambas vistas) frente a profundidad SGBM (YOLO solo
+    en la vista izquierda) sobre los mismos pares.
+    """
+    from depth_localization import DepthBallLocator
+    from yolo_detector import BallDetector
+    detector = BallDetector(backend=args.backend, threads=args.threads, quantize=args.quantize)
+    locator = DepthBallLocator(detector, mode="sgbm")
+    frames = _pairs(args.limit)
+    detector.detect_stereo_frame(frames[0])  # calentamiento
+    locator.detect_stereo_frame(frames[0])
+    return {
+        "triangulation": measure(frames, detector.detect_stereo_frame, args.trace_alloc),
+        "depth_sgbm": measure(frames, locator.detect_stereo_frame, args.trace_alloc),
+    }
+
+
+def bench_sgbm(args):
+    """
+    Micro-benchmark de la búsqueda de profundidad SGBM sobre una caja fija en
+    el centro de la imagen (sin detector).
+    """
+    from calibration_bundle import cargar_bundle
+    from depth_localization import SGBMDepthEstimator
+    from undistortion import StereoUndistorter
+    calibration = cargar_bundle()
+    estimator = SGBMDepthEstimator(StereoUndistorter(calibration.K1, calibration.D1, calibration.K2,
+                                                     calibration.D2, calibration.R, calibration.T))
+    frames = _pairs(args.limit)
+    h, w = frames[0].left.shape[:2]
+    bbox = (w / 2 - 20, h / 2 - 20, w / 2 + 20, h / 2 + 20)
+    estimator.locate(frames[0].left, frames[0].right, bbox)  # mapas de rectificación
+    return measure(frames, lambda frame: estimator.locate(frame.left, frame.right, bbox), args.trace_alloc)
+
+
+def bench_mediapipe(args):
+    import cv2
+    from mediapipe_detector import FingerCounter
+    counter = FingerCounter()
+    nombres = sorted(os.listdir(DEDOS_DIR))[:args.limit or None]
+    images = [cv2.imread(os.path.join(DEDOS_DIR, n)) for n in nombres]
+    try:
+        return measure(images, counter.count_fingers_image, args.trace_alloc)
+    finally:
+        counter.close()
+
+
+def _synthetic_correspondences(calibration, n, rng):
+    puntos = np.column_stack((rng.uniform(-2, 2, n), rng.uniform(-1, 1, n), rng.uniform(5, 20, n)))
+    X = np.hstack((puntos, np.ones((n, 1))))
+    pl = X @ calibration.P1.T
+    pr = X @ calibration.P2.T
+    return pl[:, :2] / pl[:, 2:], pr[:, :2] / pr[:, 2:]
+
+
+def bench_triangulation(args):
+    """
+    Micro-benchmark: triangulación punto a punto frente a una llamada
+    vectorizada sobre el mismo lote de correspondencias, y la evaluación
+    completa de StereoGeometry (triangulación, reproyección, residuo
+    epipolar y profundidades).
+    """
+    from calibration_bundle import cargar_bundle
+    from stereo_geometry import StereoGeometry
+    from stereo_matching import triangulate_matches
+    calibration = cargar_bundle()
+    geometry = StereoGeometry.from_bundle(calibration)
+    rng = np.random.default_rng(0)
+    n = args.points
+    pts_l, pts_r = _synthetic_correspondences(calibration, n, rng)
+    lotes = range(args.repeat)
+
+    por_punto = measure(lotes, lambda _: [triangulate_matches(calibration.P1, calibration.P2, l, r)
+                                          for l, r in zip(pts_l, pts_r)], args.trace_alloc)
+    vectorizado = measure(lotes, lambda _: triangulate_matches(calibration.P1, calibration.P2, pts_l, pts_r),
+                          args.trace_alloc)
+    evaluado = measure(lotes, lambda _: geometry.evaluate(pts_l, pts_r), args.trace_alloc)
+    return {"points": n, "per_point": por_punto, "vectorized": vectorizado, "evaluated": evaluado}
+
+
+def bench_finger_counting(args):
+    """
+    Micro-benchmark del conteo de dedos vectorizado frente a mano a mano.
+    """
+    from mediapipe_detector import FingerCounter
+    rng = np.random.default_rng(0)
+    landmarks = rng.random((args.points, 21, 3))
+    labels = rng.choice(["Right", "Left"], args.points)
+    lotes = range(args.repeat)
+
+    por_mano = measure(lotes, lambda _: [FingerCounter.count_from_landmarks(lm, lab)
+                                         for lm, lab in zip(landmarks, labels)], args.trace_alloc)
+    vectorizado = measure(lotes, lambda _: FingerCounter.count_from_landmarks(landmarks, labels), args.trace_alloc)
+    return {"hands": args.points, "per_hand": por_mano, "vectorized": vectorizado}
+
+
+def _local_mqtt():
+    from communication.local_broker import LocalBroker, LocalBrokerClient
+    from communication.mqtt_client import MQTTClient
+    broker = LocalBroker()
+    broker.record = False
+    mqtt_object = MQTTClient(client=LocalBrokerClient(broker))
+    mqtt_object.connect()
+    return mqtt_object
+
+
+def bench_publish(args):
+    from communication.publisher import AsyncPublisher
+    mqtt_object = _local_mqtt()
+    publisher = AsyncPublisher(mqtt_object, coalesce=False, max_pending=args.repeat)
+    result = measure(range(args.repeat), lambda i: publisher.publish(i, time.time(), (1.0, 2.0, 3.0), 2),
+                     args.trace_alloc)
+    publisher.close()
+    result["publisher"] = publisher.metrics()
+    return result
+
+
+def bench_recording(args):
+    import shutil
+    import tempfile
+    from recording import ENCODINGS, StereoRecorder, StereoRecording
+
+    frames = _pairs(args.limit)
+    rng = np.random.default_rng(0)
+    result = {}
+    for encoding in ENCODINGS:
+        session = tempfile.mkdtemp(prefix=f"bench_{encoding}_")
+        try:
+            # Sin descartes: se mide el coste de grabarlo todo, incluido el vaciado final
+            recorder = StereoRecorder(session, encoding=encoding, max_pending=len(frames))
+            t0 = time.perf_counter()
+            write = measure(frames, lambda f: recorder.submit(f.frame_id, f.timestamp, f.left, f.right),
+                            args.trace_alloc)
+            recorder.close()
+            write["flush_s"] = time.perf_counter() - t0 - write["elapsed_s"]
+            with StereoRecording(session) as recording:
+                ids = rng.choice(recording.frame_ids, size=args.repeat)
+                # Acceso aleatorio, forzando la lectura de los píxeles
+                read = measure(ids, lambda i: recording.read(int(i)).left.sum(), args.trace_alloc)
+            size = sum(entry.stat().st_size for entry in os.scandir(session))
+        finally:
+            shutil.rmtree(session, ignore_errors=True)
+        result[f"{encoding}_write"] = write
+        result[f"{encoding}_read"] = read
+        result[f"{encoding}_bytes_per_pair"] = size / max(len(frames), 1)
+    return result
+
+
+def bench_calibration(args):
+    from corner_detection import detectar_esquinas
+    import glob
+    images = sorted(glob.glob(os.path.join(CALIBRATION_LEFT, "*.jpg")))[:args.limit or None]
+    # Sin caché, para medir la detección real
+    return measure([images], lambda imgs: detectar_esquinas(imgs, (8, 6), cache_dir=None), args.trace_alloc)
+
+
+def bench_pipeline(args):
+    from communication.publisher import AsyncPublisher
+    from mediapipe_detector import FingerCounter
+    from pipeline import StereoPipeline
+    from yolo_detector import BallDetector
+
+    frames = _pairs(args.limit)
+    publisher = AsyncPublisher(_local_mqtt(), coalesce=False, max_pending=len(frames))
+    pipeline = StereoPipeline(FingerCounter, lambda: BallDetector(backend=args.backend, threads=args.threads,
+                                                                  quantize=args.quantize), max_in_flight=2)
+    done = []
+    # Carga de modelos fuera de la medida: el primer frame no paga el arranque
+    t0 = time.perf_counter()
+    pipeline.warm_up(frames[0])
+    warm_up = time.perf_counter() - t0
+
+    def on_result(result):
+        done.append(result)
+        publisher.publish(result.frame.frame_id, result.frame.timestamp, result.centroide or None,
+                          result.fingers or None)
+
+    start = time.perf_counter()
+    for frame in frames:
+        # Marca temporal de "captura" = momento de entrada al pipeline
+        frame.timestamp = time.time()
+        pipeline.submit(frame, on_result)
+    pipeline.close()
+    publisher.close()
+    elapsed = time.perf_counter() - start
+
+    report = pipeline.report()
+    report["warm_up_s"] = warm_up
+    report["frames"] = len(done)
+    report["fps"] = len(done) / elapsed if elapsed > 0 else None
+    report["peak_rss_kb"] = _peak_rss_kb()
+    report["publish"] = publisher.metrics()
+    return report
+
+
+STAGES = {
+    "decode": bench_decode,
+    "triangulation": bench_triangulation,
+    "finger_counting": bench_finger_counting,
+    "publish": bench_publish,
+    "calibration": bench_calibration,
+    "recording": bench_recording,
+    "sgbm": bench_sgbm,
+    "yolo": bench_yolo,
+    "localization": bench_localization,
+    "mediapipe": bench_mediapipe,
+    "pipeline": bench_pipeline,
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(stages, args):
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "stages": {},
+    }
+    for name in stages:
+        print(f"⏱️ {name}...", file=sys.stderr)
+        instrumentation.METRICS.reset()
+        try:
+            report["stages"][name] = STAGES[name](args)
+        except (ImportError, OSError) as exc:
+            # Dependencias opcionales (ultralytics, mediapipe) o datos ausentes
+            report["stages"][name] = {"skipped": str(exc)}
+            continue
+        # Desglose interno de la etapa (spans y contadores de instrumentation)
+        snapshot = instrumentation.METRICS.snapshot()
+        if snapshot["spans"] or snapshot["counters"]:
+            report["stages"][name]["instrumentation"] = {k: snapshot[k] for k in ("spans", "counters")}
+    return report
+
+
+def _p50(entry):
+    return entry.get("p50_ms") if isinstance(entry, dict) else None
+
+
+def compare(base, current):
+    """
+    Lista (etapa, p50 base, p50 actual, ratio) para las métricas presentes en ambos informes.
+    """
+    filas = []
+    for stage, actual in current["stages"].items():
+        anterior = base.get("stages", {}).get(stage)
+        if not isinstance(anterior, dict):
+            continue
+        pares = [(stage, anterior, actual)]
+        pares += [(f"{stage}.{k}", anterior.get(k), v) for k, v in actual.items() if isinstance(v, dict)]
+        for nombre, a, b in pares:
+            pa, pb = _p50(a), _p50(b)
+            if pa and pb:
+                filas.append((nombre, pa, pb, pb / pa))
+    return filas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", default=",".join(STAGES), help="etapas separadas por comas")
+    parser.add_argument("--output", help="fichero JSON de salida (por defecto stdout)")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--limit", type=int, default=0, help="máximo de pares/imágenes por etapa")
+    parser.add_argument("--points", type=int, default=5000, help="correspondencias de los micro-benchmarks")
+    parser.add_argument("--repeat", type=int, default=50, help="repeticiones de los micro-benchmarks")
+    parser.add_argument("--backend", default="ultralytics", help="backend de BallDetector (ultralytics, onnx, openvino)")
+    parser.add_argument("--threads", type=int, default=None, help="hilos de inferencia en CPU")
+    parser.add_argument("--quantize", action="store_true", help="modelo ONNX cuantizado a INT8")
+    parser.add_argument("--trace-alloc", action="store_true", help="contar asignaciones con tracemalloc")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"etapas desconocidas: {', '.join(unknown)}")
+
+    report = run(stages, args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        for nombre, pa, pb, ratio in compare(base, report):
+            print(f"{nombre:40s} p50 {pa:9.3f} ms -> {pb:9.3f} ms  (x{ratio:.2f})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
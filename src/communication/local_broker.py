@@ -0,0 +1,149 @@
+import threading
+import time
+
+
+class LocalBroker:
+    """
+    Broker MQTT mínimo en proceso para pruebas y benchmarks sin red. Entrega
+    los mensajes de forma síncrona a los clientes suscritos, guarda los
+    retenidos y permite simular caídas con set_online(False).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._registered = []
+        self._clients = []
+        self.retained = {}
+        self.messages = []
+        self.online = True
+        self.record = True
+
+    def set_online(self, online):
+        """
+        Simula la caída o recuperación del broker. Al caer, los clientes
+        conectados reciben on_disconnect y se publican sus last will.
+        """
+        with self._lock:
+            self.online = online
+            clients = list(self._registered)
+        for client in clients:
+            if online:
+                client._try_connect()
+            else:
+                client._drop(rc=1)
+
+    def _register(self, client):
+        with self._lock:
+            self._registered.append(client)
+
+    def _attach(self, client):
+        with self._lock:
+            if not self.online:
+                return False
+            if client not in self._clients:
+                self._clients.append(client)
+            return True
+
+    def _detach(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def _route(self, topic, payload, qos, retain):
+        with self._lock:
+            if self.record:
+                self.messages.append((time.time(), topic, payload))
+            if retain:
+                self.retained[topic] = payload
+            subscribers = [c for c in self._clients if c._subscribed(topic)]
+        for client in subscribers:
+            client._deliver(topic, payload)
+
+
+class _Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload if isinstance(payload, bytes) else str(payload).encode()
+
+
+class LocalBrokerClient:
+    """
+    Cliente compatible con el subconjunto de paho.mqtt.client.Client que usa
+    MQTTClient (connect_async, loop_start, publish, will_set...), conectado
+    a un LocalBroker.
+    """
+
+    def __init__(self, broker, client_id=""):
+        self.broker = broker
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self._connected = False
+        self._wanted = False
+        self._will = None
+        self._topics = set()
+        self._mid = 0
+        self.reconnect_delay = None
+        broker._register(self)
+
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        self._will = (topic, payload, qos, retain)
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        # Solo se guarda: la reconexión es inmediata al volver el broker (set_online)
+        self.reconnect_delay = (min_delay, max_delay)
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        self._wanted = True
+
+    def loop_start(self):
+        self._try_connect()
+
+    def loop_stop(self):
+        pass
+
+    def _try_connect(self):
+        if self._wanted and not self._connected and self.broker._attach(self):
+            self._connected = True
+            if self.on_connect:
+                self.on_connect(self, None, {}, 0)
+
+    def _drop(self, rc):
+        if not self._connected:
+            return
+        self._connected = False
+        if rc != 0 and self._will is not None:
+            topic, payload, qos, retain = self._will
+            self.broker._route(topic, payload, qos, retain)
+        if self.on_disconnect:
+            self.on_disconnect(self, None, rc)
+
+    def disconnect(self):
+        self._wanted = False
+        self._drop(rc=0)
+        self.broker._detach(self)
+
+    def is_connected(self):
+        return self._connected
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self._mid += 1
+        if not self._connected:
+            return (4, self._mid)  # MQTT_ERR_NO_CONN
+        self.broker._route(topic, payload, qos, retain)
+        return (0, self._mid)
+
+    def subscribe(self, topic, qos=0):
+        self._topics.add(topic)
+        return (0, self._mid)
+
+    def _subscribed(self, topic):
+        for pattern in self._topics:
+            if pattern == topic or pattern == "#" or (pattern.endswith("/#") and topic.startswith(pattern[:-1])):
+                return True
+        return False
+
+    def _deliver(self, topic, payload):
+        if self.on_message:
+            self.on_message(self, None, _Message(topic, payload))
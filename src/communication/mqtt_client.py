@@ -1,42 +1,202 @@
-import paho.mqtt.client as mqtt
+import logging
+import threading
+import time
+from collections import deque
+
+import instrumentation
+
+log = logging.getLogger("v3d.mqtt")
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+def _crear_cliente_paho(client_id):
+    # paho solo hace falta con un broker real (no con communication.local_broker)
+    import paho.mqtt.client as mqtt
+    # paho-mqtt >= 2.0 exige indicar la versión de la API de callbacks
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id)
+    return mqtt.Client(client_id=client_id)
+
 
 class MQTTClient:
-    def __init__(self, client_id="Pos3DClient", broker="broker.emqx.io", port=1883):
+    """
+    Cliente MQTT con conexión gestionada: la conexión es asíncrona, paho
+    reconecta con backoff exponencial (min_backoff..max_backoff segundos) y,
+    mientras no hay conexión, los mensajes se guardan en un buffer acotado
+    que se vacía al reconectar. El broker publica 'offline' en status_topic
+    (last will) si el cliente desaparece sin desconectarse.
+
+    Estados: 'disconnected', 'connecting', 'connected', 'reconnecting'.
+    client permite inyectar un cliente compatible con paho (p. ej. el de
+    communication.local_broker para pruebas sin red).
+    """
+
+    def __init__(self, client_id="Pos3DClient", broker="broker.emqx.io", port=1883, keepalive=60,
+                 min_backoff=1, max_backoff=30, buffer_size=256, drop_policy=DROP_OLDEST,
+                 status_topic="v3d/status", client=None):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Política de descarte desconocida: {drop_policy}")
         self.client_id = client_id
         self.broker = broker
         self.port = port
+        self.keepalive = keepalive
         self.fingers_topic = "v3d/finger"
         self.position_topic = "v3d/position"
-        self.client = mqtt.Client(client_id=self.client_id)
-        #self.client.on_connect = self.on_connect
+        self.status_topic = status_topic
+        self.drop_policy = drop_policy
+
+        self.client = client if client is not None else _crear_cliente_paho(self.client_id)
+        self.client.will_set(self.status_topic, "offline", qos=1, retain=True)
+        self.client.reconnect_delay_set(min_delay=min_backoff, max_delay=max_backoff)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+
+        self.state = "disconnected"
+        self._lock = threading.Lock()
+        self._buffer = deque()
+        self._buffer_size = buffer_size
+        self._flushing = False
+        self.buffered = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.connected_since = None
+        self.last_error = None
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            print("✅ Conectado al broker MQTT")
+            log.info("✅ Conectado al broker MQTT")
+            with self._lock:
+                if self.connected_since is not None:
+                    self.reconnects += 1
+                self.state = "connected"
+                self.connected_since = time.time()
+            self.client.publish(self.status_topic, "online", qos=1, retain=True)
+            self._flush()
         else:
-            print(f"❌ Error de conexión, código: {rc}")
+            self.last_error = f"connack {rc}"
+            log.error(f"❌ Error de conexión, código: {rc}")
 
-    def _connect(self):
-        self.client.connect(self.broker, self.port)
+    def on_disconnect(self, client, userdata, rc):
+        with self._lock:
+            # rc != 0: caída inesperada, paho reintentará con backoff
+            self.state = "reconnecting" if rc != 0 else "disconnected"
+        if rc != 0:
+            self.last_error = f"disconnect {rc}"
+            log.warning(f"⚠️ Conexión MQTT perdida (código {rc}), reintentando")
+
+    def connect(self):
+        """
+        Inicia la conexión sin bloquear; el hilo de paho la completa y
+        reintenta en segundo plano.
+        """
+        with self._lock:
+            self.state = "connecting"
+        self.client.connect_async(self.broker, self.port, self.keepalive)
         self.client.loop_start()
-        self.client.on_connect = self.on_connect
+
+    def _connect(self):
+        self.connect()
+
+    def is_connected(self):
+        return self.state == "connected"
+
+    def publish(self, topic, payload, qos=0):
+        """
+        Publica sin escribir por consola. Sin conexión el mensaje se guarda en
+        el buffer. Devuelve True si se envió o quedó en el buffer.
+        """
+        with self._lock:
+            # Mientras quede buffer por vaciar, los mensajes nuevos van detrás para no adelantarlo
+            direct = self.state == "connected" and not self._flushing and not self._buffer
+        if direct and self.client.publish(topic, payload, qos=qos)[0] == 0:
+            return True
+        queued = self._enqueue(topic, payload, qos)
+        if self.state == "connected":
+            self._flush()
+        return queued
+
+    def _enqueue(self, topic, payload, qos):
+        with self._lock:
+            if len(self._buffer) >= self._buffer_size:
+                self.dropped += 1
+                instrumentation.incr("mqtt_dropped")
+                if self.drop_policy == DROP_NEWEST:
+                    return False
+                self._buffer.popleft()
+            self._buffer.append((topic, payload, qos))
+            self.buffered += 1
+        return True
+
+    def _flush(self):
+        # Un solo vaciado a la vez; el que está en marcha recoge lo que se encole mientras
+        with self._lock:
+            if self._flushing:
+                return
+            self._flushing = True
+        while True:
+            with self._lock:
+                if self.state != "connected" or not self._buffer:
+                    self._flushing = False
+                    return
+                topic, payload, qos = self._buffer.popleft()
+            if self.client.publish(topic, payload, qos=qos)[0] != 0:
+                with self._lock:
+                    self._buffer.appendleft((topic, payload, qos))
+                    self._flushing = False
+                return
+
+    def flush(self, timeout=10.0):
+        """
+        Espera hasta timeout segundos a que haya conexión y se envíen los
+        mensajes del buffer. Devuelve True si no queda nada pendiente. Hay que
+        llamarlo antes de disconnect si no se quiere perder el buffer (p. ej.
+        al terminar un script offline antes de que conecte el broker).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.state == "connected":
+                self._flush()
+            with self._lock:
+                pending = len(self._buffer)
+            if pending == 0:
+                return True
+            if time.monotonic() >= deadline:
+                log.warning(f"⚠️ Quedan {pending} mensajes MQTT sin enviar (estado: {self.state})")
+                return False
+            time.sleep(0.05)
+
+    def health(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "connected_since": self.connected_since,
+                "reconnects": self.reconnects,
+                "pending": len(self._buffer),
+                "buffered": self.buffered,
+                "dropped": self.dropped,
+                "last_error": self.last_error,
+            }
 
     def publish_position(self, x, y, z):
         payload = f"{x} {y} {z}"  # Texto plano
-        result = self.client.publish(self.position_topic, payload)
-        if result[0] == 0:
-            print(f"📤 Posición enviada: '{payload}'")
+        if self.publish(self.position_topic, payload):
+            log.debug(f"📤 Posición enviada: '{payload}'")
         else:
-            print("⚠️ Error al publicar el mensaje")
+            log.warning("⚠️ Error al publicar el mensaje")
 
     def publish_fingers(self, fingers): 
         payload = f"{fingers}"
-        result = self.client.publish(self.fingers_topic, payload)
-        if result[0] == 0:
-            print(f"📤 Posición enviada: '{payload}'")
+        if self.publish(self.fingers_topic, payload):
+            log.debug(f"📤 Posición enviada: '{payload}'")
         else:
-            print("⚠️ Error al publicar el mensaje")
+            log.warning("⚠️ Error al publicar el mensaje")
 
     def disconnect(self):
-        self.client.loop_stop()
+        if self.state == "connected":
+            self.client.publish(self.status_topic, "offline", qos=1, retain=True)
         self.client.disconnect()
+        self.client.loop_stop()
+        with self._lock:
+            self.state = "disconnected"
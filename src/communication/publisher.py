@@ -0,0 +1,241 @@
+import math
+import struct
+import threading
+import time
+
+import instrumentation
+from latency import LatencyStats
+from stereo_geometry import to_output_units
+
+STATE_TOPIC = "v3d/state"
+STATE_VERSION = 1
+# versión, frame_id, t_captura, t_publicación, x, y, z, dedos (-1 si no hay)
+STATE_STRUCT = struct.Struct("<BIddfffb")
+
+
+def encode_state(frame_id, capture_timestamp, position, fingers, publish_timestamp=None):
+    """
+    Codifica el estado de un frame en el formato binario compacto (34 bytes).
+    Una posición ausente se codifica como NaN.
+    """
+    x, y, z = position if position else (math.nan, math.nan, math.nan)
+    return STATE_STRUCT.pack(
+        STATE_VERSION, frame_id & 0xFFFFFFFF, capture_timestamp,
+        time.time() if publish_timestamp is None else publish_timestamp,
+        x, y, z, -1 if fingers is None else int(fingers))
+
+
+def decode_state(payload):
+    """
+    Decodifica un mensaje de STATE_TOPIC en un diccionario.
+    """
+    version, frame_id, capture_ts, publish_ts, x, y, z, fingers = STATE_STRUCT.unpack(payload)
+    if version != STATE_VERSION:
+        raise ValueError(f"Versión de estado no soportada: {version}")
+    position = None if math.isnan(x) else (x, y, z)
+    return {
+        "frame_id": frame_id,
+        "capture_timestamp": capture_ts,
+        "publish_timestamp": publish_ts,
+        "position": position,
+        "fingers": None if fingers < 0 else fingers,
+    }
+
+
+WORLD_HEADER_STRUCT = struct.Struct("<BdH")
+WORLD_TRACK_STRUCT = struct.Struct("<ffff")
+
+
+def encode_world_tracks(timestamp, pistas):
+    """
+    Codifica un conjunto de pistas del mundo: cabecera (versión, marca
+    temporal, número de pistas) seguida de x, y, z, confianza por pista.
+    """
+    payload = [WORLD_HEADER_STRUCT.pack(STATE_VERSION, timestamp, len(pistas))]
+    for pista in pistas:
+        x, y, z = pista["posicion"]
+        payload.append(WORLD_TRACK_STRUCT.pack(x, y, z, pista["confianza"]))
+    return b"".join(payload)
+
+
+def decode_world_tracks(payload):
+    version, timestamp, count = WORLD_HEADER_STRUCT.unpack_from(payload)
+    if version != STATE_VERSION:
+        raise ValueError(f"Versión de estado no soportada: {version}")
+    pistas = []
+    for i in range(count):
+        x, y, z, conf = WORLD_TRACK_STRUCT.unpack_from(payload, WORLD_HEADER_STRUCT.size + i * WORLD_TRACK_STRUCT.size)
+        pistas.append({"posicion": (x, y, z), "confianza": conf})
+    return timestamp, pistas
+
+
+TRACK_TOPIC = "v3d/track"
+# versión, frame_id, t_captura, t_publicación, número de pistas
+TRACK_HEADER_STRUCT = struct.Struct("<BIddB")
+# id, flags (bit 0: sin medida en el último frame), posición, velocidad, predicción
+TRACK_STATE_STRUCT = struct.Struct("<HB9f")
+TRACK_COASTING = 0x01
+
+
+def encode_tracks(frame_id, capture_timestamp, publish_timestamp, states):
+    """
+    Codifica los estados suavizados (TrackState) extrapolados al instante
+    de publicación: posición, velocidad y predicción de cada pista en float.
+    """
+    states = states[:255]
+    payload = [TRACK_HEADER_STRUCT.pack(STATE_VERSION, frame_id & 0xFFFFFFFF, capture_timestamp,
+                                        publish_timestamp, len(states))]
+    for state in states:
+        payload.append(TRACK_STATE_STRUCT.pack(
+            state.track_id & 0xFFFF, TRACK_COASTING if state.coasting else 0,
+            *state.position, *state.velocity, *state.prediction))
+    return b"".join(payload)
+
+
+def decode_tracks(payload):
+    """
+    Decodifica un mensaje de TRACK_TOPIC en un diccionario con la cabecera y
+    la lista de pistas.
+    """
+    version, frame_id, capture_ts, publish_ts, count = TRACK_HEADER_STRUCT.unpack_from(payload)
+    if version != STATE_VERSION:
+        raise ValueError(f"Versión de estado no soportada: {version}")
+    tracks = []
+    for i in range(count):
+        track_id, flags, *values = TRACK_STATE_STRUCT.unpack_from(
+            payload, TRACK_HEADER_STRUCT.size + i * TRACK_STATE_STRUCT.size)
+        tracks.append({
+            "track_id": track_id,
+            "coasting": bool(flags & TRACK_COASTING),
+            "position": tuple(values[0:3]),
+            "velocity": tuple(values[3:6]),
+            "prediction": tuple(values[6:9]),
+        })
+    return {
+        "frame_id": frame_id,
+        "capture_timestamp": capture_ts,
+        "publish_timestamp": publish_ts,
+        "tracks": tracks,
+    }
+
+
+class AsyncPublisher:
+    """
+    Etapa de publicación asíncrona. El hilo de procesado solo deja el estado
+    del frame (posición + dedos + frame_id + marca temporal de captura) y un
+    hilo propio lo envía en un único mensaje binario a STATE_TOPIC.
+
+    - coalesce: si llega un estado nuevo antes de enviar el anterior, se
+      sustituye (gana el más reciente). Sin coalesce se encolan hasta
+      max_pending estados y se descartan los más antiguos.
+    - max_rate: límite de mensajes por segundo (None para no limitar).
+    - legacy_topics: publica además en los topics de texto de MQTTClient
+      ('x y z' y número de dedos) cuando hay posición y dedos.
+    - smoother: BallTrackSmoother opcional. Si se indica, la posición de
+      STATE_TOPIC es la de la pista principal extrapolada al instante de
+      envío, convertida al mismo formato publicado que sin smoother
+      (to_output_units), y en track_topic se publican todas las pistas con
+      velocidad y predicción en float, en unidades de la calibración. Los
+      topics de texto siguen recibiendo la posición pasada a publish.
+    """
+
+    def __init__(self, mqtt_client, state_topic=STATE_TOPIC, qos=0, max_rate=None,
+                 coalesce=True, max_pending=64, legacy_topics=True, smoother=None, track_topic=TRACK_TOPIC):
+        self.mqtt = mqtt_client
+        self.state_topic = state_topic
+        self.qos = qos
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.coalesce = coalesce
+        self.max_pending = 1 if coalesce else max_pending
+        self.legacy_topics = legacy_topics
+        self.smoother = smoother
+        self.track_topic = track_topic
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._last_sent = 0.0
+
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.queue_latency = LatencyStats()
+        self.capture_to_publish = LatencyStats()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, frame_id, capture_timestamp, position=None, fingers=None):
+        """
+        Deja el estado para publicar sin bloquear al llamante.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._pending) >= self.max_pending:
+                self._pending.pop(0)
+                self.coalesced += 1
+                instrumentation.incr("publish_coalesced")
+            self._pending.append((frame_id, capture_timestamp, position, fingers, time.perf_counter()))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                wait = self._last_sent + self.min_interval - time.monotonic()
+                if wait > 0 and not self._closed:
+                    # Durante la espera pueden llegar estados más recientes
+                    self._cond.wait(wait)
+                    continue
+                item = self._pending.pop(0)
+            self._send(*item)
+
+    def _send(self, frame_id, capture_timestamp, position, fingers, enqueued):
+        now = time.time()
+        with instrumentation.span("publish"):
+            ok = True
+            state_position = position
+            if self.smoother is not None:
+                # Compensación de latencia: estado extrapolado de la captura al envío
+                states = self.smoother.states(now)
+                # Mismas unidades en STATE_TOPIC con y sin smoother; los float solo en track_topic
+                state_position = to_output_units(states[0].position) if states else None
+                ok = self.mqtt.publish(self.track_topic,
+                                       encode_tracks(frame_id, capture_timestamp, now, states), self.qos)
+            payload = encode_state(frame_id, capture_timestamp, state_position, fingers, now)
+            ok = self.mqtt.publish(self.state_topic, payload, self.qos) and ok
+            if self.legacy_topics and position and fingers:
+                ok = self.mqtt.publish(self.mqtt.position_topic, " ".join(str(v) for v in position), self.qos) and ok
+                ok = self.mqtt.publish(self.mqtt.fingers_topic, f"{fingers}", self.qos) and ok
+
+        self._last_sent = time.monotonic()
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+            instrumentation.incr("publish_failed")
+        self.queue_latency.add(time.perf_counter() - enqueued)
+        self.capture_to_publish.add(now - capture_timestamp)
+        instrumentation.observe("capture_to_publish", now - capture_timestamp)
+
+    def metrics(self):
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "queue_latency": self.queue_latency.summary(),
+            "capture_to_publish": self.capture_to_publish.summary(),
+        }
+
+    def close(self):
+        """
+        Envía los estados pendientes y detiene el hilo.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
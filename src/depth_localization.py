@@ -0,0 +1,266 @@
+"""
+Localización 3D de la pelota a partir de un mapa de profundidad en lugar de
+detectarla en las dos vistas y triangular: YOLO solo se ejecuta sobre la
+vista izquierda y la posición se toma de la mediana de los puntos 3D dentro
+de la caja detectada. Los puntos 3D salen de:
+
+- la nube de puntos de la ZED (retrieve_measure XYZ), adjunta al frame por
+  ZEDSource(point_cloud=True), o
+- un mapa de disparidad cv2.StereoSGBM calculado en CPU solo sobre una
+  región rectificada y reducida alrededor de la caja (para grabaciones).
+"""
+import math
+
+import cv2
+import numpy as np
+
+import instrumentation
+from undistortion import UNDISTORT_CRITERIA
+
+MODES = ("auto", "zed", "sgbm")
+# Profundidades aceptadas, en múltiplos de la distancia entre cámaras
+# (con la ZED2, de 12 cm, unos 0,25 m a 15 m)
+DEFAULT_DEPTH_RANGE = (2.0, 125.0)
+
+
+def median_xyz(points, bbox, shrink=0.5, min_valid_fraction=0.25):
+    """
+    Mediana por eje de los puntos 3D válidos de points (H, W, >=3) dentro de
+    la parte central de bbox (x1, y1, x2, y2, en píxeles de points), reducida
+    al factor shrink de su tamaño para no mezclar el fondo de las esquinas.
+    Devuelve None si menos de min_valid_fraction de los puntos son válidos.
+    """
+    x1, y1, x2, y2 = bbox
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    half_w = max((x2 - x1) * shrink / 2, 0.5)
+    half_h = max((y2 - y1) * shrink / 2, 0.5)
+    h, w = points.shape[:2]
+    c0, c1 = max(int(cx - half_w), 0), min(int(math.ceil(cx + half_w)), w)
+    r0, r1 = max(int(cy - half_h), 0), min(int(math.ceil(cy + half_h)), h)
+    if c1 <= c0 or r1 <= r0:
+        return None
+
+    region = points[r0:r1, c0:c1, :3].reshape(-1, 3)
+    valid = np.isfinite(region).all(axis=1) & (region[:, 2] > 0)
+    if valid.sum() < max(1, min_valid_fraction * len(region)):
+        return None
+    return np.median(region[valid], axis=0)
+
+
+class SGBMDepthEstimator:
+    """
+    Profundidad en CPU con cv2.StereoSGBM sobre una ventana rectificada
+    alrededor de la caja de la pelota. Solo se rectifica (con los mapas en
+    caché de StereoUndistorter) la ventana de interés, ampliada margin veces
+    el tamaño de la caja y num_disparities píxeles hacia la izquierda para
+    que la vista derecha contenga la correspondencia, y se reduce a scale
+    antes de calcular la disparidad.
+    """
+
+    def __init__(self, undistorter, scale=0.5, num_disparities=128, block_size=5, margin=1.0, shrink=0.5):
+        self.undistorter = undistorter
+        self.scale = scale
+        self.num_disparities = num_disparities
+        self.margin = margin
+        self.shrink = shrink
+        # Disparidades en la imagen reducida, múltiplo de 16 como exige OpenCV
+        disparidades = max(16, int(math.ceil(num_disparities * scale / 16)) * 16)
+        self.matcher = cv2.StereoSGBM_create(
+            minDisparity=0, numDisparities=disparidades, blockSize=block_size,
+            P1=8 * 3 * block_size ** 2, P2=32 * 3 * block_size ** 2,
+            uniquenessRatio=10, speckleWindowSize=50, speckleRange=2,
+            mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY)
+
+    def locate(self, left_image, right_image, bbox):
+        """
+        Posición 3D (array float, unidades de la calibración, sistema de la
+        cámara izquierda original) de la caja bbox detectada en la vista
+        izquierda sin rectificar, o None si no hay disparidad fiable.
+        """
+        h, w = left_image.shape[:2]
+        maps = self.undistorter.rectification_maps((w, h))
+        # Caja en coordenadas de la imagen izquierda rectificada
+        esquinas = np.asarray(bbox, dtype=np.float64).reshape(-1, 1, 2)
+        esquinas = cv2.undistortPoints(esquinas, self.undistorter.K1, self.undistorter.D1,
+                                       R=maps["R1"], P=maps["P1"], criteria=UNDISTORT_CRITERIA)
+        (rx1, ry1), (rx2, ry2) = esquinas.reshape(2, 2)
+
+        pad_x, pad_y = (rx2 - rx1) * self.margin, (ry2 - ry1) * self.margin
+        c0 = max(int(rx1 - pad_x - self.num_disparities), 0)
+        c1 = min(int(math.ceil(rx2 + pad_x)), w)
+        r0 = max(int(ry1 - pad_y), 0)
+        r1 = min(int(math.ceil(ry2 + pad_y)), h)
+        if c1 - c0 < 16 or r1 - r0 < 4:
+            return None
+
+        ventana = (slice(r0, r1), slice(c0, c1))
+        left = cv2.remap(left_image, maps["map1_l"][ventana], maps["map2_l"][ventana], cv2.INTER_LINEAR)
+        right = cv2.remap(right_image, maps["map1_r"][ventana], maps["map2_r"][ventana], cv2.INTER_LINEAR)
+        if self.scale != 1.0:
+            left = cv2.resize(left, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            right = cv2.resize(right, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+        # Disparidad en píxeles de la imagen completa; SGBM la da en 1/16 de píxel
+        disparity = self.matcher.compute(left, right).astype(np.float32) / (16.0 * self.scale)
+        disparity[disparity <= 0] = np.nan
+
+        # Reproyección con Q de la ventana (coordenadas de la imagen rectificada completa)
+        hs, ws = disparity.shape
+        u = c0 + (np.arange(ws) + 0.5) / self.scale - 0.5
+        v = r0 + (np.arange(hs) + 0.5) / self.scale - 0.5
+        uu, vv = np.meshgrid(u, v)
+        homog = np.stack((uu, vv, disparity, np.ones_like(disparity)), axis=-1) @ maps["Q"].T
+        points = homog[..., :3] / homog[..., 3:]
+
+        caja = ((rx1 - c0) * self.scale, (ry1 - r0) * self.scale,
+                (rx2 - c0) * self.scale, (ry2 - r0) * self.scale)
+        punto = median_xyz(points, caja, self.shrink)
+        if punto is None:
+            return None
+        # Del sistema rectificado al de la cámara izquierda original
+        return maps["R1"].T @ punto
+
+
+class ZEDCloudCalibration:
+    """
+    Datos de fábrica de la ZED para llevar su nube de puntos al sistema de
+    la calibración: baseline (distancia entre cámaras en las unidades de la
+    nube) y rotation (rotación de rectificación de la cámara izquierda, del
+    sistema original al rectificado en el que la ZED da la nube). Se crea
+    vacía y se completa con configure cuando la cámara ya está abierta
+    (ZEDSource.baseline y ZEDSource.rectification_rotation); hasta entonces
+    la nube no se usa. Se puede compartir entre los hilos del pipeline.
+    """
+
+    def __init__(self, baseline=None, rotation=None):
+        self._datos = None
+        if baseline is not None:
+            self.configure(baseline, rotation)
+
+    def configure(self, baseline, rotation=None):
+        rotation = np.eye(3) if rotation is None else np.asarray(rotation, dtype=np.float64)
+        # Una sola asignación: los lectores ven la configuración anterior o la nueva
+        self._datos = (float(baseline), rotation)
+
+    @property
+    def ready(self):
+        return self._datos is not None
+
+    def to_calibration(self, point, calibration_baseline):
+        """
+        Convierte un punto de la nube (sistema rectificado de la ZED) al de
+        la cámara izquierda calibrada, con distancia entre cámaras
+        calibration_baseline (|T|).
+        """
+        baseline, rotation = self._datos
+        return rotation.T @ (point * (calibration_baseline / baseline))
+
+
+class DepthBallLocator:
+    """
+    Alternativa a la triangulación de BallDetector con la misma interfaz
+    (detect_stereo_frame, detect_stereo_balls_frame, detect_stereo_batch):
+    detecta la pelota solo en la vista izquierda y toma su posición de un
+    mapa de profundidad.
+
+    - mode: 'zed' usa la nube de puntos del frame, 'sgbm' la disparidad
+      calculada en CPU y 'auto' la nube si el frame la trae y si no SGBM.
+    - zed_calibration: ZEDCloudCalibration con la distancia entre cámaras y
+      la rotación de rectificación de fábrica de la ZED, con las que la nube
+      (en metros y en el sistema rectificado de la ZED) se lleva al de la
+      calibración. Mientras no esté configurada no se usa la nube ('auto'
+      recurre a SGBM y 'zed' no devuelve posiciones).
+    - depth_range: profundidades (z) aceptadas, en múltiplos de la distancia
+      entre cámaras |T|; las posiciones fuera del rango se descartan.
+    """
+
+    def __init__(self, detector, mode="auto", sgbm=None, shrink=0.5, zed_calibration=None,
+                 depth_range=DEFAULT_DEPTH_RANGE):
+        if mode not in MODES:
+            raise ValueError(f"Modo de profundidad desconocido: {mode} (opciones: {', '.join(MODES)})")
+        if mode == "zed" and zed_calibration is None:
+            raise ValueError("El modo 'zed' necesita zed_calibration para convertir la nube de puntos")
+        self.detector = detector
+        self.to_output_units = detector.to_output_units
+        self.mode = mode
+        self.shrink = shrink
+        self.zed_calibration = zed_calibration
+        self.baseline = float(np.linalg.norm(detector.T))
+        self.min_depth = depth_range[0] * self.baseline
+        self.max_depth = depth_range[1] * self.baseline
+        self.sgbm = sgbm if sgbm is not None else SGBMDepthEstimator(detector.undistorter, shrink=shrink)
+
+    def detect_stereo_frame(self, frame):
+        """
+        Posición de la pelota más confiable en el formato publicado, o [].
+        """
+        pistas = self.detect_stereo_balls_frame(frame)
+        return self.to_output_units(pistas[0]['posicion']) if pistas else []
+
+    def detect_stereo_balls_frame(self, frame, imgsz=None):
+        return self.locate(frame, self.detector.detect_balls_batch([frame.left], imgsz)[0])
+
+    def detect_stereo_batch(self, frames):
+        """
+        Igual que BallDetector.detect_stereo_batch, con una sola llamada al
+        modelo sobre las vistas izquierdas de todos los frames.
+        """
+        if not frames:
+            return []
+        detecciones = self.detector.detect_balls_batch([frame.left for frame in frames])
+        resultados = []
+        for frame, detecciones_img in zip(frames, detecciones):
+            pistas = self.locate(frame, detecciones_img)
+            resultados.append(self.to_output_units(pistas[0]['posicion']) if pistas else [])
+        return resultados
+
+    def locate(self, frame, detecciones):
+        """
+        Convierte las detecciones de la vista izquierda en pistas con
+        'posicion', 'confianza', 'centroide_l' y 'bbox', ordenadas por
+        confianza. Las cajas sin profundidad válida se descartan.
+        """
+        if not detecciones:
+            instrumentation.incr("ball_misses")
+            return []
+        pistas = []
+        with instrumentation.span("depth_lookup"):
+            for det in detecciones:
+                posicion = self._lookup(frame, det['bbox'])
+                if posicion is None:
+                    continue
+                pistas.append({
+                    'posicion': posicion,
+                    'confianza': det['confianza'],
+                    'centroide_l': det['centroide'],
+                    'bbox': det['bbox'],
+                })
+        if not pistas:
+            instrumentation.incr("depth_failures")
+        pistas.sort(key=lambda pista: pista['confianza'], reverse=True)
+        return pistas
+
+    def _lookup(self, frame, bbox):
+        punto = self._depth_point(frame, bbox)
+        if punto is None:
+            return None
+        if not self.min_depth <= punto[2] <= self.max_depth:
+            instrumentation.incr("depth_out_of_range")
+            return None
+        return punto
+
+    def _depth_point(self, frame, bbox):
+        point_cloud = frame.point_cloud
+        zed_ready = self.zed_calibration is not None and self.zed_calibration.ready
+        if point_cloud is not None and zed_ready and self.mode in ("auto", "zed"):
+            # La nube puede estar a menor resolución que la imagen
+            sy = point_cloud.shape[0] / frame.left.shape[0]
+            sx = point_cloud.shape[1] / frame.left.shape[1]
+            x1, y1, x2, y2 = bbox
+            punto = median_xyz(point_cloud, (x1 * sx, y1 * sy, x2 * sx, y2 * sy), self.shrink)
+            if punto is None:
+                return None
+            return self.zed_calibration.to_calibration(punto, self.baseline)
+        if self.mode == "zed":
+            return None
+        return self.sgbm.locate(frame.left, frame.right, bbox)
@@ -0,0 +1,161 @@
+"""
+Caché en disco de los resultados de los detectores por imagen, para volver
+a procesar capturas (triangulación, calibración, publicación) sin repetir la
+inferencia de YOLO o MediaPipe.
+
+Cada entrada es un .npz con los arrays del resultado y su clave combina el
+hash del contenido de la imagen con un espacio de nombres, que a su vez es
+el hash de la firma del detector (modelo, versión y parámetros). Cambiar el
+modelo o un parámetro cambia el espacio de nombres, así que nunca se sirven
+resultados de otra configuración; las entradas antiguas se van eliminando
+por LRU cuando la caché supera max_bytes, o de una vez con invalidate.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import instrumentation
+from paths import DATA_DIR
+
+log = logging.getLogger("v3d.cache")
+
+DEFAULT_DETECTION_CACHE_DIR = os.path.join(DATA_DIR, "cache", "detections")
+DEFAULT_MAX_BYTES = 512 * 2 ** 20
+
+
+def image_key(image, *extra):
+    """
+    Hash del contenido de la imagen (píxeles, forma y tipo) junto con los
+    valores de extra que afecten al resultado (p. ej. el imgsz de la llamada).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((image.shape, str(image.dtype), extra)).encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """
+    Caché LRU de resultados por imagen en root, acotada a max_bytes en disco.
+
+    - namespace(firma): espacio de nombres para la firma de un detector
+      (diccionario serializable a JSON).
+    - get(namespace, key): diccionario de arrays guardado, o None.
+    - put(namespace, key, **arrays): guarda un resultado.
+    - invalidate(namespace=None): borra un espacio de nombres o toda la caché.
+
+    El orden LRU se guarda en la fecha de modificación de cada fichero, que
+    se actualiza en cada acierto, así que se conserva entre ejecuciones. Se
+    puede compartir entre hilos.
+    """
+
+    def __init__(self, root=DEFAULT_DETECTION_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # ruta -> tamaño, de la menos a la más reciente
+        self._bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        encontradas = []
+        for directorio, _, ficheros in os.walk(self.root):
+            for nombre in ficheros:
+                if not nombre.endswith(".npz"):
+                    continue
+                path = os.path.join(directorio, nombre)
+                if nombre.endswith(".tmp.npz"):
+                    # Escritura interrumpida
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                encontradas.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(encontradas):
+            self._entries[path] = size
+            self._bytes += size
+        self._evict()
+
+    @staticmethod
+    def namespace(signature):
+        texto = json.dumps(signature, sort_keys=True, default=str)
+        return hashlib.blake2b(texto.encode(), digest_size=8).hexdigest()
+
+    def _path(self, namespace, key):
+        return os.path.join(self.root, namespace, key[:2], key + ".npz")
+
+    def get(self, namespace, key):
+        path = self._path(namespace, key)
+        with self._lock:
+            if path not in self._entries:
+                self.misses += 1
+                instrumentation.incr("detection_cache_misses")
+                return None
+            self._entries.move_to_end(path)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = {name: data[name] for name in data.files}
+            os.utime(path)
+        except (OSError, ValueError) as exc:
+            # Borrada por otro proceso o corrupta: se trata como fallo
+            log.debug(f"Entrada de caché ilegible {path}: {exc}")
+            self._forget(path)
+            self.misses += 1
+            instrumentation.incr("detection_cache_misses")
+            return None
+        self.hits += 1
+        instrumentation.incr("detection_cache_hits")
+        return entry
+
+    def put(self, namespace, key, **arrays):
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: nunca queda un .npz a medias con el nombre final
+        tmp_path = path[:-len(".npz")] + f".{threading.get_ident()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._bytes += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            self._evict()
+
+    def _forget(self, path):
+        with self._lock:
+            self._bytes -= self._entries.pop(path, 0)
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def invalidate(self, namespace=None):
+        """
+        Elimina las entradas de namespace, o todas si es None.
+        """
+        prefix = self.root if namespace is None else os.path.join(self.root, namespace)
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(prefix + os.sep)]:
+                self._bytes -= self._entries.pop(path)
+            if namespace is None:
+                for entry in os.scandir(self.root):
+                    if entry.is_dir():
+                        shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                shutil.rmtree(prefix, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._bytes}
@@ -0,0 +1,48 @@
+import os
+import queue
+import threading
+
+import cv2
+
+import instrumentation
+
+
+class DiskArchiver:
+    """
+    Sumidero asíncrono que guarda en disco los pares estéreo capturados.
+    Trabaja con copias en un hilo aparte para no frenar la captura: si la
+    cola de pendientes se llena, el par se descarta y se contabiliza.
+    """
+
+    def __init__(self, left_path, right_path, max_pending=16, extension="jpg"):
+        self.left_path = left_path
+        self.right_path = right_path
+        self.extension = extension
+        self.dropped = 0
+        for path in (left_path, right_path):
+            os.makedirs(path, exist_ok=True)
+
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, frame_id, left, right):
+        try:
+            self._pending.put_nowait((frame_id, left.copy(), right.copy()))
+        except queue.Full:
+            self.dropped += 1
+            instrumentation.incr("archive_dropped")
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            frame_id, left, right = item
+            filename = f"img_{frame_id:06d}.{self.extension}"
+            cv2.imwrite(os.path.join(self.left_path, filename), left)
+            cv2.imwrite(os.path.join(self.right_path, filename), right)
+
+    def close(self):
+        self._pending.put(None)
+        self._thread.join()
@@ -0,0 +1,158 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+import instrumentation
+from stereo_frame import StereoFrame
+
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+
+
+class StereoFrameQueue:
+    """
+    Cola acotada de pares estéreo sobre un buffer circular de arrays
+    preasignados. El productor escribe cada vista directamente en un hueco
+    libre y el consumidor recibe vistas de ese mismo buffer, sin pasar por
+    disco ni volver a codificar/decodificar JPEG.
+
+    Política de contrapresión cuando no hay huecos libres:
+    - 'drop_oldest': se descarta el par pendiente más antiguo.
+    - 'block': el productor espera a que el consumidor libere un hueco.
+    """
+
+    def __init__(self, shape, capacity=4, policy=DROP_OLDEST, dtype=np.uint8):
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"Política de contrapresión desconocida: {policy}")
+        if capacity < 2:
+            raise ValueError("La cola necesita al menos dos huecos")
+
+        self.shape = tuple(shape)
+        self.capacity = capacity
+        self.policy = policy
+        self._left = np.empty((capacity,) + self.shape, dtype=dtype)
+        self._right = np.empty((capacity,) + self.shape, dtype=dtype)
+
+        self._free = deque(range(capacity))
+        self._ready = deque()
+        self._held = {}
+        self._frames = [None] * capacity
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+        self.stale = 0
+
+    def reserve(self, timeout=None):
+        """
+        Reserva un hueco para el productor y devuelve (indice, left, right),
+        donde left/right son los arrays donde escribir el par. Si todos los
+        huecos están en manos del consumidor (o con la política 'block'), se
+        espera hasta timeout segundos a que libere uno. Devuelve None si la
+        cola está cerrada o expira el timeout.
+        """
+        with self._cond:
+            while not self._free:
+                if self._closed:
+                    return None
+                if self.policy == DROP_OLDEST and self._ready:
+                    self.dropped += 1
+                    instrumentation.incr("frames_dropped")
+                    self._free.append(self._ready.popleft())
+                elif not self._cond.wait(timeout):
+                    return None
+            if self._closed:
+                return None
+            index = self._free.popleft()
+        return index, self._left[index], self._right[index]
+
+    def commit(self, index, frame_id, timestamp, point_cloud=None):
+        """
+        Publica el hueco reservado como un par listo para el consumidor.
+        """
+        frame = StereoFrame(frame_id, timestamp, self._left[index], self._right[index], point_cloud)
+        with self._cond:
+            self._frames[index] = frame
+            self._ready.append(index)
+            self._cond.notify_all()
+        return frame
+
+    def cancel(self, index):
+        """
+        Devuelve a la cola un hueco reservado que no se llegó a publicar.
+        """
+        with self._cond:
+            self._free.appendleft(index)
+            self._cond.notify_all()
+
+    def put(self, left, right, frame_id, timestamp, timeout=None):
+        """
+        Copia un par ya existente en la cola. Devuelve False si se ha descartado.
+        """
+        slot = self.reserve(timeout)
+        if slot is None:
+            return False
+        index, left_buf, right_buf = slot
+        np.copyto(left_buf, left)
+        np.copyto(right_buf, right)
+        self.commit(index, frame_id, timestamp)
+        return True
+
+    def get(self, timeout=None):
+        """
+        Devuelve el siguiente StereoFrame pendiente (vistas sobre el buffer).
+        El hueco queda retenido hasta llamar a release(frame). Devuelve None
+        si la cola se cierra vacía o expira el timeout.
+        """
+        with self._cond:
+            while not self._ready:
+                if self._closed or not self._cond.wait(timeout):
+                    return None
+            index = self._ready.popleft()
+            frame = self._frames[index]
+            self._held[frame.frame_id] = index
+            return frame
+
+    def get_latest(self, timeout=None):
+        """
+        Igual que get, pero entrega solo el par más reciente: los pendientes
+        más antiguos se descartan (se cuentan en stale) y sus huecos vuelven
+        al productor.
+        """
+        with self._cond:
+            while not self._ready:
+                if self._closed or not self._cond.wait(timeout):
+                    return None
+            if len(self._ready) > 1:
+                while len(self._ready) > 1:
+                    index = self._ready.popleft()
+                    self._frames[index] = None
+                    self._free.append(index)
+                    self.stale += 1
+                    instrumentation.incr("frames_stale")
+                self._cond.notify_all()
+            index = self._ready.popleft()
+            frame = self._frames[index]
+            self._held[frame.frame_id] = index
+            return frame
+
+    def release(self, frame):
+        """
+        Devuelve al productor el hueco del par indicado.
+        """
+        with self._cond:
+            index = self._held.pop(frame.frame_id, None)
+            if index is None:
+                return
+            self._frames[index] = None
+            self._free.append(index)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._ready)
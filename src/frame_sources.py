@@ -0,0 +1,347 @@
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import instrumentation
+from stereo_frame import StereoFrame
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class ReplayClock:
+    """
+    Ritmo de reproducción de una fuente grabada:
+    - target_fps: entrega frames a un ritmo fijo.
+    - realtime: respeta las marcas temporales originales (escaladas por speed).
+    Sin ninguna de las dos opciones no se espera (lo más rápido posible).
+    """
+
+    def __init__(self, target_fps=None, realtime=False, speed=1.0):
+        self.target_fps = target_fps
+        self.realtime = realtime
+        self.speed = speed
+        self._start_wall = None
+        self._start_ts = None
+        self._frames = 0
+
+    def wait(self, timestamp):
+        now = time.monotonic()
+        if self._start_wall is None:
+            self._start_wall, self._start_ts = now, timestamp
+        if self.target_fps:
+            due = self._start_wall + self._frames / self.target_fps
+        elif self.realtime:
+            due = self._start_wall + (timestamp - self._start_ts) / self.speed
+        else:
+            due = now
+        self._frames += 1
+        if due > now:
+            time.sleep(due - now)
+
+
+class FrameSource:
+    """
+    Interfaz común de las fuentes de pares estéreo: se iteran y producen
+    StereoFrame en orden. Se pueden usar como gestor de contexto.
+
+    Las marcas temporales son siempre absolutas (segundos de la época, como
+    time.time()): el pipeline, el control de carga y el publicador miden la
+    latencia como time.time() - frame.timestamp. En las fuentes grabadas
+    con start_time, pasar start_time=time.time() y un ReplayClock al ritmo
+    de grabación hace que esa latencia sea la de una captura en vivo.
+    """
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def rectification_rotation(R, T):
+    """
+    Rotación de rectificación de la cámara izquierda (del sistema original
+    al rectificado) para una pareja con X_r = R X_l + T, con el mismo
+    reparto de la rotación entre cámaras que cv2.stereoRectify. No depende
+    de los intrínsecos.
+    """
+    R1 = cv2.stereoRectify(np.eye(3), np.zeros(5), np.eye(3), np.zeros(5), (2, 2),
+                           np.asarray(R, dtype=np.float64), np.asarray(T, dtype=np.float64).reshape(3, 1))[0]
+    return R1
+
+
+def _zed_rectification_rotation(calibration_raw):
+    # stereo_transform es la pose de la cámara derecha en el sistema de la
+    # izquierda (SDK >= 3.x); en versiones anteriores R es un vector de Rodrigues
+    transform = getattr(calibration_raw, "stereo_transform", None)
+    if transform is not None:
+        pose_R = np.asarray(transform.get_rotation_matrix().r, dtype=np.float64)
+        pose_t = np.asarray(transform.get_translation().get(), dtype=np.float64)
+    else:
+        pose_R = cv2.Rodrigues(np.asarray(calibration_raw.R, dtype=np.float64))[0]
+        pose_t = np.asarray(calibration_raw.T, dtype=np.float64)
+    # Pose -> extrínsecos de OpenCV (X_r = R X_l + T)
+    return rectification_rotation(pose_R.T, -pose_R.T @ pose_t)
+
+
+class ZEDSource(FrameSource):
+    """
+    Cámara ZED en vivo (o un fichero SVO si se indica svo_path). pyzed se
+    importa solo al crear la fuente. grab_into permite escribir el par
+    directamente en buffers ya reservados (p. ej. huecos de StereoFrameQueue).
+
+    Con point_cloud=True cada captura recupera además la nube de puntos XYZ
+    de la vista izquierda (retrieve_measure), reducida a point_cloud_scale
+    de la resolución, que queda en self.point_cloud y en los StereoFrame
+    generados. Requiere un depth_mode distinto de 'NONE'. baseline y
+    rectification_rotation son los datos de fábrica con los que esa nube se
+    lleva al sistema de la calibración (depth_localization.ZEDCloudCalibration).
+    """
+
+    def __init__(self, resolution="HD1080", fps=30, depth_mode="ULTRA", svo_path=None, clock=None,
+                 point_cloud=False, point_cloud_scale=0.5):
+        import pyzed.sl as sl
+        self.sl = sl
+        self.clock = clock
+        self.cam = sl.Camera()
+        init_params = sl.InitParameters()
+        init_params.camera_resolution = getattr(sl.RESOLUTION, resolution)
+        init_params.depth_mode = getattr(sl.DEPTH_MODE, depth_mode)
+        init_params.coordinate_units = sl.UNIT.METER
+        # x a la derecha, y hacia abajo, z hacia delante: el mismo sistema que OpenCV
+        init_params.coordinate_system = sl.COORDINATE_SYSTEM.IMAGE
+        init_params.camera_fps = fps
+        if svo_path is not None:
+            init_params.set_from_svo_file(svo_path)
+            init_params.svo_real_time_mode = False
+        status = self.cam.open(init_params)
+        if status != sl.ERROR_CODE.SUCCESS:
+            raise RuntimeError(f"No se pudo abrir la cámara ZED: {status}")
+
+        info = self.cam.get_camera_information()
+        config = getattr(info, "camera_configuration", info)
+        resolution = getattr(config, "resolution", None) or info.camera_resolution
+        self.shape = (resolution.height, resolution.width, 3)
+        # Distancia entre cámaras según la calibración de fábrica (en metros, coordinate_units)
+        calibration = getattr(config, "calibration_parameters", None) or info.calibration_parameters
+        self.baseline = calibration.get_camera_baseline()
+        # La nube de puntos está en el sistema rectificado de fábrica de la cámara izquierda
+        calibration_raw = getattr(config, "calibration_parameters_raw", None)
+        self.rectification_rotation = np.eye(3) if calibration_raw is None else \
+            _zed_rectification_rotation(calibration_raw)
+
+        self.runtime = sl.RuntimeParameters()
+        self._mat = sl.Mat()
+        self.point_cloud = None
+        self._point_cloud_mat = sl.Mat() if point_cloud else None
+        self._point_cloud_size = sl.Resolution(int(self.shape[1] * point_cloud_scale),
+                                               int(self.shape[0] * point_cloud_scale))
+        self.frame_count = 0
+        self.last_error = None
+
+    def grab_into(self, left, right):
+        """
+        Captura un par y lo convierte BGRA -> BGR sobre left/right. Devuelve
+        (frame_id, timestamp) o None si no hay más frames o falla la captura
+        (el motivo queda en last_error).
+        """
+        sl = self.sl
+        with instrumentation.span("capture"):
+            err = self.cam.grab(self.runtime)
+        if err != sl.ERROR_CODE.SUCCESS:
+            self.last_error = err
+            instrumentation.incr("capture_errors")
+            return None
+        with instrumentation.span("decode"):
+            self.cam.retrieve_image(self._mat, sl.VIEW.LEFT)
+            cv2.cvtColor(self._mat.get_data(), cv2.COLOR_BGRA2BGR, dst=left)
+            self.cam.retrieve_image(self._mat, sl.VIEW.RIGHT)
+            cv2.cvtColor(self._mat.get_data(), cv2.COLOR_BGRA2BGR, dst=right)
+        if self._point_cloud_mat is not None:
+            with instrumentation.span("point_cloud"):
+                self.cam.retrieve_measure(self._point_cloud_mat, sl.MEASURE.XYZ, sl.MEM.CPU, self._point_cloud_size)
+                # Copia propia: el Mat de la ZED se reutiliza en la siguiente captura
+                self.point_cloud = np.array(self._point_cloud_mat.get_data()[..., :3])
+        timestamp = self.cam.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_milliseconds() / 1000.0
+        if self.clock is not None:
+            self.clock.wait(timestamp)
+        frame_id = self.frame_count
+        self.frame_count += 1
+        return frame_id, timestamp
+
+    def __iter__(self):
+        while True:
+            left = np.empty(self.shape, dtype=np.uint8)
+            right = np.empty(self.shape, dtype=np.uint8)
+            grabbed = self.grab_into(left, right)
+            if grabbed is None:
+                return
+            yield StereoFrame(grabbed[0], grabbed[1], left, right, self.point_cloud)
+
+    def close(self):
+        self.cam.close()
+
+
+class SVOReplaySource(ZEDSource):
+    """
+    Reproducción de una grabación SVO de ZED respetando sus marcas temporales
+    (o a target_fps).
+    """
+
+    def __init__(self, svo_path, target_fps=None, speed=1.0, depth_mode="ULTRA"):
+        clock = ReplayClock(target_fps=target_fps, realtime=target_fps is None, speed=speed)
+        super().__init__(depth_mode=depth_mode, svo_path=svo_path, clock=clock)
+
+
+class ImagePairDirectorySource(FrameSource):
+    """
+    Pares guardados como imágenes con el mismo nombre en dos carpetas. Los
+    directorios se listan una sola vez y la decodificación se adelanta en un
+    pool de hilos (hasta prefetch pares). El frame_id se toma del número del
+    nombre (img_000024.jpg -> 24). La marca temporal es start_time +
+    frame_id / fps si se indica fps (start_time es por defecto la fecha de
+    modificación del primer fichero izquierdo), o la fecha de modificación
+    de cada fichero izquierdo.
+    """
+
+    def __init__(self, left_dir, right_dir, fps=None, prefetch=4, workers=2, clock=None, start_time=None):
+        self.left_dir = left_dir
+        self.right_dir = right_dir
+        self.fps = fps
+        self.prefetch = max(prefetch, 1)
+        self.clock = clock
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode")
+
+        with os.scandir(right_dir) as entries:
+            derechas = {e.name for e in entries if e.name.lower().endswith(IMAGE_EXTENSIONS)}
+        with os.scandir(left_dir) as entries:
+            self.names = sorted(e.name for e in entries if e.name in derechas)
+        if start_time is None and fps and self.names:
+            start_time = os.path.getmtime(os.path.join(left_dir, self.names[0]))
+        self.start_time = start_time
+
+    @staticmethod
+    def _frame_id(name, index):
+        digits = re.findall(r"\d+", name)
+        return int(digits[-1]) if digits else index
+
+    def _load(self, index, name):
+        frame_id = self._frame_id(name, index)
+        left_path = os.path.join(self.left_dir, name)
+        timestamp = self.start_time + frame_id / self.fps if self.fps else os.path.getmtime(left_path)
+        with instrumentation.span("decode"):
+            return StereoFrame.from_paths(frame_id, left_path, os.path.join(self.right_dir, name), timestamp)
+
+    def __iter__(self):
+        pendientes = deque()
+        items = iter(enumerate(self.names))
+        for index, name in items:
+            pendientes.append(self._pool.submit(self._load, index, name))
+            if len(pendientes) >= self.prefetch:
+                break
+        while pendientes:
+            frame = pendientes.popleft().result()
+            siguiente = next(items, None)
+            if siguiente is not None:
+                pendientes.append(self._pool.submit(self._load, *siguiente))
+            if frame is None:
+                continue
+            if self.clock is not None:
+                self.clock.wait(frame.timestamp)
+            yield frame
+
+    def __len__(self):
+        return len(self.names)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+
+class RecordingSource(FrameSource):
+    """
+    Reproducción de una sesión grabada con recording.StereoRecorder, en
+    orden de grabación y opcionalmente entre los frame_id start y stop
+    (incluidos). La sesión abierta queda en self.recording para acceder a
+    cualquier frame por su id.
+    """
+
+    def __init__(self, session_dir, start=None, stop=None, clock=None):
+        from recording import StereoRecording
+        self.recording = StereoRecording(session_dir)
+        self.start = start
+        self.stop = stop
+        self.clock = clock
+
+    def __iter__(self):
+        frame_ids = self.recording.frame_ids
+        for row in range(len(self.recording)):
+            frame_id = int(frame_ids[row])
+            if (self.start is not None and frame_id < self.start) or (self.stop is not None and frame_id > self.stop):
+                continue
+            frame = self.recording.read_row(row)
+            if self.clock is not None:
+                self.clock.wait(frame.timestamp)
+            yield frame
+
+    def __len__(self):
+        return len(self.recording)
+
+    def close(self):
+        self.recording.close()
+
+
+class VideoFileSource(FrameSource):
+    """
+    Pares desde vídeo: dos ficheros (izquierda y derecha) o uno solo con las
+    dos vistas lado a lado, como graba la ZED. La marca temporal es
+    start_time más la posición del frame en el vídeo; start_time es por
+    defecto la fecha de modificación del fichero menos su duración.
+    """
+
+    def __init__(self, left_path, right_path=None, clock=None, start_time=None):
+        self.clock = clock
+        self.side_by_side = right_path is None
+        self._left = cv2.VideoCapture(left_path)
+        self._right = None if self.side_by_side else cv2.VideoCapture(right_path)
+        if not self._left.isOpened() or (self._right is not None and not self._right.isOpened()):
+            raise RuntimeError(f"No se pudo abrir el vídeo {left_path}")
+        if start_time is None:
+            fps = self._left.get(cv2.CAP_PROP_FPS)
+            duracion = self._left.get(cv2.CAP_PROP_FRAME_COUNT) / fps if fps > 0 else 0.0
+            start_time = os.path.getmtime(left_path) - duracion
+        self.start_time = start_time
+
+    def __iter__(self):
+        frame_id = 0
+        while True:
+            with instrumentation.span("decode"):
+                ok, left = self._left.read()
+                if ok and not self.side_by_side:
+                    ok, right = self._right.read()
+            if not ok:
+                return
+            # Después de read(): posición del frame recién leído, no la del anterior
+            timestamp = self.start_time + self._left.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if self.side_by_side:
+                half = left.shape[1] // 2
+                left, right = left[:, :half], left[:, half:]
+            if self.clock is not None:
+                self.clock.wait(timestamp)
+            yield StereoFrame(frame_id, timestamp, left, right)
+            frame_id += 1
+
+    def close(self):
+        self._left.release()
+        if self._right is not None:
+            self._right.release()
@@ -0,0 +1,223 @@
+"""
+Backends de inferencia para BallDetector. Todos se llaman igual,
+backend(images, imgsz=None), y devuelven por imagen un array (N, 6) con
+[x1, y1, x2, y2, confianza, clase] en píxeles de la imagen original,
+restringido de antemano a las clases de interés (la pelota, id 32 de COCO).
+
+- 'ultralytics': el modelo .pt en PyTorch, como hasta ahora.
+- 'onnx': el modelo exportado a ONNX (y opcionalmente cuantizado a INT8)
+  ejecutado con onnxruntime en CPU. La exportación se hace una sola vez y
+  se guarda en caché; después no hace falta importar torch ni ultralytics.
+- 'openvino': igual que 'onnx' pero con el proveedor OpenVINO de
+  onnxruntime (paquete onnxruntime-openvino) si está disponible.
+
+Cada backend expone en signature el modelo, la versión y los parámetros que
+determinan su salida (lo usa detection_cache para indexar resultados).
+"""
+import hashlib
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from paths import DATA_DIR
+
+log = logging.getLogger("v3d.inference")
+
+BALL_CLASS_ID = 32  # 'sports ball' en COCO
+DEFAULT_IMGSZ = 640
+DEFAULT_CACHE_DIR = os.path.join(DATA_DIR, "cache", "onnx")
+LETTERBOX_COLOR = 114
+# Umbral IoU del NMS por defecto de ultralytics en predict; el backend ONNX
+# usa el mismo para que ambos den las mismas cajas que antes de los backends
+DEFAULT_IOU_THRESHOLD = 0.7
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _model_id(path):
+    # Nombres como 'yolov8n.pt' que ultralytics descarga si no existen
+    return _file_hash(path) if os.path.exists(path) else os.path.basename(path)
+
+
+class UltralyticsBackend:
+    """
+    Inferencia con ultralytics.YOLO (PyTorch). El filtrado por clase se hace
+    dentro del NMS de ultralytics.
+    """
+
+    def __init__(self, model_path, imgsz=None, threads=None, conf_threshold=0.25,
+                 iou_threshold=DEFAULT_IOU_THRESHOLD, class_ids=(BALL_CLASS_ID,)):
+        import ultralytics
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(model_path)
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.class_ids = list(class_ids)
+        self.signature = {"backend": "ultralytics", "version": ultralytics.__version__,
+                          "model": _model_id(model_path), "imgsz": imgsz, "conf": conf_threshold,
+                          "iou": iou_threshold, "classes": self.class_ids}
+
+    def __call__(self, images, imgsz=None):
+        kwargs = {}
+        if imgsz or self.imgsz:
+            kwargs["imgsz"] = imgsz or self.imgsz
+        results = self.model(list(images), classes=self.class_ids, conf=self.conf_threshold,
+                             iou=self.iou_threshold, verbose=False, **kwargs)
+        return [result.boxes.data.cpu().numpy().reshape(-1, 6) for result in results]
+
+
+def letterbox(image, size):
+    """
+    Redimensiona manteniendo la proporción y rellena hasta size x size.
+    Devuelve (imagen, escala, desplazamiento_x, desplazamiento_y).
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = round(h * scale), round(w * scale)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas = np.full((size, size, 3), LETTERBOX_COLOR, dtype=np.uint8)
+    canvas[top:top + nh, left:left + nw] = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return canvas, scale, left, top
+
+
+class ONNXBackend:
+    """
+    Inferencia con onnxruntime en CPU sobre el modelo exportado a ONNX.
+
+    El .onnx se genera la primera vez a partir del .pt (con ejes dinámicos,
+    así vale cualquier imgsz y tamaño de lote) y se guarda en cache_dir con
+    el hash del .pt en el nombre; con quantize=True se guarda además una
+    versión INT8 (cuantización dinámica de pesos). threads fija los hilos
+    de onnxruntime (None: los que elija onnxruntime).
+
+    El post-proceso solo mira las puntuaciones de class_ids y aplica NMS con
+    cv2.dnn.NMSBoxes, en lugar de decodificar las 80 clases.
+    """
+
+    def __init__(self, model_path, imgsz=None, threads=None, conf_threshold=0.25,
+                 iou_threshold=DEFAULT_IOU_THRESHOLD, class_ids=(BALL_CLASS_ID,), quantize=False,
+                 cache_dir=DEFAULT_CACHE_DIR, providers=None):
+        import onnxruntime as ort
+
+        self.imgsz = imgsz or DEFAULT_IMGSZ
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.class_ids = np.asarray(class_ids)
+
+        onnx_path = self.exported_model(model_path, quantize, cache_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        available = ort.get_available_providers()
+        providers = [p for p in (providers or ["CPUExecutionProvider"]) if p in available]
+        self.session = ort.InferenceSession(onnx_path, options, providers=providers or ["CPUExecutionProvider"])
+        self.providers = self.session.get_providers()
+
+        entrada = self.session.get_inputs()[0]
+        self.input_name = entrada.name
+        # Modelos exportados sin ejes dinámicos: lote de 1 y tamaño fijo
+        self.fixed_batch = isinstance(entrada.shape[0], int)
+        if isinstance(entrada.shape[2], int):
+            self.imgsz = entrada.shape[2]
+            self.fixed_size = True
+        else:
+            self.fixed_size = False
+        self.signature = {"backend": "onnx", "version": ort.__version__, "model": _file_hash(onnx_path),
+                          "providers": self.providers, "imgsz": self.imgsz, "fixed_size": self.fixed_size,
+                          "conf": conf_threshold, "iou": iou_threshold, "classes": self.class_ids.tolist()}
+
+    @staticmethod
+    def exported_model(model_path, quantize=False, cache_dir=DEFAULT_CACHE_DIR):
+        """
+        Ruta del .onnx (o del INT8) correspondiente a model_path, generándolo
+        si no está en caché. Acepta también un .onnx directamente.
+        """
+        if model_path.endswith(".onnx") and not quantize:
+            return model_path
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.splitext(os.path.basename(model_path))[0]
+        key = _file_hash(model_path)
+        onnx_path = model_path if model_path.endswith(".onnx") else os.path.join(cache_dir, f"{base}_{key}.onnx")
+
+        if not os.path.exists(onnx_path):
+            from ultralytics import YOLO
+            log.info(f"📦 Exportando {model_path} a ONNX")
+            exported = YOLO(model_path).export(format="onnx", dynamic=True, imgsz=DEFAULT_IMGSZ)
+            os.replace(exported, onnx_path)
+        if not quantize:
+            return onnx_path
+
+        int8_path = os.path.join(cache_dir, f"{base}_{key}_int8.onnx")
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            log.info(f"📦 Cuantizando {onnx_path} a INT8")
+            quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+        return int8_path
+
+    def __call__(self, images, imgsz=None):
+        size = self.imgsz if (self.fixed_size or not imgsz) else imgsz
+        boxed = [letterbox(image, size) for image in images]
+        blob = cv2.dnn.blobFromImages([b[0] for b in boxed], 1 / 255.0, swapRB=True)
+        if self.fixed_batch:
+            output = np.concatenate([self.session.run(None, {self.input_name: blob[i:i + 1]})[0]
+                                     for i in range(len(blob))])
+        else:
+            output = self.session.run(None, {self.input_name: blob})[0]
+        return [self._postprocess(pred, image.shape[:2], *params)
+                for pred, image, (_, *params) in zip(output, images, boxed)]
+
+    def _postprocess(self, pred, shape, scale, pad_x, pad_y):
+        # pred: (4 + clases, anclas) con cx, cy, w, h y la puntuación de cada clase
+        scores = pred[4 + self.class_ids]
+        best = scores.argmax(axis=0)
+        conf = scores[best, np.arange(scores.shape[1])]
+        keep = conf >= self.conf_threshold
+        if not keep.any():
+            return np.empty((0, 6), dtype=np.float32)
+
+        cx, cy, w, h = pred[:4, keep]
+        conf, cls = conf[keep], self.class_ids[best[keep]]
+        xywh = np.stack((cx - w / 2, cy - h / 2, w, h), axis=1)
+        idx = np.asarray(cv2.dnn.NMSBoxes(xywh.tolist(), conf.tolist(), self.conf_threshold,
+                                          self.iou_threshold), dtype=int).reshape(-1)
+
+        x1 = (xywh[idx, 0] - pad_x) / scale
+        y1 = (xywh[idx, 1] - pad_y) / scale
+        x2 = x1 + xywh[idx, 2] / scale
+        y2 = y1 + xywh[idx, 3] / scale
+        height, width = shape
+        boxes = np.stack((x1.clip(0, width), y1.clip(0, height), x2.clip(0, width), y2.clip(0, height),
+                          conf[idx], cls[idx]), axis=1)
+        return boxes.astype(np.float32)
+
+
+BACKENDS = ("ultralytics", "onnx", "openvino")
+
+
+def crear_backend(name, model_path, **options):
+    """
+    Crea el backend name ('ultralytics', 'onnx' u 'openvino') para model_path.
+    """
+    if name == "ultralytics":
+        options.pop("quantize", None)
+        return UltralyticsBackend(model_path, **options)
+    if name == "onnx":
+        return ONNXBackend(model_path, **options)
+    if name == "openvino":
+        return ONNXBackend(model_path, providers=["OpenVINOExecutionProvider", "CPUExecutionProvider"], **options)
+    raise ValueError(f"Backend de inferencia desconocido: {name} (opciones: {', '.join(BACKENDS)})")
@@ -0,0 +1,246 @@
+"""
+Instrumentación del camino caliente: spans de tiempo por etapa (captura,
+decodificación, YOLO, MediaPipe, triangulación, publicación), contadores de
+eventos (frames descartados, fallos de detección, pares sin correspondencia)
+y exportadores de bajo coste (endpoint HTTP en formato de texto de
+Prometheus o fichero JSON periódico).
+
+Uso desde los módulos:
+
+    import instrumentation
+
+    with instrumentation.span("yolo"):
+        results = self.model(images)
+    instrumentation.incr("ball_misses")
+
+Todo se registra en el registro global METRICS. instrumentation.disable()
+convierte spans y contadores en operaciones vacías y silencia el logger
+'v3d', del que cuelgan los loggers del proyecto.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from latency import LatencyStats
+
+log = logging.getLogger("v3d")
+
+PROMETHEUS_PREFIX = "v3d"
+QUANTILES = (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms"))
+
+
+class _Span:
+    __slots__ = ("_stats", "_start")
+
+    def __init__(self, stats):
+        self._stats = stats
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._stats.add(time.perf_counter() - self._start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    """
+    Registro de spans (LatencyStats por nombre) y contadores. Es seguro
+    usarlo desde varios hilos; los nombres se crean al usarse por primera vez.
+    """
+
+    def __init__(self, window=1000, enabled=True):
+        self.window = window
+        self.enabled = enabled
+        self._spans = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, name):
+        stats = self._spans.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._spans.setdefault(name, LatencyStats(self.window))
+        return stats
+
+    def span(self, name):
+        """
+        Context manager que mide la duración del bloque y la añade al span name.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self._stats(name))
+
+    def observe(self, name, seconds):
+        """
+        Añade una duración ya medida al span name.
+        """
+        if self.enabled:
+            self._stats(name).add(seconds)
+
+    def incr(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """
+        Devuelve {'timestamp', 'spans': {nombre: resumen}, 'counters': {nombre: valor}}.
+        """
+        with self._lock:
+            spans = dict(self._spans)
+            counters = dict(self._counters)
+        return {
+            "timestamp": time.time(),
+            "spans": {name: stats.summary() for name, stats in sorted(spans.items())},
+            "counters": dict(sorted(counters.items())),
+        }
+
+    def to_prometheus(self):
+        """
+        Formato de texto de exposición de Prometheus: un summary por span (en
+        segundos, cuantiles sobre la ventana; _sum y _count acumulados) y un
+        counter por contador.
+        """
+        snapshot = self.snapshot()
+        name = f"{PROMETHEUS_PREFIX}_span_seconds"
+        lines = [f"# TYPE {name} summary"]
+        for span, summary in snapshot["spans"].items():
+            for quantile, key in QUANTILES:
+                if key in summary:
+                    lines.append(f'{name}{{span="{span}",quantile="{quantile}"}} {summary[key] / 1000.0:.6f}')
+            lines.append(f'{name}_sum{{span="{span}"}} {summary["sum_ms"] / 1000.0:.6f}')
+            lines.append(f'{name}_count{{span="{span}"}} {summary["count"]}')
+        for counter, value in snapshot["counters"].items():
+            metric = f"{PROMETHEUS_PREFIX}_{counter}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def span(name):
+    return METRICS.span(name)
+
+
+def observe(name, seconds):
+    METRICS.observe(name, seconds)
+
+
+def incr(name, value=1):
+    METRICS.incr(name, value)
+
+
+def enable(log_level=logging.INFO):
+    METRICS.enabled = True
+    log.setLevel(log_level)
+
+
+def disable():
+    """
+    Desactiva spans, contadores y todos los mensajes de los loggers 'v3d.*'.
+    """
+    METRICS.enabled = False
+    log.setLevel(logging.CRITICAL + 1)
+
+
+class PrometheusExporter:
+    """
+    Servidor HTTP en un hilo de fondo que expone METRICS en /metrics. Solo
+    trabaja cuando alguien lo consulta. Por defecto escucha solo en local;
+    para que lo consulte un Prometheus de otra máquina hay que pasar host
+    explícitamente (p. ej. "0.0.0.0").
+    """
+
+    def __init__(self, metrics=METRICS, host="127.0.0.1", port=9108):
+        self.metrics = metrics
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = exporter.metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        log.info(f"📈 Métricas en http://{self.host}:{self.port}/metrics")
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class JsonExporter:
+    """
+    Escribe periódicamente METRICS.snapshot() en un fichero JSON. La
+    escritura es atómica (fichero temporal + rename) para que otro proceso
+    pueda leerlo en cualquier momento.
+    """
+
+    def __init__(self, path, metrics=METRICS, interval=5.0):
+        self.path = path
+        self.metrics = metrics
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.metrics.snapshot(), f, indent=2)
+        os.replace(tmp, self.path)
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.write()
@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class ConstantVelocityKalman:
+    """
+    Filtro de Kalman de velocidad constante para un punto de dimensión dim.
+    El estado es [posición, velocidad]; solo se mide la posición.
+    """
+
+    def __init__(self, dim=3, process_noise=1.0, measurement_noise=0.01):
+        self.dim = dim
+        self.process_noise = process_noise
+        self.R = np.eye(dim) * measurement_noise
+        self.H = np.hstack((np.eye(dim), np.zeros((dim, dim))))
+        self.x = None
+        self.P = None
+
+    @property
+    def initialized(self):
+        return self.x is not None
+
+    @property
+    def position(self):
+        return self.x[:self.dim].copy()
+
+    @property
+    def velocity(self):
+        return self.x[self.dim:].copy()
+
+    def reset(self, position, velocity=None, velocity_std=1.0):
+        """
+        Reinicia el estado en position. velocity_std (unidades/s) es la
+        incertidumbre inicial de la velocidad.
+        """
+        self.x = np.zeros(2 * self.dim)
+        self.x[:self.dim] = position
+        if velocity is not None:
+            self.x[self.dim:] = velocity
+        self.P = np.eye(2 * self.dim)
+        self.P[self.dim:, self.dim:] *= velocity_std ** 2
+
+    def _transition(self, dt):
+        F = np.eye(2 * self.dim)
+        F[:self.dim, self.dim:] = np.eye(self.dim) * dt
+        # Ruido de aceleración blanca discretizado
+        q = self.process_noise
+        Q = np.zeros((2 * self.dim, 2 * self.dim))
+        Q[:self.dim, :self.dim] = np.eye(self.dim) * q * dt ** 4 / 4
+        Q[:self.dim, self.dim:] = np.eye(self.dim) * q * dt ** 3 / 2
+        Q[self.dim:, :self.dim] = np.eye(self.dim) * q * dt ** 3 / 2
+        Q[self.dim:, self.dim:] = np.eye(self.dim) * q * dt ** 2
+        return F, Q
+
+    def predict(self, dt):
+        F, Q = self._transition(dt)
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + Q
+        return self.position
+
+    def peek(self, dt):
+        """
+        Posición extrapolada dt segundos sin modificar el estado.
+        """
+        return self.x[:self.dim] + self.x[self.dim:] * dt
+
+    def mahalanobis(self, z):
+        """
+        Distancia de Mahalanobis al cuadrado de la medida z respecto a la
+        predicción, con la covarianza de la innovación (P proyectada + R).
+        Crece con la incertidumbre acumulada: pasos de tiempo largos o
+        velocidad mal conocida admiten medidas más alejadas.
+        """
+        y = np.asarray(z, dtype=np.float64) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        return float(y @ np.linalg.solve(S, y))
+
+    def update(self, z):
+        y = np.asarray(z, dtype=np.float64) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(2 * self.dim) - K @ self.H) @ self.P
+        return self.position
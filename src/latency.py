@@ -0,0 +1,46 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class LatencyStats:
+    """
+    Ventana deslizante de latencias (en segundos) con resumen en percentiles.
+    Es segura para usarse desde varios hilos.
+    """
+
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def summary(self):
+        """
+        Devuelve un diccionario con número de muestras, media, p50, p95, p99
+        y máximo en milisegundos sobre la ventana actual. count y sum_ms
+        acumulan todas las muestras desde el inicio, no solo las de la ventana.
+        """
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64) * 1000.0
+            count = self.count
+            total = self.total
+        if samples.size == 0:
+            return {"count": count, "sum_ms": total * 1000.0}
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {
+            "count": count,
+            "sum_ms": total * 1000.0,
+            "mean_ms": float(samples.mean()),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "max_ms": float(samples.max()),
+        }
@@ -0,0 +1,146 @@
+"""
+Control de carga del bucle en vivo. Para el control de los robots importa
+más cumplir el plazo que procesar todos los frames, así que LoadController
+intenta mantener la latencia extremo a extremo (captura -> publicación)
+dentro de latency_budget:
+
+- Ritmo de captura: el intervalo entre capturas sigue al tiempo de proceso
+  medido por frame (con un margen headroom) y se alarga mientras haya
+  pares acumulados en la cola, para no gastar CPU capturando y decodificando
+  frames que se van a descartar.
+- Degradación por niveles (levels): si la latencia media supera el
+  presupuesto se pasa al siguiente nivel (manos solo cada n frames,
+  inferencia de la pelota a menor resolución); cuando baja de relax veces el
+  presupuesto se vuelve al anterior. Entre cambios se esperan hold
+  resultados para que se note el efecto del anterior.
+
+El consumidor debe además tomar siempre el par más reciente
+(StereoFrameQueue.get_latest).
+"""
+import logging
+import threading
+import time
+
+import instrumentation
+
+log = logging.getLogger("v3d.load")
+
+# (etapa de manos cada n frames, imgsz de la pelota), de menos a más degradado
+DEFAULT_LEVELS = ((1, None), (2, None), (2, 480), (2, 320))
+MAX_BACKOFF = 4.0
+
+
+class LoadController:
+    """
+    Ajuste del ritmo de captura y de la degradación según la latencia.
+
+    - observe(result): incorpora un PipelineResult entregado.
+    - observe_queue(depth): pares pendientes en la cola antes de tomar uno.
+    - settings(): (skip_hands, imgsz) para el siguiente par a procesar.
+    - pace(): en el hilo de captura, espera hasta la siguiente captura.
+
+    parallelism es el número de pares que el pipeline procesa a la vez en
+    régimen (hilos de la etapa más lenta). Es seguro usarlo desde los hilos
+    de captura, proceso y publicación a la vez.
+    """
+
+    def __init__(self, latency_budget=0.15, min_interval=1 / 30, max_interval=0.5, levels=DEFAULT_LEVELS,
+                 parallelism=1, smoothing=0.2, hold=10, relax=0.5, headroom=1.2):
+        self.latency_budget = latency_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.levels = tuple(levels)
+        self.parallelism = parallelism
+        self.smoothing = smoothing
+        self.hold = hold
+        self.relax = relax
+        self.headroom = headroom
+
+        self.level = 0
+        self.capture_interval = min_interval
+        self.latency = None
+        self.service = None
+        self.deadline_misses = 0
+        self._backoff = 1.0
+        self._since_change = 0
+        self._count = 0
+        self._next_capture = None
+        self._lock = threading.Lock()
+
+    def _ewma(self, previous, value):
+        return value if previous is None else previous + self.smoothing * (value - previous)
+
+    def observe(self, result):
+        latency = time.time() - result.frame.timestamp
+        # Tiempo de la etapa más lenta: las dos se ejecutan en paralelo
+        service = max(result.latencias.get("hand", 0.0), result.latencias.get("ball", 0.0))
+        if latency > self.latency_budget:
+            self.deadline_misses += 1
+            instrumentation.incr("deadline_misses")
+        with self._lock:
+            self.latency = self._ewma(self.latency, latency)
+            self.service = self._ewma(self.service, service)
+            self._since_change += 1
+            self._adapt_level()
+            self._update_interval()
+
+    def observe_queue(self, depth):
+        with self._lock:
+            if depth > 0:
+                # Se captura más rápido de lo que se procesa
+                self._backoff = min(self._backoff * 1.25, MAX_BACKOFF)
+            else:
+                self._backoff = max(self._backoff * 0.95, 1.0)
+            self._update_interval()
+
+    def _adapt_level(self):
+        if self._since_change < self.hold:
+            return
+        if self.latency > self.latency_budget and self.level < len(self.levels) - 1:
+            self._set_level(self.level + 1)
+        elif self.latency < self.relax * self.latency_budget and self.level > 0:
+            self._set_level(self.level - 1)
+
+    def _set_level(self, level):
+        hand_every, imgsz = self.levels[level]
+        log.info(f"🎚️ Nivel de carga {self.level} -> {level} (latencia {self.latency * 1000:.0f} ms, "
+                 f"manos cada {hand_every} frames, imgsz {imgsz or 'por defecto'})")
+        self.level = level
+        self._since_change = 0
+
+    def _update_interval(self):
+        base = 0.0 if self.service is None else self.service * self.headroom / self.parallelism
+        self.capture_interval = min(max(base * self._backoff, self.min_interval), self.max_interval)
+
+    def settings(self):
+        """
+        Devuelve (skip_hands, imgsz) para el siguiente par según el nivel actual.
+        """
+        with self._lock:
+            hand_every, imgsz = self.levels[self.level]
+            skip_hands = self._count % hand_every != 0
+            self._count += 1
+        if skip_hands:
+            instrumentation.incr("hands_skipped")
+        return skip_hands, imgsz
+
+    def pace(self):
+        """
+        Espera, si hace falta, a que pase capture_interval desde la captura
+        anterior.
+        """
+        now = time.perf_counter()
+        if self._next_capture is not None and now < self._next_capture:
+            time.sleep(self._next_capture - now)
+            now = self._next_capture
+        self._next_capture = now + self.capture_interval
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "level": self.level,
+                "capture_interval_ms": self.capture_interval * 1000,
+                "latency_ms": None if self.latency is None else self.latency * 1000,
+                "service_ms": None if self.service is None else self.service * 1000,
+                "deadline_misses": self.deadline_misses,
+            }
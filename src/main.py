@@ -1,128 +1,275 @@
+import logging
 import os
 import cv2
-import pyzed.sl as sl
 import time
+import numpy as np
+import instrumentation
 from yolo_detector import BallDetector
 from mediapipe_detector import FingerCounter
 from communication.mqtt_client import MQTTClient
-import paho.mqtt.client as mqtt
+from communication.publisher import AsyncPublisher
+from frame_queue import StereoFrameQueue
+from frame_archiver import DiskArchiver
+from recording import SessionStore, StereoRecorder
+from frame_sources import ZEDSource
+from pipeline import StereoPipeline
+from ball_tracker import ROIBallTracker
+from ball_batcher import BatchedBallDetector
+from load_control import LoadController
+from depth_localization import DepthBallLocator, ZEDCloudCalibration
+from startup import StartupError, StartupTimer
+from track_smoothing import BallTrackSmoother
+from stereo_frame import StereoFrame
 import threading 
 
+log = logging.getLogger("v3d.main")
+
+# Resolución del frame de calentamiento (HD1080); la real se conoce al abrir la cámara
+WARM_UP_SHAPE = (1080, 1920, 3)
+# Espera máxima (s) por un hueco libre de la cola antes de volver al bucle de captura
+RESERVE_TIMEOUT = 0.05
+# Parte del presupuesto de latencia que puede esperar un par a que se llene su lote
+BATCH_WAIT_BUDGET_FRACTION = 0.25
+
 class ZEDCamera():
     """
-    Cámara ZED2 para capturar imágenes y guardarlas en un directorio.
+    Cámara ZED2 que captura pares estéreo y los entrega en memoria a los
+    detectores mediante una cola acotada. Opcionalmente archiva los pares en
+    disco de forma asíncrona: como ficheros sueltos en left_path/right_path
+    (archive) o en una sesión indexada en recording_path (ver recording).
+
+    Al arrancar, la cámara, los modelos (creación y una inferencia de
+    calentamiento por hilo) y la conexión MQTT se inician en paralelo;
+    self.startup guarda el desglose de tiempos.
+
+    localization elige cómo se obtiene la posición 3D de la pelota:
+    'triangulation' detecta en ambas vistas y triangula; 'depth' detecta solo
+    en la izquierda y usa la nube de puntos de la ZED (ver depth_localization).
+
+    Con track_smoothing las posiciones pasan por un filtro de Kalman por
+    pelota (track_smoothing.BallTrackSmoother) y se publica en cada frame,
+    también durante pérdidas breves de detección, el estado suavizado
+    extrapolado al instante de envío.
+
+    Con latency_budget (segundos) un LoadController mantiene la latencia de
+    captura a publicación dentro del presupuesto: se procesa siempre el par
+    más reciente, el ritmo de captura sigue al de proceso y, si no basta, se
+    omite la etapa de manos en frames alternos y se baja la resolución de
+    inferencia de la pelota. Con None se procesan todos los pares en orden.
+
+    Con ball_batch_size > 1 (desactivado por defecto) la etapa de pelota
+    agrupa hasta ball_batch_size pares en una sola llamada a YOLO (ver
+    ball_batcher). Cada par espera como mucho ball_batch_max_wait segundos,
+    limitado a BATCH_WAIT_BUDGET_FRACTION de latency_budget, y se usan al
+    menos ball_batch_size hilos de pelota y pares en proceso para poder
+    llenar los lotes. Solo con localization='triangulation' sin roi_tracking.
     """
 
-    def __init__(self, camera_name, fps, left_path, right_path):
+    def __init__(self, camera_name, fps, left_path, right_path,
+                 queue_capacity=4, backpressure="drop_oldest", archive=True,
+                 hand_workers=1, ball_workers=1, max_in_flight=2, roi_tracking=False,
+                 hand_video_mode=False, ball_backend="ultralytics", warm_up=True,
+                 localization="triangulation", track_smoothing=True, recording_path=None,
+                 latency_budget=0.15, ball_batch_size=1, ball_batch_max_wait=0.02):
+        self.startup = StartupTimer()
         self.name = 'camera_' + camera_name
         self.fps = fps
         self.left_path = left_path
         self.right_path = right_path
         self.img_count = 0
 
-        self.yolo_detector = BallDetector()
-        self.finger_counter = FingerCounter()
+        # Etapas de manos y pelota en paralelo; cada hilo crea su propio detector
+        # Con roi_tracking, YOLO solo analiza un recorte alrededor de la posición predicha
+        # ball_backend: 'ultralytics', 'onnx' u 'openvino' (inferencia ONNX en CPU)
+        detector_factory = lambda: BallDetector(backend=ball_backend)
+        self.zed_calibration = ZEDCloudCalibration()
+        if localization == "depth":
+            if roi_tracking:
+                raise ValueError("roi_tracking solo está disponible con localization='triangulation'")
+            # Los detectores se crean mientras se abre la cámara: la calibración de fábrica de
+            # la ZED (distancia entre cámaras y rectificación) se completa al abrirla
+            ball_factory = lambda: DepthBallLocator(detector_factory(), mode="zed",
+                                                    zed_calibration=self.zed_calibration)
+        elif localization == "triangulation":
+            ball_factory = (lambda: ROIBallTracker(detector_factory())) if roi_tracking else detector_factory
+        else:
+            raise ValueError(f"Localización desconocida: {localization}")
+        # El seguimiento por ROI guarda estado entre frames: un único hilo de pelota
+        if roi_tracking:
+            ball_workers = 1
+        self.ball_batcher = None
+        if ball_batch_size > 1:
+            if roi_tracking or localization != "triangulation":
+                raise ValueError("ball_batch_size solo está disponible con localization='triangulation' "
+                                 "sin roi_tracking")
+            if latency_budget is not None and ball_batch_max_wait > BATCH_WAIT_BUDGET_FRACTION * latency_budget:
+                ball_batch_max_wait = BATCH_WAIT_BUDGET_FRACTION * latency_budget
+                log.warning(f"⚠️ Espera máxima de lote limitada a {ball_batch_max_wait * 1000:.0f} ms "
+                            f"por el presupuesto de latencia")
+            batcher_lock = threading.Lock()
+
+            # Todos los hilos de pelota comparten el agrupador; su detector se crea una sola vez
+            def ball_factory():
+                with batcher_lock:
+                    if self.ball_batcher is None:
+                        self.ball_batcher = BatchedBallDetector(detector_factory(), ball_batch_size,
+                                                                ball_batch_max_wait)
+                    return self.ball_batcher
+
+            ball_workers = max(ball_workers, ball_batch_size)
+            max_in_flight = max(max_in_flight, ball_batch_size)
+        # El modo vídeo de MediaPipe necesita los frames en orden: un único hilo de manos
+        if hand_video_mode:
+            hand_factory = lambda: FingerCounter(modo_video=True)
+            hand_workers = 1
+        else:
+            hand_factory = FingerCounter
+        self.pipeline = StereoPipeline(hand_factory, ball_factory, hand_workers=hand_workers,
+                                       ball_workers=ball_workers, max_in_flight=max_in_flight)
+        self.controller = None
+        if latency_budget is not None:
+            self.controller = LoadController(latency_budget, min_interval=1.0 / fps,
+                                             parallelism=min(hand_workers, ball_workers, max_in_flight))
         self.mqtt_object = MQTTClient()
-        self.mqtt_object._connect()
-        while not self.mqtt_object.client.is_connected(): 
-            print(self.mqtt_object.client.is_connected())
-            time.sleep(1)
-
-        # Crea el directorio si no existe
-        #if not os.path.exists(self.path):
-        #    os.makedirs(self.path)
-
-        # Inicializa la cámara ZED
-        self.cam = sl.Camera()
-        init_params = sl.InitParameters()
-        init_params.camera_resolution = sl.RESOLUTION.HD1080  # Resolución HD1080
-        init_params.depth_mode = sl.DEPTH_MODE.ULTRA  # Modo de profundidad
-        init_params.coordinate_units = sl.UNIT.METER
-        init_params.camera_fps = self.fps
-        status = self.cam.open(init_params)
-        if status != sl.ERROR_CODE.SUCCESS:
-            print("Error al abrir la cámara ZED2")
+        # Publicación asíncrona: un mensaje por frame con posición, dedos y marca temporal
+        self.smoother = BallTrackSmoother() if track_smoothing else None
+        self.publisher = AsyncPublisher(self.mqtt_object, smoother=self.smoother)
+
+        # Cámara, modelos y broker en paralelo. connect() no bloquea: reconexión
+        # con backoff y buffer mientras no haya broker
+        tareas = {
+            # La profundidad de la ZED solo se calcula si se va a usar
+            "camera": lambda: ZEDSource(resolution="HD1080", fps=self.fps,
+                                        depth_mode="ULTRA" if localization == "depth" else "NONE",
+                                        point_cloud=localization == "depth"),
+            "mqtt": self.mqtt_object.connect,
+        }
+        if warm_up:
+            blank = np.zeros(WARM_UP_SHAPE, dtype=np.uint8)
+            tareas["models"] = lambda: self.pipeline.warm_up(StereoFrame(-1, time.time(), blank, blank))
+        try:
+            self.source = self.startup.run_concurrently(tareas)["camera"]
+        except StartupError as exc:
+            fase = {"camera": "abrir la cámara ZED2", "models": "cargar los modelos",
+                    "mqtt": "conectar con el broker MQTT"}.get(exc.phase, exc.phase)
+            log.error(f"Error al {fase}: {exc.__cause__}")
             exit(1)
 
-    def capture_images(self):
-        runtime = sl.RuntimeParameters()
-        mat = sl.Mat()
+        self.zed_calibration.configure(self.source.baseline, self.source.rectification_rotation)
 
+        self.frames = StereoFrameQueue(self.source.shape,
+                                       capacity=queue_capacity, policy=backpressure)
+        self.archiver = DiskArchiver(left_path, right_path) if archive else None
+        self.recorder = StereoRecorder(recording_path) if recording_path is not None else None
+        self.startup.log_report()
+
+    def capture_images(self):
         key = -1  # Inicializamos la tecla para evitar que entre en el loop
 
         while key != 113:  # 'q' para salir
-            err = self.cam.grab(runtime)
-            if err == sl.ERROR_CODE.SUCCESS:
-                # Captura la imagen de la cámara ZED2
-                for orientation in ["l", "r"]:
-                    if orientation == "l": 
-                        self.cam.retrieve_image(mat, sl.VIEW.LEFT)
-                        filename = os.path.join(self.left_path, f"img_{self.img_count:06d}.jpg")
-                    else: 
-                        self.cam.retrieve_image(mat, sl.VIEW.RIGHT)
-                        filename = os.path.join(self.right_path, f"img_{self.img_count:06d}.jpg")
-                    cvImage = mat.get_data()  # Convierte a formato compatible con OpenCV
-
-                    cv2.imwrite(filename, cvImage)
-                    print(f"Imagen guardada como {filename}")
-                self.img_count += 1
-                time.sleep(1)
-
+            # Ritmo de captura ajustado a lo que da tiempo a procesar
+            if self.controller is not None:
+                self.controller.pace()
+            # Reserva un hueco de la cola y la cámara escribe el par directamente en él. Si el
+            # consumidor retiene todos, se espera a que libere uno (sin girar en vacío) y se
+            # vuelve a atender la ventana
+            slot = self.frames.reserve(timeout=RESERVE_TIMEOUT)
+            if slot is not None:
+                index, left, right = slot
+                grabbed = self.source.grab_into(left, right)
+                if grabbed is None:
+                    self.frames.cancel(index)
+                    log.error(f"Error al capturar la imagen: {self.source.last_error}")
+                    break
+                _, timestamp = grabbed
 
+                if self.archiver is not None:
+                    self.archiver.submit(self.img_count, left, right)
+                if self.recorder is not None:
+                    self.recorder.submit(self.img_count, timestamp, left, right)
+                self.frames.commit(index, self.img_count, timestamp, self.source.point_cloud)
+                self.img_count += 1
 
                 # Muestra la imagen en una ventana
-                cv2.imshow("ZED Camera - Live Feed", cvImage)
-                key = cv2.waitKey(1)  # Espera por 1 ms para una tecla
-            else:
-                print(f"Error al capturar la imagen: {err}")
-                break
+                cv2.imshow("ZED Camera - Live Feed", right)
+            key = cv2.waitKey(1)  # Espera por 1 ms para una tecla
 
         # Libera los recursos
-        self.cam.close()
+        self.frames.close()
+        if self.archiver is not None:
+            self.archiver.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.source.close()
         cv2.destroyAllWindows()
 
     def process(self): 
-        IMG_COUNT = 0 
         while True: 
-            #time.sleep(1)
-            left_image_name = f"img_{IMG_COUNT:06d}.jpg"
-            right_image_name = f"img_{IMG_COUNT:06d}.jpg"
-
-            left_image_path = os.path.join(self.left_path, left_image_name)
-            right_image_path = os.path.join(self.right_path, right_image_name)
-            if os.path.exists(left_image_path) and os.path.exists(right_image_path):
-                # Procesar ambas imágenes si existen
-                fingers, annotated_img = self.finger_counter.count_fingers(left_image_path)
-                ruta_completa = os.path.join("pelota", f"img_{IMG_COUNT:06d}.jpg")
-                #cv2.imwrite(ruta_completa, annotated_img)
-                #print(f"Guardando imagen en {ruta_completa}")
-                centroide = self.yolo_detector.detect_stereo_ball_position(left_image_path, right_image_path)
-                print(fingers, centroide)
-                if fingers and centroide:
-                    print(f"📡 Publicando -> Dedos: {fingers}, Centroide: {centroide}")
-                    self.mqtt_object.publish_position(*centroide)
-                    self.mqtt_object.publish_fingers(fingers)
-                else:
-                    print("🙌 No se detectaron manos o posición")
-
-                IMG_COUNT += 1
+            if self.controller is None:
+                frame = self.frames.get()
+                if frame is None:
+                    break
+                # Bloquea solo si ya hay max_in_flight pares en inferencia
+                self.pipeline.submit(frame, self._publish)
+                continue
+            # Primero se espera a tener sitio y después se toma el par más reciente
+            self.pipeline.wait_for_capacity()
+            self.controller.observe_queue(len(self.frames))
+            frame = self.frames.get_latest()
+            if frame is None:
+                break
+            skip_hands, imgsz = self.controller.settings()
+            self.pipeline.submit(frame, self._publish, skip_hands=skip_hands, imgsz=imgsz)
+        self.pipeline.close()
+        if self.ball_batcher is not None:
+            self.ball_batcher.close()
+        self.publisher.close()
+        log.info(f"⏱️ Latencias: {self.pipeline.report()}")
+        log.info(f"📡 Publicación: {self.publisher.metrics()}, MQTT: {self.mqtt_object.health()}")
+        log.info(f"📈 Métricas: {instrumentation.METRICS.snapshot()}")
+        if self.controller is not None:
+            log.info(f"🎚️ Control de carga: {self.controller.snapshot()}, descartados por antiguos: {self.frames.stale}")
+        self.mqtt_object.flush(timeout=5)
+        self.mqtt_object.disconnect()
+
+    def _publish(self, result):
+        self.frames.release(result.frame)
+        if self.controller is not None:
+            self.controller.observe(result)
+        fingers, centroide = result.fingers, result.centroide
+        if result.error is not None:
+            log.warning(f"⚠️ Error procesando el frame {result.frame.frame_id}: {result.error}")
+        if self.smoother is not None:
+            # Medidas en float y unidades de la calibración, con la marca temporal de captura.
+            # Con roi_tracking se pasa la medida sin filtrar para no encadenar dos filtros de Kalman
+            self.smoother.update(result.frame.timestamp,
+                                 [pista.get('medida', pista['posicion']) for pista in result.pistas])
+        if fingers or centroide or self.smoother is not None:
+            self.publisher.publish(result.frame.frame_id, result.frame.timestamp,
+                                   centroide or None, fingers if fingers else None)
 
 # Crear una instancia de la clase ZEDCamera
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # Spans y contadores en formato Prometheus, solo si se pide con V3D_METRICS_PORT
+    # (p. ej. 9108); V3D_METRICS_HOST=0.0.0.0 para exponerlos fuera de la máquina
+    exporter = None
+    if os.environ.get("V3D_METRICS_PORT"):
+        exporter = instrumentation.PrometheusExporter(host=os.environ.get("V3D_METRICS_HOST", "127.0.0.1"),
+                                                      port=int(os.environ["V3D_METRICS_PORT"])).start()
+
     # Nombre de la cámara, FPS y carpeta de guardado
     camera_name = "ZED2"
-    fps = 0.01  # FPS de la cámara
-    save_left_path = "../data/captures/images_left"  # Directorio para guardar las imágenes
-    save_right_path = "../data/captures/images_right"
-    for dir in [save_left_path, save_right_path]: 
-        for filename in os.listdir(dir):
-            file_path = os.path.join(dir, filename)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-
+    fps = 30  # FPS de la cámara; el ritmo real lo ajusta el control de carga
+    # Cada ejecución graba en una sesión nueva de data/recordings; las antiguas
+    # se borran enteras en segundo plano
+    store = SessionStore()
+    session_path = store.new_session()
+    # Después de crearla, para que la sesión nueva cuente entre las keep conservadas
+    store.rotate(keep=5)
 
     # Crear objeto de cámara ZED
-    zed_camera = ZEDCamera(camera_name, fps, save_left_path, save_right_path)
+    zed_camera = ZEDCamera(camera_name, fps, None, None, archive=False, recording_path=session_path)
 
 
     hilo1 = threading.Thread(target=zed_camera.capture_images, daemon = True)
@@ -135,5 +282,6 @@ if __name__ == "__main__":
     # Esperar a que ambos hilos terminen
     hilo1.join()
     hilo2.join()
-    # Iniciar la captura de imágenes
-    print("Termine")
+    if exporter is not None:
+        exporter.close()
+    log.info("Termine")
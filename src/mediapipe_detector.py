@@ -1,66 +1,183 @@
 import cv2
-import mediapipe as mp
+import numpy as np
+
+import instrumentation
+from detection_cache import image_key
+
+TIPS_IDS = np.array([4, 8, 12, 16, 20])
+PIP_IDS = np.array([3, 6, 10, 14, 18])
+# Parámetros de Hands; forman parte también de la firma de la caché
+HANDS_PARAMS = {"max_num_hands": 2, "min_detection_confidence": 0.5}
+
 
 class FingerCounter:
-    def __init__(self):
+    """
+    Conteo de dedos de la mano derecha con MediaPipe Hands.
+
+    - modo_video: usa el seguimiento de MediaPipe entre frames consecutivos
+      (static_image_mode=False) en lugar de detectar la palma en cada frame.
+      Requiere que los frames lleguen en orden a la misma instancia y no
+      admite usar_roi: el seguimiento guarda los landmarks en coordenadas
+      normalizadas de la entrada, que dejan de valer si el recorte cambia.
+    - escala: factor de reducción de la imagen antes de la inferencia.
+    - usar_roi: procesa solo un recorte alrededor de la última mano detectada
+      (ampliado en roi_margen veces su tamaño); si no hay mano en el recorte,
+      el siguiente frame vuelve a usar la imagen completa.
+    - anotar: dibuja los landmarks sobre una copia de la imagen. Desactivado
+      por defecto; entonces la imagen devuelta es None.
+    - cache: detection_cache.DetectionCache opcional con los landmarks de
+      cada imagen ya procesada. Solo es compatible con el modo imagen sin
+      recorte, en el que el resultado depende únicamente de la imagen.
+    """
+
+    def __init__(self, modo_video=False, escala=1.0, usar_roi=False, roi_margen=0.5, anotar=False, cache=None):
+        if modo_video and usar_roi:
+            raise ValueError("modo_video no es compatible con usar_roi")
+        if cache is not None and (modo_video or usar_roi):
+            raise ValueError("La caché de detecciones no es compatible con modo_video ni usar_roi")
+        # mediapipe se importa al crear el contador (count_from_landmarks no lo necesita)
+        import mediapipe as mp
         self.mp_hands = mp.solutions.hands
         self.mp_drawing = mp.solutions.drawing_utils
-        self.hands = self.mp_hands.Hands(
-            static_image_mode=True,
-            max_num_hands=2,
-            min_detection_confidence=0.5
-        )
+        self.hands = self.mp_hands.Hands(static_image_mode=not modo_video, **HANDS_PARAMS)
+        self.escala = escala
+        self.usar_roi = usar_roi
+        self.roi_margen = roi_margen
+        self.anotar = anotar
+        self._roi = None
+        self.cache = cache
+        self.cache_namespace = cache.namespace({
+            "detector": "mediapipe_hands", "version": mp.__version__, **HANDS_PARAMS, "escala": escala,
+        }) if cache is not None else None
 
     def count_fingers(self, image_path):
         """
-        Procesa una imagen de OpenCV y devuelve una lista con los conteos de dedos por mano.
-        También devuelve la imagen anotada con los puntos dibujados.
+        Lee la imagen de disco y delega en count_fingers_image.
         """
         image = cv2.imread(image_path)
         if image is None:
             return [], image
+        return self.count_fingers_image(image)
 
-        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        resultados = self.hands.process(rgb)
+    def count_fingers_frame(self, frame):
+        """
+        Cuenta los dedos sobre la vista izquierda de un StereoFrame.
+        """
+        return self.count_fingers_image(frame.left)
 
-        if resultados.multi_hand_landmarks:
-            for idx, hand_info in enumerate(resultados.multi_handedness):
-                hand_label = hand_info.classification[0].label
-                if hand_label == 'Right':
-                    hand_landmarks = resultados.multi_hand_landmarks[idx]
+    def count_fingers_image(self, image):
+        """
+        Procesa una imagen de OpenCV (BGR) ya decodificada y devuelve el número
+        de dedos de la mano derecha junto con una copia anotada de la imagen
+        (None si anotar está desactivado). La imagen de entrada no se modifica.
+        """
+        landmarks, labels, raw, (x0, y0, x1, y1) = self.detect_hands(image)
+        if not labels:
+            instrumentation.incr("hand_misses")
+            return 0, None
 
-                    # Dibuja anotaciones de la mano
+        # Conteo de todas las manos en una sola operación vectorizada
+        counts = self.count_from_landmarks(landmarks, labels)
+        for idx, hand_label in enumerate(labels):
+            if hand_label == 'Right':
+                annotated = None
+                if self.anotar:
+                    # Se dibuja sobre una copia: la imagen puede ser un buffer
+                    # compartido con otros detectores
+                    annotated = image.copy()
                     self.mp_drawing.draw_landmarks(
-                        image, hand_landmarks, self.mp_hands.HAND_CONNECTIONS)
-
-                    # Contar dedos
-                    count = self.count_from_landmarks(hand_landmarks, hand_label)
-                    return count, image
+                        annotated[y0:y1, x0:x1], raw[idx], self.mp_hands.HAND_CONNECTIONS)
+                return int(counts[idx]), annotated
         return 0, None
 
-    def count_from_landmarks(self, hand_landmarks, hand_label):
-        tips_ids = [4, 8, 12, 16, 20]
-        pip_ids = [3, 6, 10, 14, 18]
-        coords = [(lm.x, lm.y) for lm in hand_landmarks.landmark]
-
-        dedos_abiertos = 0
-        tip_x, _ = coords[tips_ids[0]]
-        pip_x, _ = coords[pip_ids[0]]
-
-        if hand_label == 'Right':
-            if tip_x > pip_x:
-                dedos_abiertos += 1
-        else:
-            if tip_x < pip_x:
-                dedos_abiertos += 1
-
-        for i in range(1, 5):
-            tip_y = coords[tips_ids[i]][1]
-            pip_y = coords[pip_ids[i]][1]
-            if tip_y < pip_y:
-                dedos_abiertos += 1
-
-        return dedos_abiertos
+    def detect_hands(self, image):
+        """
+        Ejecuta MediaPipe (con reducción y recorte opcionales) y devuelve
+        (landmarks, etiquetas, landmarks_mediapipe, roi). landmarks es un array
+        (N, 21, 3) en coordenadas normalizadas de la imagen completa y roi la
+        región (x0, y0, x1, y1) procesada, en píxeles.
+        """
+        if self.cache is None:
+            return self._detect_hands(image)
+        key = image_key(image)
+        entrada = self.cache.get(self.cache_namespace, key)
+        if entrada is None:
+            landmarks, labels, raw, roi = self._detect_hands(image)
+            self.cache.put(self.cache_namespace, key, landmarks=landmarks, labels=np.array(labels, dtype=str))
+            return landmarks, labels, raw, roi
+        h, w = image.shape[:2]
+        landmarks = entrada["landmarks"]
+        raw = self._landmark_lists(landmarks) if self.anotar else []
+        return landmarks, entrada["labels"].tolist(), raw, (0, 0, w, h)
+
+    def _detect_hands(self, image):
+        h, w = image.shape[:2]
+        x0, y0, x1, y1 = self._roi if (self.usar_roi and self._roi is not None) else (0, 0, w, h)
+        entrada = image[y0:y1, x0:x1]
+        if self.escala != 1.0:
+            entrada = cv2.resize(entrada, None, fx=self.escala, fy=self.escala, interpolation=cv2.INTER_AREA)
+
+        with instrumentation.span("mediapipe"):
+            rgb = cv2.cvtColor(entrada, cv2.COLOR_BGR2RGB)
+            resultados = self.hands.process(rgb)
+
+        if not resultados.multi_hand_landmarks:
+            self._roi = None
+            return np.empty((0, 21, 3)), [], [], (x0, y0, x1, y1)
+
+        raw = list(resultados.multi_hand_landmarks)
+        labels = [info.classification[0].label for info in resultados.multi_handedness]
+        landmarks = np.array([[(lm.x, lm.y, lm.z) for lm in hand.landmark] for hand in raw])
+        # De coordenadas normalizadas del recorte a normalizadas de la imagen completa
+        landmarks[..., 0] = (x0 + landmarks[..., 0] * (x1 - x0)) / w
+        landmarks[..., 1] = (y0 + landmarks[..., 1] * (y1 - y0)) / h
+
+        if self.usar_roi:
+            self._roi = self._roi_from_landmarks(landmarks, w, h)
+        return landmarks, labels, raw, (x0, y0, x1, y1)
+
+    @staticmethod
+    def _landmark_lists(landmarks):
+        # Landmarks de MediaPipe (para dibujar) a partir de los guardados en la caché
+        from mediapipe.framework.formats import landmark_pb2
+        return [landmark_pb2.NormalizedLandmarkList(landmark=[
+            landmark_pb2.NormalizedLandmark(x=x, y=y, z=z) for x, y, z in hand.tolist()]) for hand in landmarks]
+
+    def _roi_from_landmarks(self, landmarks, width, height):
+        xy = landmarks[..., :2].reshape(-1, 2) * (width, height)
+        (min_x, min_y), (max_x, max_y) = xy.min(axis=0), xy.max(axis=0)
+        margen = self.roi_margen * max(max_x - min_x, max_y - min_y)
+        x0 = int(max(min_x - margen, 0))
+        y0 = int(max(min_y - margen, 0))
+        x1 = int(min(max_x + margen, width))
+        y1 = int(min(max_y + margen, height))
+        if x1 - x0 < 32 or y1 - y0 < 32:
+            return None
+        return x0, y0, x1, y1
+
+    @staticmethod
+    def count_from_landmarks(landmarks, hand_label):
+        """
+        Cuenta los dedos extendidos. Acepta un landmark de MediaPipe con su
+        etiqueta, o un array (21, 2+) / (N, 21, 2+) con una etiqueta o una
+        lista de N etiquetas ('Right'/'Left'); en ese caso devuelve un array
+        con el conteo de cada mano calculado en una sola operación.
+        """
+        if hasattr(landmarks, 'landmark'):
+            landmarks = np.array([(lm.x, lm.y) for lm in landmarks.landmark])
+        coords = np.asarray(landmarks, dtype=np.float64)[..., :2]
+        single = coords.ndim == 2
+        if single:
+            coords = coords[np.newaxis]
+        is_right = np.broadcast_to(np.asarray(hand_label) == 'Right', coords.shape[:1])
+
+        # Pulgar: comparación en x según la mano; resto: punta por encima del PIP
+        thumb_tip, thumb_pip = coords[:, TIPS_IDS[0], 0], coords[:, PIP_IDS[0], 0]
+        pulgar = np.where(is_right, thumb_tip > thumb_pip, thumb_tip < thumb_pip)
+        otros = (coords[:, TIPS_IDS[1:], 1] < coords[:, PIP_IDS[1:], 1]).sum(axis=1)
+        dedos_abiertos = pulgar.astype(int) + otros
+
+        return int(dedos_abiertos[0]) if single else dedos_abiertos
 
     def close(self):
         self.hands.close()
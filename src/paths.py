@@ -0,0 +1,13 @@
+import os
+import sys
+
+# Rutas absolutas del repositorio, independientes del directorio de trabajo
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SRC_DIR)
+DATA_DIR = os.path.join(REPO_ROOT, "data")
+CALIBRATION_PKG_DIR = os.path.join(REPO_ROOT, "calibration")
+
+# El paquete de calibración usa imports planos; se añade al path para poder
+# compartir su cargador de calibración (calibration_bundle) con src/
+if CALIBRATION_PKG_DIR not in sys.path:
+    sys.path.append(CALIBRATION_PKG_DIR)
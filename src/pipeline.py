@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+from latency import LatencyStats
+
+WARM_UP_TIMEOUT = 120.0  # segundos de espera a que arranquen todos los hilos de una etapa
+
+
+class PipelineResult:
+    """
+    Resultado combinado de las etapas de manos y pelota para un StereoFrame.
+    Si la etapa de manos se omitió (hands_skipped), fingers repite el último
+    conteo entregado. imgsz es la resolución de inferencia pedida para la
+    pelota (None: la del detector).
+    """
+
+    __slots__ = ("frame", "fingers", "centroide", "pistas", "latencias", "error", "hands_skipped", "imgsz")
+
+    def __init__(self, frame, hands_skipped=False, imgsz=None):
+        self.frame = frame
+        self.fingers = 0
+        self.centroide = []
+        self.pistas = []
+        self.latencias = {}
+        self.error = None
+        self.hands_skipped = hands_skipped
+        self.imgsz = imgsz
+
+
+class StereoPipeline:
+    """
+    Planificador que ejecuta en paralelo la etapa de manos (MediaPipe) y la de
+    pelota (YOLO) para cada par estéreo. Cada etapa tiene su propio pool de
+    hilos y cada hilo crea su propia instancia del detector, ya que ni
+    MediaPipe ni YOLO admiten llamadas concurrentes sobre el mismo objeto.
+
+    Hasta max_in_flight pares pueden estar en proceso a la vez, de modo que la
+    captura del frame N+1 se solapa con la inferencia del frame N. Los
+    resultados se unen por frame_id y se entregan en orden de llegada.
+    """
+
+    def __init__(self, hand_factory, ball_factory, hand_workers=1, ball_workers=1, max_in_flight=2):
+        self._local = threading.local()
+        self._hand_pool = ThreadPoolExecutor(hand_workers, thread_name_prefix="hand",
+                                             initializer=self._init_worker, initargs=(hand_factory,))
+        self._ball_pool = ThreadPoolExecutor(ball_workers, thread_name_prefix="ball",
+                                             initializer=self._init_worker, initargs=(ball_factory,))
+        self._workers = {"hand": hand_workers, "ball": ball_workers}
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        # Entrega serializada: un solo hilo a la vez recoge y entrega los resultados
+        self._delivery_lock = threading.Lock()
+        self._pending = {}
+        self._order = deque()
+        self._last_fingers = 0
+
+        self.stats = {name: LatencyStats() for name in ("hand", "ball", "pipeline", "end_to_end")}
+
+    def _init_worker(self, factory):
+        self._local.detector = factory()
+
+    def warm_up(self, frame):
+        """
+        Arranca todos los hilos de ambas etapas (creando sus detectores en
+        paralelo) y ejecuta una inferencia de prueba sobre frame en cada uno,
+        para que el primer frame real no pague la carga de los modelos.
+        Bloquea hasta terminar y relanza cualquier error de los detectores.
+        """
+        futures = []
+        for name, pool, stage in (("hand", self._hand_pool, self._hand_stage),
+                                  ("ball", self._ball_pool, self._ball_stage)):
+            # La barrera obliga a que cada tarea ocupe un hilo distinto del pool
+            barrier = threading.Barrier(self._workers[name])
+            futures += [pool.submit(self._warm_up_worker, barrier, stage, frame)
+                        for _ in range(self._workers[name])]
+        for future in futures:
+            future.result()
+
+    @staticmethod
+    def _warm_up_worker(barrier, stage, frame):
+        # Si otro hilo no llega (p. ej. su detector falló al crearse) se rompe la barrera
+        barrier.wait(WARM_UP_TIMEOUT)
+        stage(PipelineResult(frame))
+
+    def submit(self, frame, on_result, skip_hands=False, imgsz=None):
+        """
+        Lanza ambas etapas sobre el frame. Bloquea si ya hay max_in_flight
+        pares en proceso. on_result(PipelineResult) se llama cuando el par y
+        todos los anteriores han terminado.
+
+        Para aligerar la carga, skip_hands omite la etapa de manos en este
+        frame e imgsz reduce la resolución de inferencia de la pelota.
+        """
+        self._in_flight.acquire()
+        result = PipelineResult(frame, hands_skipped=skip_hands, imgsz=imgsz)
+        with self._lock:
+            self._pending[frame.frame_id] = [result, 1 if skip_hands else 2, on_result, time.perf_counter()]
+            self._order.append(frame.frame_id)
+
+        if not skip_hands:
+            self._hand_pool.submit(self._run_stage, "hand", frame, self._hand_stage)
+        self._ball_pool.submit(self._run_stage, "ball", frame, self._ball_stage)
+
+    def wait_for_capacity(self, timeout=None):
+        """
+        Espera a que haya sitio para otro par sin ocuparlo. Con un único hilo
+        llamando a submit, el siguiente submit ya no bloquea: así se puede
+        elegir el par a procesar justo antes de enviarlo, no antes de esperar.
+        """
+        if not self._in_flight.acquire(timeout=timeout):
+            return False
+        self._in_flight.release()
+        return True
+
+    def _hand_stage(self, result):
+        fingers, _ = self._local.detector.count_fingers_frame(result.frame)
+        result.fingers = fingers
+
+    def _ball_stage(self, result):
+        # pistas: posiciones en float (unidades de la calibración); centroide: formato publicado
+        detector = self._local.detector
+        if result.imgsz:
+            result.pistas = detector.detect_stereo_balls_frame(result.frame, imgsz=result.imgsz)
+        else:
+            result.pistas = detector.detect_stereo_balls_frame(result.frame)
+        if result.pistas:
+            result.centroide = detector.to_output_units(result.pistas[0]['posicion'])
+
+    def _run_stage(self, name, frame, stage):
+        with self._lock:
+            result = self._pending[frame.frame_id][0]
+        start = time.perf_counter()
+        try:
+            stage(result)
+        except Exception as exc:
+            result.error = exc
+        elapsed = time.perf_counter() - start
+        result.latencias[name] = elapsed
+        self.stats[name].add(elapsed)
+        instrumentation.observe(f"stage_{name}", elapsed)
+        self._stage_done(frame.frame_id)
+
+    def _stage_done(self, frame_id):
+        with self._lock:
+            self._pending[frame_id][1] -= 1
+        # Recoger y entregar bajo el mismo cerrojo: si dos hilos terminan a la vez,
+        # sus entregas no se pueden intercalar
+        with self._delivery_lock:
+            self._deliver_ready()
+
+    def _deliver_ready(self):
+        ready = []
+        with self._lock:
+            # Entrega en orden todos los frames completos al principio de la cola
+            while self._order and self._pending[self._order[0]][1] == 0:
+                entry = self._pending.pop(self._order.popleft())
+                result = entry[0]
+                if result.hands_skipped:
+                    result.fingers = self._last_fingers
+                else:
+                    self._last_fingers = result.fingers
+                ready.append(entry)
+
+        for result, _, on_result, submitted in ready:
+            now = time.perf_counter()
+            result.latencias["pipeline"] = now - submitted
+            end_to_end = time.time() - result.frame.timestamp
+            self.stats["pipeline"].add(now - submitted)
+            self.stats["end_to_end"].add(end_to_end)
+            instrumentation.observe("end_to_end", end_to_end)
+            if result.error is not None:
+                instrumentation.incr("pipeline_errors")
+            self._in_flight.release()
+            on_result(result)
+
+    def report(self):
+        """
+        Resumen de latencias por etapa y extremo a extremo.
+        """
+        return {name: stats.summary() for name, stats in self.stats.items()}
+
+    def close(self):
+        self._hand_pool.shutdown(wait=True)
+        self._ball_pool.shutdown(wait=True)
@@ -1,47 +1,49 @@
-import os
+import logging
 import cv2
+import instrumentation
 from yolo_detector import BallDetector
 from mediapipe_detector import FingerCounter
 from communication.mqtt_client import MQTTClient
-import time
-import paho.mqtt.client as mqtt
+from frame_sources import RecordingSource
+from detection_cache import DetectionCache
+from recording import SessionStore
 
-# Rutas
-IMAGES_PATH_LEFT = "../data/captures/images_left"  # Carpeta con imágenes a procesar
-IMAGES_PATH_RIGHT = "../data/captures/images_right"
+BATCH_SIZE = 4  # Pares estéreo por llamada al modelo
 
-IMG_COUNT = 0 
-# Inicialización de detectores
-yolo_detector = BallDetector()
-finger_counter = FingerCounter()
+# Mensajes por frame en nivel DEBUG; instrumentation.disable() los silencia todos
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger("v3d.offline")
+
+# Se procesa la última sesión grabada por main.py en data/recordings
+sesiones = SessionStore().sessions()
+if not sesiones:
+    raise SystemExit("No hay sesiones grabadas en data/recordings")
+log.info(f"📂 Procesando la sesión {sesiones[-1]}")
+
+# Inicialización de detectores. Las detecciones se guardan en data/cache/detections:
+# al repetir el script sobre las mismas imágenes no se vuelve a ejecutar la inferencia
+detection_cache = DetectionCache()
+yolo_detector = BallDetector(cache=detection_cache)
+finger_counter = FingerCounter(cache=detection_cache)
 mqtt_object = MQTTClient()
-mqtt_object._connect()
-try: 
-    mqtt_object.client.is_connected()
-except: 
-    print("Ha habido un error")
-print(f"Conectandose, conectado: {mqtt_object.client.is_connected()}")
-while not mqtt_object.client.is_connected(): 
-    print(mqtt_object.client.is_connected())
-    time.sleep(1)
+# Conexión en segundo plano: los mensajes se guardan en buffer hasta conectar
+mqtt_object.connect()
 
-while f"img_{IMG_COUNT:06d}.jpg" in os.listdir(IMAGES_PATH_LEFT):
-    image_left = os.path.join(IMAGES_PATH_LEFT, f"img_{IMG_COUNT:06d}.jpg")
-    image_right = os.path.join(IMAGES_PATH_RIGHT, f"img_{IMG_COUNT:06d}.jpg")
+pares_estereo = RecordingSource(sesiones[-1])
+
+# YOLO procesa BATCH_SIZE pares consecutivos por llamada al modelo
+for frame, centroide in yolo_detector.detect_stereo_frames(pares_estereo, BATCH_SIZE):
     # MediaPipe conteo de dedos
-    fingers, annotated_img = finger_counter.count_fingers(image_left)
+    fingers, annotated_img = finger_counter.count_fingers_frame(frame)
     #cv2.imshow("Resultado combinado", annotated_img)
     #cv2.waitKey()
-    centroide = yolo_detector.detect_stereo_ball_position(image_left, image_right)
     #print(f"Numero de dedos: {fingers}, Centroide: {centroide}")
     if fingers and centroide:
-        print(fingers, centroide)
-        print(f"Conectado: {mqtt_object.client.is_connected()}")
+        log.debug(f"{fingers} {centroide} (conectado: {mqtt_object.is_connected()})")
         mqtt_object.publish_position(centroide[0], centroide[1], centroide[2])
         mqtt_object.publish_fingers(fingers)
     else:
-        print("🙌 No se detectaron manos o posicion")
-    IMG_COUNT += 1
+        log.debug("🙌 No se detectaron manos o posicion")
     # Mostrar imagen con anotaciones
     """
     cv2.imshow("Resultado combinado", annotated_img)
@@ -50,8 +52,15 @@ while f"img_{IMG_COUNT:06d}.jpg" in os.listdir(IMAGES_PATH_LEFT):
         break
     """
 
+log.info(f"⏱️ Métricas: {instrumentation.METRICS.snapshot()}")
+log.info(f"🗃️ Caché de detecciones: {detection_cache.stats()}")
+
 # Liberar recursos
+pares_estereo.close()
 finger_counter.close()
+# Los mensajes quedan en el buffer hasta que conecta el broker: se esperan antes de desconectar
+mqtt_object.flush(timeout=10)
+mqtt_object.disconnect()
 
 """
     image = cv2.imread(image_path)
@@ -0,0 +1,332 @@
+"""
+Grabación de sesiones estéreo en un contenedor por bloques con índice.
+
+Una sesión es un directorio con:
+
+- meta.json: versión, codificación, forma y tipo de las imágenes.
+- chunk_000000.bin, chunk_000001.bin, ...: registros consecutivos, cada uno
+  con la vista izquierda seguida de la derecha ya codificadas (JPEG, PNG o
+  los bytes en crudo, que se pueden mapear en memoria al leer).
+- index.bin: una entrada de tamaño fijo por par (INDEX_DTYPE) con frame_id,
+  marca temporal, bloque, desplazamiento y tamaño de cada vista. Se escribe
+  después de los datos, así que nunca apunta a un registro incompleto.
+
+StereoRecorder escribe en segundo plano (codificación en un pool de hilos y
+escritura ordenada en otro), con memoria acotada. StereoRecording abre una
+sesión con acceso aleatorio por frame_id. SessionStore crea sesiones
+nuevas y elimina las antiguas de una vez.
+"""
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import instrumentation
+from paths import DATA_DIR
+from stereo_frame import StereoFrame
+
+log = logging.getLogger("v3d.recording")
+
+FORMAT_VERSION = 1
+ENCODINGS = ("jpg", "png", "raw")
+DEFAULT_RECORDINGS_DIR = os.path.join(DATA_DIR, "recordings")
+META_FILE = "meta.json"
+INDEX_FILE = "index.bin"
+INDEX_DTYPE = np.dtype([
+    ("frame_id", "<u4"), ("timestamp", "<f8"), ("chunk", "<u4"),
+    ("offset", "<u8"), ("left_size", "<u4"), ("right_size", "<u4"),
+])
+
+
+def _chunk_path(session_dir, chunk):
+    return os.path.join(session_dir, f"chunk_{chunk:06d}.bin")
+
+
+class StereoRecorder:
+    """
+    Grabador asíncrono de pares estéreo en una sesión.
+
+    submit copia el par y vuelve enseguida; la codificación se hace en un
+    pool de workers hilos y un único hilo escritor añade los registros en
+    orden de llegada. Como mucho hay max_pending pares en memoria: si se
+    llena, el par se descarta y se contabiliza en dropped. Cada bloque
+    guarda hasta chunk_records pares. session_dir no puede contener ya una
+    sesión (FileExistsError).
+
+    - encoding: 'jpg' (con quality), 'png' (con compresión png_level) o
+      'raw' (sin codificar, para leer mapeado en memoria).
+    """
+
+    def __init__(self, session_dir, encoding="jpg", quality=90, png_level=1, workers=2,
+                 max_pending=16, chunk_records=500):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Codificación desconocida: {encoding} (opciones: {', '.join(ENCODINGS)})")
+        self.session_dir = session_dir
+        self.encoding = encoding
+        self.chunk_records = chunk_records
+        if encoding == "jpg":
+            self._params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif encoding == "png":
+            self._params = [cv2.IMWRITE_PNG_COMPRESSION, png_level]
+        self._meta = {"version": FORMAT_VERSION, "encoding": encoding, "created": time.time(),
+                      "quality": quality if encoding == "jpg" else None}
+        os.makedirs(session_dir, exist_ok=True)
+        try:
+            # Los bloques empiezan siempre en 0: no se puede continuar una sesión existente
+            self._index = open(os.path.join(session_dir, INDEX_FILE), "xb")
+        except FileExistsError:
+            raise FileExistsError(f"Ya hay una sesión grabada en {session_dir}") from None
+
+        self.written = 0
+        self.dropped = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encode")
+        self._ordered = queue.Queue()
+        self._chunk = -1
+        self._chunk_file = None
+        self._chunk_count = 0
+        self._writer = threading.Thread(target=self._run, daemon=True)
+        self._writer.start()
+
+    def submit(self, frame_id, timestamp, left, right):
+        """
+        Encola un par para grabarlo. Devuelve False si se descartó por falta
+        de espacio.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.dropped += 1
+            instrumentation.incr("recording_dropped")
+            return False
+        if "shape" not in self._meta:
+            self._meta.update(shape=list(left.shape), dtype=str(left.dtype))
+        future = self._pool.submit(self._encode, left.copy(), right.copy())
+        self._ordered.put((frame_id, timestamp, future))
+        return True
+
+    def _encode(self, left, right):
+        with instrumentation.span("encode"):
+            if self.encoding == "raw":
+                return left, right
+            views = []
+            for image in (left, right):
+                ok, buffer = cv2.imencode(f".{self.encoding}", image, self._params)
+                if not ok:
+                    raise RuntimeError("No se pudo codificar la imagen")
+                views.append(buffer)
+            return views
+
+    def _run(self):
+        while True:
+            item = self._ordered.get()
+            if item is None:
+                break
+            frame_id, timestamp, future = item
+            try:
+                left, right = future.result()
+                self._write(frame_id, timestamp, left, right)
+            except Exception as exc:
+                log.error(f"⚠️ No se pudo grabar el frame {frame_id}: {exc}")
+            finally:
+                self._slots.release()
+
+    def _write(self, frame_id, timestamp, left, right):
+        if self._chunk_file is None or self._chunk_count >= self.chunk_records:
+            self._next_chunk()
+        offset = self._chunk_file.tell()
+        self._chunk_file.write(memoryview(left).cast("B"))
+        self._chunk_file.write(memoryview(right).cast("B"))
+        self._chunk_file.flush()
+        entry = np.array([(frame_id, timestamp, self._chunk, offset, left.nbytes, right.nbytes)], dtype=INDEX_DTYPE)
+        self._index.write(entry.tobytes())
+        self._index.flush()
+        self._chunk_count += 1
+        self.written += 1
+
+    def _next_chunk(self):
+        if self._chunk_file is None:
+            self._write_meta()
+        else:
+            self._chunk_file.close()
+        self._chunk += 1
+        self._chunk_count = 0
+        self._chunk_file = open(_chunk_path(self.session_dir, self._chunk), "wb")
+
+    def _write_meta(self):
+        tmp = os.path.join(self.session_dir, META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._meta, f, indent=2)
+        os.replace(tmp, os.path.join(self.session_dir, META_FILE))
+
+    def close(self):
+        """
+        Termina de grabar los pares pendientes y cierra los ficheros.
+        """
+        self._ordered.put(None)
+        self._writer.join()
+        self._pool.shutdown(wait=True)
+        if self._chunk_file is not None:
+            self._chunk_file.close()
+        self._index.close()
+        self._meta["frames"] = self.written
+        self._write_meta()
+
+
+class StereoRecording:
+    """
+    Lectura de una sesión con acceso aleatorio por frame_id. Los bloques se
+    mapean en memoria; con codificación 'raw' las vistas devueltas son
+    arrays de solo lectura sobre el propio fichero, sin copia.
+    """
+
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        with open(os.path.join(session_dir, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Versión de grabación no soportada: {self.meta['version']}")
+        self.encoding = self.meta["encoding"]
+        # Una sesión sin ningún par no tiene forma registrada
+        self.shape = tuple(self.meta.get("shape", ()))
+        self.dtype = np.dtype(self.meta.get("dtype", "uint8"))
+
+        with open(os.path.join(session_dir, INDEX_FILE), "rb") as f:
+            data = f.read()
+        # Una entrada incompleta al final (grabación interrumpida) se ignora
+        usable = len(data) - len(data) % INDEX_DTYPE.itemsize
+        self.index = np.frombuffer(data[:usable], dtype=INDEX_DTYPE)
+        self._rows = {int(frame_id): row for row, frame_id in enumerate(self.index["frame_id"])}
+        self._chunks = {}
+
+    @property
+    def frame_ids(self):
+        return self.index["frame_id"]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, frame_id):
+        return frame_id in self._rows
+
+    def _chunk(self, chunk):
+        data = self._chunks.get(chunk)
+        if data is None:
+            data = self._chunks[chunk] = np.memmap(_chunk_path(self.session_dir, chunk), dtype=np.uint8, mode="r")
+        return data
+
+    def _decode(self, buffer):
+        if self.encoding == "raw":
+            return buffer.view(self.dtype).reshape(self.shape)
+        with instrumentation.span("decode"):
+            return cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+
+    def read_row(self, row):
+        """
+        StereoFrame del registro número row (en orden de grabación).
+        """
+        entry = self.index[row]
+        data = self._chunk(int(entry["chunk"]))
+        start = int(entry["offset"])
+        middle = start + int(entry["left_size"])
+        end = middle + int(entry["right_size"])
+        return StereoFrame(int(entry["frame_id"]), float(entry["timestamp"]),
+                           self._decode(data[start:middle]), self._decode(data[middle:end]))
+
+    def read(self, frame_id):
+        """
+        StereoFrame con el frame_id indicado. Lanza KeyError si no está.
+        """
+        return self.read_row(self._rows[frame_id])
+
+    def __getitem__(self, frame_id):
+        return self.read(frame_id)
+
+    def __iter__(self):
+        for row in range(len(self.index)):
+            yield self.read_row(row)
+
+    def close(self):
+        self._chunks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SessionStore:
+    """
+    Directorio raíz de sesiones de grabación. new_session crea una sesión con
+    la fecha en el nombre; rotate conserva solo las keep más recientes. Para
+    que el arranque no espere, las sesiones viejas se renombran al momento y
+    se borran enteras en un hilo de fondo.
+    """
+
+    PREFIX = "session_"
+    TRASH_PREFIX = ".trash_"
+
+    def __init__(self, root=DEFAULT_RECORDINGS_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def sessions(self):
+        """
+        Rutas de las sesiones existentes, de la más antigua a la más nueva.
+        """
+        with os.scandir(self.root) as entries:
+            names = sorted(e.name for e in entries if e.is_dir() and e.name.startswith(self.PREFIX))
+        return [os.path.join(self.root, name) for name in names]
+
+    def new_session(self, name=None):
+        """
+        Crea la carpeta de una sesión nueva. Sin name se usa la fecha con
+        milisegundos y, si aun así ya existe, un sufijo _1, _2... (el orden
+        alfabético sigue siendo el cronológico).
+        """
+        if name is not None:
+            path = os.path.join(self.root, self.PREFIX + name)
+            os.makedirs(path, exist_ok=False)
+            return path
+        now = time.time()
+        base = time.strftime("%Y%m%d_%H%M%S", time.localtime(now)) + f"_{int(now * 1000) % 1000:03d}"
+        contador = 0
+        while True:
+            path = os.path.join(self.root, self.PREFIX + base + (f"_{contador}" if contador else ""))
+            try:
+                os.makedirs(path, exist_ok=False)
+                return path
+            except FileExistsError:
+                contador += 1
+
+    def rotate(self, keep=5):
+        """
+        Elimina todas las sesiones salvo las keep más recientes. Devuelve el
+        hilo de borrado (o None si no había nada que borrar).
+        """
+        sessions = self.sessions()
+        viejas = sessions[:max(len(sessions) - keep, 0)]
+        papelera = []
+        for path in viejas:
+            destino = os.path.join(self.root, self.TRASH_PREFIX + os.path.basename(path))
+            os.replace(path, destino)
+            papelera.append(destino)
+        # También restos de rotaciones anteriores interrumpidas
+        with os.scandir(self.root) as entries:
+            papelera += [e.path for e in entries if e.name.startswith(self.TRASH_PREFIX) and e.path not in papelera]
+        if not papelera:
+            return None
+        hilo = threading.Thread(target=self._vaciar, args=(papelera,), daemon=True)
+        hilo.start()
+        return hilo
+
+    @staticmethod
+    def _vaciar(paths):
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
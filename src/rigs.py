@@ -0,0 +1,241 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import instrumentation
+from paths import REPO_ROOT
+from frame_sources import ImagePairDirectorySource
+from yolo_detector import BallDetector
+from communication.publisher import encode_world_tracks
+
+WORLD_TOPIC = "v3d/world"
+
+
+class RigConfig:
+    """
+    Un par estéreo del montaje: su bundle de calibración y la transformación
+    de la cámara izquierda al sistema de referencia común del mundo
+    (X_mundo = R_world @ X_camara + t_world, en unidades de la calibración).
+    """
+
+    def __init__(self, name, calibration_path, R_world=None, t_world=None, left_dir=None, right_dir=None, fps=None):
+        self.name = name
+        self.calibration_path = calibration_path
+        self.R_world = np.eye(3) if R_world is None else np.asarray(R_world, dtype=np.float64).reshape(3, 3)
+        self.t_world = np.zeros(3) if t_world is None else np.asarray(t_world, dtype=np.float64).reshape(3)
+        self.left_dir = left_dir
+        self.right_dir = right_dir
+        self.fps = fps
+
+    def to_world(self, points):
+        return np.asarray(points, dtype=np.float64).reshape(-1, 3) @ self.R_world.T + self.t_world
+
+
+class RigRegistry:
+    """
+    Registro de pares estéreo. Se puede cargar de un JSON con la forma:
+
+        {"rigs": [{"name": "norte", "calibration": "data/calibration/stereo_bundle.npz",
+                   "R_world": [[1,0,0],[0,1,0],[0,0,1]], "t_world": [0,0,0],
+                   "left_dir": "data/captures/pelota/left",
+                   "right_dir": "data/captures/pelota/right", "fps": 15}]}
+
+    Las rutas relativas se resuelven desde la raíz del repositorio.
+    """
+
+    def __init__(self):
+        self.rigs = {}
+
+    def add(self, config):
+        if config.name in self.rigs:
+            raise ValueError(f"Ya existe un rig llamado {config.name}")
+        self.rigs[config.name] = config
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        resolve = lambda p: p if p is None or os.path.isabs(p) else os.path.join(REPO_ROOT, p)
+        registry = cls()
+        for rig in data["rigs"]:
+            registry.add(RigConfig(rig["name"], resolve(rig["calibration"]), rig.get("R_world"), rig.get("t_world"),
+                                   resolve(rig.get("left_dir")), resolve(rig.get("right_dir")), rig.get("fps")))
+        return registry
+
+    def __iter__(self):
+        return iter(self.rigs.values())
+
+    def __len__(self):
+        return len(self.rigs)
+
+
+class RigDetection:
+    """
+    Detecciones de un rig en un frame, ya en coordenadas del mundo.
+    """
+
+    __slots__ = ("rig", "frame_id", "timestamp", "positions", "confidences")
+
+    def __init__(self, rig, frame_id, timestamp, positions, confidences):
+        self.rig = rig
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.positions = positions
+        self.confidences = confidences
+
+
+class WorldFusion:
+    """
+    Fusiona las detecciones 3D de todos los rigs. Agrupa las detecciones en
+    ventanas de window segundos según su marca temporal de captura y solo
+    cierra una ventana cuando todos los rigs activos han entregado frames
+    posteriores (marca de agua), de modo que el resultado es el mismo en
+    vivo y en reproducción. Dentro de cada ventana, las detecciones a menos
+    de merge_distance se funden en una pista con la media ponderada por
+    confianza. Las detecciones que llegan para una ventana ya emitida se
+    descartan y se cuentan en late_detections.
+    """
+
+    def __init__(self, rig_names, on_tracks, window=0.05, merge_distance=0.5):
+        self.window = window
+        self.merge_distance = merge_distance
+        self.on_tracks = on_tracks
+        self._latest = {name: -np.inf for name in rig_names}
+        self._pending = {}
+        self._last_emitted = -np.inf
+        self.late_detections = 0
+        self._lock = threading.Lock()
+
+    def add(self, detection):
+        with self._lock:
+            bucket = int(np.floor(detection.timestamp / self.window))
+            if bucket <= self._last_emitted:
+                # Su ventana ya se publicó: reabrirla emitiría tiempos desordenados
+                self.late_detections += 1
+                instrumentation.incr("fusion_late_detections")
+                return
+            self._pending.setdefault(bucket, []).append(detection)
+            self._latest[detection.rig] = max(self._latest[detection.rig], detection.timestamp)
+            ready = self._ready_buckets()
+        for bucket, detections in ready:
+            self.on_tracks((bucket + 0.5) * self.window, self.fuse(detections))
+
+    def finish(self, rig):
+        """
+        Marca un rig como terminado: deja de retener el cierre de ventanas.
+        """
+        with self._lock:
+            self._latest.pop(rig, None)
+            ready = self._ready_buckets()
+        for bucket, detections in ready:
+            self.on_tracks((bucket + 0.5) * self.window, self.fuse(detections))
+
+    def _ready_buckets(self):
+        if self._latest:
+            latest = min(self._latest.values())
+            if not np.isfinite(latest):
+                return []
+            watermark = np.floor(latest / self.window)
+        else:
+            watermark = np.inf
+        ready = sorted(b for b in self._pending if b < watermark)
+        if ready:
+            self._last_emitted = ready[-1]
+        return [(b, self._pending.pop(b)) for b in ready]
+
+    def fuse(self, detections):
+        """
+        Devuelve una lista de pistas del mundo {'posicion', 'confianza', 'rigs'}
+        ordenada por confianza.
+        """
+        puntos = [(p, c, d.rig) for d in detections for p, c in zip(d.positions, d.confidences)]
+        puntos.sort(key=lambda item: item[1], reverse=True)
+
+        clusters = []
+        for posicion, confianza, rig in puntos:
+            for cluster in clusters:
+                centro = cluster["suma"] / cluster["peso"]
+                if np.linalg.norm(posicion - centro) <= self.merge_distance:
+                    cluster["suma"] += posicion * confianza
+                    cluster["peso"] += confianza
+                    cluster["confianza"] = max(cluster["confianza"], confianza)
+                    cluster["rigs"].add(rig)
+                    break
+            else:
+                clusters.append({"suma": posicion * confianza, "peso": confianza,
+                                 "confianza": confianza, "rigs": {rig}})
+
+        pistas = [{"posicion": c["suma"] / c["peso"], "confianza": c["confianza"], "rigs": sorted(c["rigs"])}
+                  for c in clusters if c["peso"] > 0]
+        pistas.sort(key=lambda pista: pista["confianza"], reverse=True)
+        return pistas
+
+
+class MultiRigTracker:
+    """
+    Ejecuta un hilo por rig (cada uno con su propio BallDetector y su
+    calibración) que lee su fuente de StereoFrame, detecta y triangula las
+    pelotas y las pasa al sistema del mundo. WorldFusion combina los
+    resultados y on_tracks(timestamp, pistas) recibe cada conjunto fusionado.
+    Si se da mqtt_client y no on_tracks, se publican en WORLD_TOPIC.
+    """
+
+    def __init__(self, registry, on_tracks=None, mqtt_client=None, window=0.05, merge_distance=0.5,
+                 detector_factory=BallDetector):
+        self.registry = registry
+        self.mqtt_client = mqtt_client
+        self.detector_factory = detector_factory
+        self._on_tracks = on_tracks
+        self.fusion = WorldFusion([rig.name for rig in registry], self._emit, window, merge_distance)
+
+    def _emit(self, timestamp, pistas):
+        if self._on_tracks is not None:
+            self._on_tracks(timestamp, pistas)
+        elif self.mqtt_client is not None:
+            self.mqtt_client.publish(WORLD_TOPIC, encode_world_tracks(timestamp, pistas))
+
+    def _run_rig(self, rig, source):
+        detector = self.detector_factory(calibration_path=rig.calibration_path)
+        try:
+            for frame in source:
+                pistas = detector.detect_stereo_balls_frame(frame)
+                posiciones = rig.to_world([p["posicion"] for p in pistas]) if pistas else np.empty((0, 3))
+                confianzas = [p["confianza"] for p in pistas]
+                self.fusion.add(RigDetection(rig.name, frame.frame_id, frame.timestamp, posiciones, confianzas))
+        finally:
+            self.fusion.finish(rig.name)
+            if hasattr(source, "close"):
+                source.close()
+
+    def run(self, sources=None):
+        """
+        Procesa todas las fuentes hasta agotarlas. sources es un diccionario
+        nombre_rig -> iterable de StereoFrame (p. ej. un FrameSource); por
+        defecto se usan las carpetas grabadas de cada RigConfig.
+        """
+        if sources is None:
+            # Mismo origen de tiempos en todos los rigs para que la fusión los alinee
+            start_time = time.time()
+            sources = {rig.name: ImagePairDirectorySource(rig.left_dir, rig.right_dir, fps=rig.fps,
+                                                          start_time=start_time)
+                       for rig in self.registry}
+        with ThreadPoolExecutor(max_workers=len(self.registry), thread_name_prefix="rig") as pool:
+            futures = [pool.submit(self._run_rig, rig, sources[rig.name]) for rig in self.registry]
+            for future in futures:
+                future.result()
+
+
+if __name__ == "__main__":
+    import sys
+    from communication.mqtt_client import MQTTClient
+
+    registry = RigRegistry.from_json(sys.argv[1])
+    mqtt_object = MQTTClient()
+    mqtt_object.connect()
+    MultiRigTracker(registry, mqtt_client=mqtt_object).run()
+    mqtt_object.flush(timeout=10)
+    mqtt_object.disconnect()
@@ -0,0 +1,103 @@
+"""
+Medición del arranque del nodo. Las fases independientes (abrir la cámara,
+cargar y calentar los modelos, conectar con el broker) se lanzan en
+paralelo con run_concurrently y report() devuelve cuándo empezó y cuánto
+duró cada una respecto al inicio.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+
+log = logging.getLogger("v3d.startup")
+
+
+class StartupError(RuntimeError):
+    """
+    Fallo de una fase de run_concurrently. phase es el nombre de la fase y
+    la excepción original queda en __cause__.
+    """
+
+    def __init__(self, phase, exc):
+        super().__init__(f"{phase}: {exc}")
+        self.phase = phase
+
+
+class _Phase:
+    __slots__ = ("_timer", "_name", "_start")
+
+    def __init__(self, timer, name):
+        self._timer = timer
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._timer._record(self._name, self._start, time.perf_counter())
+        return False
+
+
+class StartupTimer:
+    """
+    Cronómetro de arranque por fases. Es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        """
+        Context manager que registra la duración del bloque como fase name.
+        """
+        return _Phase(self, name)
+
+    def _record(self, name, start, end):
+        with self._lock:
+            self.phases[name] = (start - self.t0, end - start)
+        instrumentation.observe(f"startup_{name}", end - start)
+
+    def run_concurrently(self, tasks):
+        """
+        Ejecuta en paralelo las funciones de tasks ({fase: función}),
+        midiendo cada una como una fase. Devuelve {fase: resultado}. Si
+        alguna falla, espera a las demás y lanza StartupError con la primera
+        que falló en el orden de tasks.
+        """
+        def run(name, fn):
+            with self.phase(name):
+                return fn()
+
+        with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="startup") as pool:
+            futures = {name: pool.submit(run, name, fn) for name, fn in tasks.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as exc:
+                raise StartupError(name, exc) from exc
+        return results
+
+    def report(self):
+        """
+        {'total_s': ..., 'phases': {fase: {'start_s': ..., 'duration_s': ...}}}
+        ordenado por inicio.
+        """
+        with self._lock:
+            phases = sorted(self.phases.items(), key=lambda item: item[1][0])
+        return {
+            "total_s": time.perf_counter() - self.t0,
+            "phases": {name: {"start_s": start, "duration_s": duration} for name, (start, duration) in phases},
+        }
+
+    def log_report(self):
+        report = self.report()
+        log.info(f"🚀 Arranque en {report['total_s']:.2f} s")
+        for name, phase in report["phases"].items():
+            log.info(f"   {name:<12s} +{phase['start_s']:.2f} s  {phase['duration_s']:.2f} s")
+        return report
@@ -0,0 +1,36 @@
+import time
+
+import cv2
+
+
+class StereoFrame:
+    """
+    Par estéreo ya decodificado (vistas izquierda y derecha en BGR) junto con
+    su identificador de frame y la marca temporal de captura en segundos.
+    point_cloud es opcional: nube de puntos XYZ (H, W, 3) de la vista
+    izquierda, si la fuente la proporciona (p. ej. la ZED).
+    """
+
+    __slots__ = ("frame_id", "timestamp", "left", "right", "point_cloud")
+
+    def __init__(self, frame_id, timestamp, left, right, point_cloud=None):
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.left = left
+        self.right = right
+        self.point_cloud = point_cloud
+
+    def __repr__(self):
+        return f"StereoFrame(frame_id={self.frame_id}, timestamp={self.timestamp:.3f})"
+
+    @classmethod
+    def from_paths(cls, frame_id, left_path, right_path, timestamp=None):
+        """
+        Decodifica una sola vez un par guardado en disco. Devuelve None si
+        alguna de las dos imágenes no se puede leer.
+        """
+        left = cv2.imread(left_path)
+        right = cv2.imread(right_path)
+        if left is None or right is None:
+            return None
+        return cls(frame_id, time.time() if timestamp is None else timestamp, left, right)
@@ -0,0 +1,161 @@
+"""
+Geometría estéreo vectorizada sobre arrays de correspondencias: triangulación
+de N pares en una sola llamada y medidas de calidad por punto (error de
+reproyección, residuo epipolar y profundidad en ambas cámaras) para
+descartar malos emparejamientos, analizar grabaciones en bloque o validar
+una calibración.
+
+Los puntos de imagen se esperan ya sin distorsión, en píxeles (como los de
+StereoUndistorter.undistort_points), y los puntos 3D salen en float, en el
+sistema de la cámara izquierda y en las unidades de la calibración.
+"""
+import numpy as np
+
+from stereo_matching import _homogeneous, triangulate_matches
+
+
+def to_output_units(point_3D):
+    """
+    Formato publicado históricamente: x e y escalados por 100, z sin
+    escalar, todos truncados a enteros.
+    """
+    return [int(point_3D[i] * 100) if i != 2 else int(point_3D[i]) for i in range(3)]
+
+
+def _as_points(points):
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+
+class StereoTriangulation:
+    """
+    Resultado de StereoGeometry.evaluate para N correspondencias, con un
+    array por campo: points (N, 3), reprojection_error y epipolar_residual
+    (N,) en píxeles, in_front (N,) si el punto queda delante de ambas
+    cámaras y valid (N,) si además pasa los umbrales pedidos.
+    """
+
+    __slots__ = ("points", "reprojection_error", "epipolar_residual", "in_front", "valid")
+
+    def __init__(self, points, reprojection_error, epipolar_residual, in_front, valid):
+        self.points = points
+        self.reprojection_error = reprojection_error
+        self.epipolar_residual = epipolar_residual
+        self.in_front = in_front
+        self.valid = valid
+
+    def __len__(self):
+        return len(self.points)
+
+    def summary(self):
+        """
+        Resumen de los errores (en píxeles) de los puntos delante de ambas cámaras.
+        """
+        resumen = {"count": len(self), "in_front": int(self.in_front.sum()), "valid": int(self.valid.sum())}
+        for name, values in (("reprojection", self.reprojection_error), ("epipolar", self.epipolar_residual)):
+            values = values[self.in_front]
+            if len(values) == 0:
+                continue
+            p50, p95 = np.percentile(values, [50, 95])
+            resumen.update({f"{name}_mean_px": float(values.mean()), f"{name}_p50_px": float(p50),
+                            f"{name}_p95_px": float(p95), f"{name}_max_px": float(values.max())})
+        return resumen
+
+
+class StereoGeometry:
+    """
+    Triangulación y medidas de calidad a partir de las matrices de la
+    calibración: P1/P2 (proyección de cada cámara), R/T (de la cámara
+    izquierda a la derecha) y F (x_r^T F x_l = 0).
+
+    max_reprojection_error y max_epipolar_residual (píxeles, None para no
+    filtrar) son los umbrales por defecto de evaluate.
+    """
+
+    def __init__(self, P1, P2, R, T, F, max_reprojection_error=None, max_epipolar_residual=None):
+        self.P1 = np.asarray(P1, dtype=np.float64)
+        self.P2 = np.asarray(P2, dtype=np.float64)
+        self.R = np.asarray(R, dtype=np.float64)
+        self.T = np.asarray(T, dtype=np.float64).ravel()
+        self.F = np.asarray(F, dtype=np.float64)
+        self.max_reprojection_error = max_reprojection_error
+        self.max_epipolar_residual = max_epipolar_residual
+
+    @classmethod
+    def from_bundle(cls, bundle, **umbrales):
+        """
+        Crea la geometría a partir de un CalibrationBundle (cargar_bundle).
+        """
+        return cls(bundle.P1, bundle.P2, bundle.R, bundle.T, bundle.F, **umbrales)
+
+    def triangulate(self, pts_l, pts_r):
+        """
+        Triangula los pares (N, 2) de una vez. Devuelve (N, 3) en float.
+        """
+        return triangulate_matches(self.P1, self.P2, pts_l, pts_r)
+
+    def project(self, points):
+        """
+        Proyecta puntos 3D (N, 3) en ambas vistas. Devuelve dos arrays (N, 2).
+        """
+        X = np.hstack((np.asarray(points, dtype=np.float64).reshape(-1, 3), np.ones((len(points), 1))))
+        proj_l = X @ self.P1.T
+        proj_r = X @ self.P2.T
+        return proj_l[:, :2] / proj_l[:, 2:], proj_r[:, :2] / proj_r[:, 2:]
+
+    def reprojection_error(self, points, pts_l, pts_r):
+        """
+        Error de reproyección por punto (N,): media cuadrática, en píxeles,
+        de la distancia entre la proyección del punto y la observación en
+        cada vista.
+        """
+        proj_l, proj_r = self.project(points)
+        e_l = np.sum((proj_l - _as_points(pts_l)) ** 2, axis=1)
+        e_r = np.sum((proj_r - _as_points(pts_r)) ** 2, axis=1)
+        return np.sqrt((e_l + e_r) / 2.0)
+
+    def epipolar_residual(self, pts_l, pts_r):
+        """
+        Distancia epipolar simétrica (N,) en píxeles de cada par, a diferencia
+        de stereo_matching.epipolar_distances, que compara todos con todos.
+        """
+        hl, hr = _homogeneous(pts_l), _homogeneous(pts_r)
+        lines_r = hl @ self.F.T
+        lines_l = hr @ self.F
+        residual = np.sum(hr * lines_r, axis=1)
+        d_r = np.abs(residual) / np.linalg.norm(lines_r[:, :2], axis=1)
+        d_l = np.abs(residual) / np.linalg.norm(lines_l[:, :2], axis=1)
+        return (d_l + d_r) / 2.0
+
+    def depths(self, points):
+        """
+        Profundidad (z) de cada punto en la cámara izquierda y en la derecha.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        return points[:, 2], points @ self.R[2] + self.T[2]
+
+    def evaluate(self, pts_l, pts_r, max_reprojection_error=None, max_epipolar_residual=None):
+        """
+        Triangula los pares y calcula todas las medidas de calidad. Los
+        umbrales que no se indiquen toman el valor del constructor.
+        """
+        pts_l, pts_r = _as_points(pts_l), _as_points(pts_r)
+        points = self.triangulate(pts_l, pts_r)
+        if len(points) == 0:
+            vacio = np.empty(0)
+            return StereoTriangulation(points, vacio, vacio, vacio.astype(bool), vacio.astype(bool))
+
+        reprojection = self.reprojection_error(points, pts_l, pts_r)
+        epipolar = self.epipolar_residual(pts_l, pts_r)
+        z_l, z_r = self.depths(points)
+        in_front = (z_l > 0) & (z_r > 0)
+
+        max_reprojection_error = max_reprojection_error if max_reprojection_error is not None \
+            else self.max_reprojection_error
+        max_epipolar_residual = max_epipolar_residual if max_epipolar_residual is not None \
+            else self.max_epipolar_residual
+        valid = in_front.copy()
+        if max_reprojection_error is not None:
+            valid &= reprojection <= max_reprojection_error
+        if max_epipolar_residual is not None:
+            valid &= epipolar <= max_epipolar_residual
+        return StereoTriangulation(points, reprojection, epipolar, in_front, valid)
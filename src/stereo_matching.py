@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+
+
+def _homogeneous(points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return np.hstack((points, np.ones((len(points), 1))))
+
+
+def epipolar_distances(F, pts_l, pts_r):
+    """
+    Matriz N x M de distancias epipolares simétricas (en píxeles) entre N
+    puntos de la vista izquierda y M de la derecha, usando x_r^T F x_l = 0.
+    """
+    hl = _homogeneous(pts_l)
+    hr = _homogeneous(pts_r)
+    lines_r = hl @ F.T  # rectas epipolares en la vista derecha, (N, 3)
+    lines_l = hr @ F    # rectas epipolares en la vista izquierda, (M, 3)
+    d_r = np.abs(lines_r @ hr.T) / np.linalg.norm(lines_r[:, :2], axis=1, keepdims=True)
+    d_l = np.abs(hl @ lines_l.T) / np.linalg.norm(lines_l[:, :2], axis=1)
+    return (d_l + d_r) / 2.0
+
+
+def match_stereo_detections(F, pts_l, pts_r, max_distance=10.0):
+    """
+    Asocia detecciones entre vistas por distancia epipolar con asignación
+    voraz (cada detección se usa como mucho una vez). Devuelve una lista de
+    tuplas (indice_l, indice_r, distancia) ordenada por distancia.
+    """
+    if len(pts_l) == 0 or len(pts_r) == 0:
+        return []
+    distancias = epipolar_distances(F, pts_l, pts_r)
+    usados_l, usados_r, matches = set(), set(), []
+    for flat in np.argsort(distancias, axis=None):
+        i, j = np.unravel_index(flat, distancias.shape)
+        if distancias[i, j] > max_distance:
+            break
+        if i in usados_l or j in usados_r:
+            continue
+        usados_l.add(i)
+        usados_r.add(j)
+        matches.append((int(i), int(j), float(distancias[i, j])))
+    return matches
+
+
+def triangulate_matches(P1, P2, pts_l, pts_r):
+    """
+    Triangula todos los pares (N, 2) de una vez y devuelve un array (N, 3)
+    en float con las unidades de la calibración.
+    """
+    pts_l = np.asarray(pts_l, dtype=np.float64).reshape(-1, 2)
+    pts_r = np.asarray(pts_r, dtype=np.float64).reshape(-1, 2)
+    if len(pts_l) == 0:
+        return np.empty((0, 3))
+    points_4D = cv2.triangulatePoints(P1, P2, pts_l.T, pts_r.T)
+    return (points_4D[:3] / points_4D[3]).T
@@ -1,47 +1,245 @@
+import os
 import cv2
 import numpy as np
-from ultralytics import YOLO
+import instrumentation
+from paths import DATA_DIR  # también hace importable calibration_bundle
+from calibration_bundle import DEFAULT_BUNDLE_PATH, cargar_bundle
+from detection_cache import image_key
+from inference_backends import crear_backend
+from stereo_geometry import StereoGeometry, to_output_units
+from stereo_matching import match_stereo_detections
+from undistortion import StereoUndistorter
+
+DEFAULT_MODEL_PATH = os.path.join(DATA_DIR, "model", "yolov8n.pt")
 
 class BallDetector:
-    def __init__(self, model_path='../data/model/yolov8n.pt'):
-        self.model = YOLO(model_path)
+    """
+    Detección de la pelota en ambas vistas y triangulación de su posición.
+
+    backend selecciona el motor de inferencia ('ultralytics', 'onnx' u
+    'openvino', ver inference_backends). imgsz es el tamaño de entrada del
+    modelo, threads los hilos de inferencia en CPU, quantize usa el modelo
+    ONNX cuantizado a INT8 y conf_threshold la confianza mínima.
+    max_reprojection_error (píxeles, None para no filtrar) descarta los
+    pares cuya triangulación no reproyecta bien en ambas vistas.
+
+    cache (detection_cache.DetectionCache, opcional) guarda las detecciones
+    de cada imagen según su contenido y la firma del backend, para no volver
+    a ejecutar el modelo sobre imágenes ya procesadas.
+    """
 
-        # Calibración de cámaras
-        left_calib = np.load("../data/calibration/left/left_calib.npy", allow_pickle=True).item()
-        right_calib = np.load("../data/calibration/right/right_calib.npy", allow_pickle=True).item()
-        stereo_calib = np.load("../data/calibration/stereo_calib.npy", allow_pickle=True).item()
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, max_epipolar_distance=10.0, undistort=True,
+                 calibration_path=DEFAULT_BUNDLE_PATH, backend="ultralytics", imgsz=None, threads=None,
+                 quantize=False, conf_threshold=0.25, cache=None, max_reprojection_error=5.0):
+        self.model = crear_backend(backend, model_path, imgsz=imgsz, threads=threads, quantize=quantize,
+                                   conf_threshold=conf_threshold)
+        self.cache = cache
+        self.cache_namespace = cache.namespace({"detector": "yolo", **self.model.signature}) if cache else None
+        self.max_epipolar_distance = max_epipolar_distance
+        self.undistort = undistort
 
-        self.K1 = left_calib["camera_matrix"]
-        self.K2 = right_calib["camera_matrix"]
-        self.R = stereo_calib["R"]
-        self.T = stereo_calib["T"]
+        # Calibración estéreo (bundle .npz, sin pickle)
+        self.calibration = cargar_bundle(calibration_path)
+        self.K1 = self.calibration.K1
+        self.K2 = self.calibration.K2
+        self.D1 = self.calibration.D1
+        self.D2 = self.calibration.D2
+        self.R = self.calibration.R
+        self.T = self.calibration.T
+        self.F = self.calibration.F
+
+        # Corrección de distorsión de los centroides antes de triangular
+        self.undistorter = StereoUndistorter(
+            self.K1, self.D1, self.K2, self.D2, self.R, self.T, calib_paths=(calibration_path,))
 
         # Matrices de proyección
-        self.P1 = self.K1 @ np.hstack((np.eye(3), np.zeros((3,1))))
-        self.P2 = self.K2 @ np.hstack((self.R, self.T.reshape(3,1)))
+        self.P1 = self.calibration.P1
+        self.P2 = self.calibration.P2
+        # Triangulación vectorizada con error de reproyección por punto
+        self.geometry = StereoGeometry.from_bundle(self.calibration, max_reprojection_error=max_reprojection_error)
 
     def detect_stereo_ball_position(self, left_path, right_path):
-        centroides = []
+        images = []
         for image_path in [left_path, right_path]:
             image = cv2.imread(image_path)
             if image is None:
                 return []
-            results = self.model(image)
+            images.append(image)
+        return self.detect_stereo_ball_position_images(*images)
+
+    def detect_stereo_frame(self, frame):
+        """
+        Posición 3D de la pelota a partir de un StereoFrame ya decodificado.
+        """
+        return self.detect_stereo_ball_position_images(frame.left, frame.right)
+
+    def detect_stereo_ball_position_images(self, left_image, right_image):
+        """
+        Detecta la pelota en ambas vistas (arrays BGR) con una única llamada
+        al modelo y devuelve [x, y, z] de la pelota emparejada con mayor
+        confianza, o una lista vacía si no hay ninguna.
+        """
+        return self._best_position(self.detect_stereo_balls_images(left_image, right_image))
+
+    def detect_stereo_balls_frame(self, frame, imgsz=None):
+        return self.detect_stereo_balls_images(frame.left, frame.right, imgsz)
+
+    def detect_stereo_balls_images(self, left_image, right_image, imgsz=None):
+        """
+        Detecta todas las pelotas de un par, las asocia entre vistas por
+        restricción epipolar y las triangula. Devuelve una lista de pistas
+        3D ordenada por confianza (ver match_and_triangulate). imgsz permite
+        inferir a menor resolución que la configurada.
+        """
+        detecciones_l, detecciones_r = self.detect_balls_batch([left_image, right_image], imgsz)
+        return self.match_and_triangulate(detecciones_l, detecciones_r)
+
+    def detect_stereo_frames(self, frames, batch_size=4):
+        """
+        Procesa una secuencia de StereoFrame agrupando hasta batch_size pares
+        (2 * batch_size imágenes) en cada llamada al modelo. Genera tuplas
+        (frame, [x, y, z]) en el mismo orden de entrada.
+        """
+        batch = []
+        for frame in frames:
+            batch.append(frame)
+            if len(batch) == batch_size:
+                yield from zip(batch, self.detect_stereo_batch(batch))
+                batch = []
+        if batch:
+            yield from zip(batch, self.detect_stereo_batch(batch))
+
+    def detect_stereo_batch(self, frames):
+        """
+        Triangula la pelota en varios StereoFrame con una sola llamada al
+        modelo. Devuelve una lista de [x, y, z] (o []) por frame.
+        """
+        if not frames:
+            return []
+        images = []
+        for frame in frames:
+            images.extend((frame.left, frame.right))
+        detecciones = self.detect_balls_batch(images)
+        return [self._best_position(self.match_and_triangulate(detecciones[2 * i], detecciones[2 * i + 1]))
+                for i in range(len(frames))]
+
+    def detect_balls_batch(self, images, imgsz=None):
+        """
+        Ejecuta el modelo una sola vez sobre una lista de imágenes y devuelve,
+        por imagen, las pelotas detectadas como diccionarios con 'centroide'
+        (x, y en float), 'bbox' y 'confianza'. imgsz permite inferir a menor
+        tamaño (p. ej. sobre recortes).
+        """
+        # El backend ya devuelve solo la clase pelota: [x1, y1, x2, y2, conf, clase]
+        results = self._infer(list(images), imgsz)
+        detecciones = []
+        for boxes in results:
+            detecciones.append([{
+                'centroide': ((x1 + x2) / 2, (y1 + y2) / 2),
+                'bbox': (x1, y1, x2, y2),
+                'confianza': conf,
+            } for x1, y1, x2, y2, conf, _ in boxes.tolist()])
+        return detecciones
+
+    def _infer(self, images, imgsz):
+        if self.cache is None:
+            with instrumentation.span("yolo"):
+                return self.model(images, imgsz=imgsz)
+        # Solo las imágenes que no están en la caché pasan por el modelo, en un único lote
+        keys = [image_key(image, imgsz) for image in images]
+        entradas = [self.cache.get(self.cache_namespace, key) for key in keys]
+        results = [None if entrada is None else entrada["boxes"] for entrada in entradas]
+        pendientes = [i for i, boxes in enumerate(results) if boxes is None]
+        if pendientes:
+            with instrumentation.span("yolo"):
+                nuevos = self.model([images[i] for i in pendientes], imgsz=imgsz)
+            for i, boxes in zip(pendientes, nuevos):
+                self.cache.put(self.cache_namespace, keys[i], boxes=boxes)
+                results[i] = boxes
+        return results
+
+    def detect_ball_centroids_batch(self, images, imgsz=None):
+        """
+        Igual que detect_balls_batch pero devuelve solo los centroides (x, y).
+        """
+        return [[d['centroide'] for d in detecciones_img]
+                for detecciones_img in self.detect_balls_batch(images, imgsz)]
+
+    def match_and_triangulate(self, detecciones_l, detecciones_r):
+        """
+        Asocia las detecciones de ambas vistas por distancia epipolar con la
+        matriz fundamental F y triangula todos los pares en una sola llamada.
+        Devuelve una lista de diccionarios con 'posicion' (array float en
+        unidades de la calibración), 'confianza', 'error_epipolar',
+        'error_reproyeccion' (píxeles) y los centroides de cada vista,
+        ordenada por confianza descendente. Se descartan los pares que quedan
+        detrás de alguna de las cámaras o superan max_reprojection_error.
+        """
+        if not detecciones_l or not detecciones_r:
+            instrumentation.incr("ball_misses")
+            return []
+        with instrumentation.span("triangulation"):
+            pts_l = [d['centroide'] for d in detecciones_l]
+            pts_r = [d['centroide'] for d in detecciones_r]
+            und_l, und_r = self._undistort(pts_l, pts_r)
+            matches = match_stereo_detections(self.F, und_l, und_r, self.max_epipolar_distance)
+            if not matches:
+                instrumentation.incr("stereo_match_failures")
+                return []
+
+            idx_l = [i for i, _, _ in matches]
+            idx_r = [j for _, j, _ in matches]
+            triangulacion = self.geometry.evaluate(und_l[idx_l], und_r[idx_r])
+
+        pistas = []
+        for (i, j, distancia), punto, error, valido in zip(matches, triangulacion.points,
+                                                          triangulacion.reprojection_error, triangulacion.valid):
+            if not valido:
+                continue
+            pistas.append({
+                'posicion': punto,
+                'confianza': float(np.sqrt(detecciones_l[i]['confianza'] * detecciones_r[j]['confianza'])),
+                'error_epipolar': distancia,
+                'error_reproyeccion': float(error),
+                'centroide_l': pts_l[i],
+                'centroide_r': pts_r[j],
+            })
+        if not pistas:
+            instrumentation.incr("stereo_match_failures")
+        pistas.sort(key=lambda pista: pista['confianza'], reverse=True)
+        return pistas
 
-            for result in results:
-                for box in result.boxes:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    conf = box.conf[0].item()
-                    cls_id = int(box.cls[0].item())
-                    label = self.model.names[cls_id]
+    def _undistort(self, pts_l, pts_r):
+        if not self.undistort:
+            return (np.asarray(pts_l, dtype=np.float64).reshape(-1, 2),
+                    np.asarray(pts_r, dtype=np.float64).reshape(-1, 2))
+        return (self.undistorter.undistort_points(pts_l, "left"),
+                self.undistorter.undistort_points(pts_r, "right"))
 
-                    if label.lower() == "sports ball":
-                        centroides.append(((x1 + x2) // 2, (y1 + y2) // 2))
+    def _best_position(self, pistas):
+        if not pistas:
+            return []
+        return self.to_output_units(pistas[0]['posicion'])
 
-        if len(centroides) == 2:
-            point_4D = cv2.triangulatePoints(self.P1, self.P2, centroides[0], centroides[1])
-            point_3D = point_4D[:3] / point_4D[3]
-            puntos = [int(point_3D[i][0] * 100) if i != 2 else int(point_3D[i]) for i in range(3)]
-            return puntos
+    def project_to_images(self, point):
+        """
+        Proyecta un punto 3D (unidades de la calibración) en píxeles de las
+        imágenes originales, con la distorsión de cada cámara si undistort
+        está activo. Devuelve (centro_l, centro_r), o None si el punto queda
+        detrás de alguna cámara.
+        """
+        z_l, z_r = self.geometry.depths(point)
+        if z_l[0] <= 0 or z_r[0] <= 0:
+            return None
+        if not self.undistort:
+            proj_l, proj_r = self.geometry.project(np.reshape(point, (1, 3)))
+            return proj_l[0], proj_r[0]
+        return (self.undistorter.distort_points(point, "left")[0],
+                self.undistorter.distort_points(point, "right")[0])
 
-        return []
+    @staticmethod
+    def to_output_units(point_3D):
+        """
+        Formato publicado históricamente (ver stereo_geometry.to_output_units).
+        """
+        return to_output_units(point_3D)
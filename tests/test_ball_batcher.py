@@ -0,0 +1,102 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from ball_batcher import BatchedBallDetector
+from pipeline import StereoPipeline
+from stereo_frame import StereoFrame
+
+
+class FakeDetector:
+    """
+    Detector falso: cada imagen lleva su frame_id en el primer píxel y la
+    pista resultante tiene x = frame_id. Registra las llamadas al modelo.
+    """
+
+    to_output_units = staticmethod(lambda point: [int(v) for v in point])
+
+    def __init__(self):
+        self.calls = []
+
+    def detect_balls_batch(self, images, imgsz=None):
+        self.calls.append((len(images), imgsz))
+        return [[{'centroide': (float(image[0, 0, 0]), 0.0)}] for image in images]
+
+    def match_and_triangulate(self, detecciones_l, detecciones_r):
+        assert detecciones_l[0]['centroide'] == detecciones_r[0]['centroide']
+        return [{'posicion': np.array([detecciones_l[0]['centroide'][0], 0.0, 1.0]), 'confianza': 1.0}]
+
+
+class FailingDetector(FakeDetector):
+    def detect_balls_batch(self, images, imgsz=None):
+        raise RuntimeError("modelo roto")
+
+
+def _frame(frame_id):
+    image = np.full((4, 4, 3), frame_id, dtype=np.uint8)
+    return StereoFrame(frame_id, time.time(), image, image)
+
+
+def test_concurrent_frames_share_one_model_call():
+    detector = FakeDetector()
+    batcher = BatchedBallDetector(detector, batch_size=4, max_wait=5.0)
+    futures = [batcher.submit(_frame(i)) for i in range(4)]
+    assert [f.result(timeout=5)[0]['posicion'][0] for f in futures] == [0, 1, 2, 3]
+    # Las dos vistas de los cuatro pares en una sola llamada
+    assert detector.calls == [(8, None)]
+    batcher.close()
+
+
+def test_partial_batch_waits_at_most_max_wait():
+    detector = FakeDetector()
+    batcher = BatchedBallDetector(detector, batch_size=4, max_wait=0.05)
+    start = time.monotonic()
+    pistas = batcher.detect_stereo_balls_frame(_frame(7))
+    assert 0.04 <= time.monotonic() - start < 1.0
+    assert pistas[0]['posicion'][0] == 7 and detector.calls == [(2, None)]
+    batcher.close()
+
+
+def test_frames_with_different_imgsz_are_inferred_separately():
+    detector = FakeDetector()
+    batcher = BatchedBallDetector(detector, batch_size=3, max_wait=5.0)
+    futures = [batcher.submit(_frame(0), 640), batcher.submit(_frame(1), 320), batcher.submit(_frame(2), 640)]
+    assert [f.result(timeout=5)[0]['posicion'][0] for f in futures] == [0, 1, 2]
+    assert detector.calls == [(4, 640), (2, 320)]
+    batcher.close()
+
+
+def test_model_errors_reach_every_frame_of_the_batch():
+    batcher = BatchedBallDetector(FailingDetector(), batch_size=2, max_wait=5.0)
+    futures = [batcher.submit(_frame(i)) for i in range(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    batcher.close()
+
+
+def test_pipeline_ball_workers_share_the_batcher():
+    detector = FakeDetector()
+    batcher = BatchedBallDetector(detector, batch_size=2, max_wait=0.01)
+
+    class Hands:
+        def count_fingers_frame(self, frame):
+            return 1, None
+
+    pipeline = StereoPipeline(Hands, lambda: batcher, ball_workers=2, max_in_flight=2)
+    results = []
+    lock = threading.Lock()
+
+    def on_result(result):
+        with lock:
+            results.append(result)
+
+    for frame_id in range(20):
+        pipeline.submit(_frame(frame_id), on_result)
+    pipeline.close()
+    batcher.close()
+    assert [r.centroide[0] for r in results] == list(range(20))
+    assert all(r.error is None for r in results)
+    assert sum(n for n, _ in detector.calls) == 40
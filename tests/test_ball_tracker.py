@@ -0,0 +1,99 @@
+import numpy as np
+
+import paths  # noqa: F401  (hace importable calibration_bundle)
+from ball_tracker import ROIBallTracker
+from calibration_bundle import cargar_bundle
+from stereo_frame import StereoFrame
+from stereo_geometry import StereoGeometry
+from undistortion import StereoUndistorter
+
+
+def test_distort_points_inverts_undistort_points():
+    bundle = cargar_bundle()
+    undistorter = StereoUndistorter(bundle.K1, bundle.D1, bundle.K2, bundle.D2, bundle.R, bundle.T)
+    geometry = StereoGeometry.from_bundle(bundle)
+    # Píxeles originales, también cerca de las esquinas donde la distorsión es mayor
+    raw_l = np.array([[300.0, 200.0], [960.0, 540.0], [150.0, 900.0]])
+    und_l = undistorter.undistort_points(raw_l, "left")
+
+    # Punto 3D que proyecta en esos píxeles sin distorsión, a 10 unidades de profundidad
+    rayos = np.hstack((und_l, np.ones((3, 1)))) @ np.linalg.inv(bundle.K1).T
+    puntos = rayos * 10.0
+    np.testing.assert_allclose(undistorter.distort_points(puntos, "left"), raw_l, atol=0.05)
+
+    raw_r = undistorter.distort_points(puntos, "right")
+    _, und_r = geometry.project(puntos)
+    np.testing.assert_allclose(undistorter.undistort_points(raw_r, "right"), und_r, atol=0.05)
+
+
+class BrightSpotDetector:
+    """
+    Detector falso sobre imágenes sintéticas: la pelota es el píxel más
+    brillante, así que también se encuentra en los recortes. Cámaras
+    ideales: x_l = 1000 X / Z + 500, y = 1000 Y / Z + 300, x_r = x_l - 5000 / Z.
+    """
+
+    def __init__(self):
+        self.projected = 0
+        self.matched = []
+
+    @staticmethod
+    def to_output_units(point):
+        return [int(v) for v in point]
+
+    def project_to_images(self, point):
+        self.projected += 1
+        x, y = 1000 * point[0] / point[2] + 500, 1000 * point[1] / point[2] + 300
+        return np.array([x, y]), np.array([x - 50, y])
+
+    def detect_balls_batch(self, images, imgsz=None):
+        detecciones = []
+        for image in images:
+            y, x = np.unravel_index(np.argmax(image[..., 0]), image.shape[:2])
+            detecciones.append([{'centroide': (float(x), float(y)), 'bbox': (x - 2, y - 2, x + 2, y + 2),
+                                 'confianza': 0.9}] if image[y, x, 0] else [])
+        return detecciones
+
+    def match_and_triangulate(self, detecciones_l, detecciones_r):
+        self.matched.append((detecciones_l, detecciones_r))
+        if not detecciones_l or not detecciones_r:
+            return []
+        (x, y), (xr, _) = detecciones_l[0]['centroide'], detecciones_r[0]['centroide']
+        z = 1000.0 / (x - xr) * 5
+        return [{'posicion': np.array([(x - 500) * z / 1000, (y - 300) * z / 1000, z]), 'confianza': 0.9,
+                 'centroide_l': (x, y), 'centroide_r': (xr, y)}]
+
+
+def _frame(frame_id, x, y):
+    left = np.zeros((720, 1280, 3), dtype=np.uint8)
+    right = left.copy()
+    left[y, x] = 255
+    right[y, x - 50] = 255
+    return StereoFrame(frame_id, frame_id / 30, left, right)
+
+
+def test_roi_detections_are_matched_in_full_frame_coordinates():
+    detector = BrightSpotDetector()
+    tracker = ROIBallTracker(detector, roi_size=64)
+
+    for frame_id in range(4):
+        pistas = tracker.detect_stereo_balls_frame(_frame(frame_id, 700 + 2 * frame_id, 400))
+        assert len(pistas) == 1
+    assert tracker.full_frame_detections == 1 and tracker.roi_detections == 3
+    assert detector.projected == 3
+    # Los recortes pasan por el mismo emparejamiento, con centroides de la imagen completa
+    detecciones_l, detecciones_r = detector.matched[-1]
+    assert detecciones_l[0]['centroide'] == (706.0, 400.0)
+    assert detecciones_r[0]['centroide'] == (656.0, 400.0)
+    np.testing.assert_allclose(pistas[0]['posicion'], [20.6, 10.0, 100.0], atol=0.5)
+    # La triangulación sin filtrar también se expone, para no filtrarla dos veces aguas abajo
+    np.testing.assert_allclose(pistas[0]['medida'], [(706 - 500) * 0.1, 10.0, 100.0], atol=1e-6)
+
+
+def test_rejected_roi_pair_counts_as_miss():
+    detector = BrightSpotDetector()
+    tracker = ROIBallTracker(detector, roi_size=64, max_misses=1)
+    tracker.detect_stereo_balls_frame(_frame(0, 700, 400))
+    # La pelota sale del recorte: sin detecciones en la ROI no hay pista ni reinicio
+    assert tracker.detect_stereo_balls_frame(_frame(1, 1200, 100)) == []
+    assert tracker.misses == 1 and tracker.roi_detections == 1
@@ -0,0 +1,95 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import paths  # noqa: F401  (hace importable calibration_bundle)
+from calibration_bundle import cargar_bundle
+from depth_localization import DepthBallLocator, SGBMDepthEstimator, ZEDCloudCalibration
+from frame_sources import rectification_rotation
+from stereo_frame import StereoFrame
+from undistortion import UNDISTORT_CRITERIA, StereoUndistorter
+
+BUNDLE = cargar_bundle()
+WIDTH, HEIGHT = BUNDLE.image_size
+CENTER_BOX = (WIDTH / 2 - 20, HEIGHT / 2 - 20, WIDTH / 2 + 20, HEIGHT / 2 + 20)
+
+
+def _render_plane(K, D, R, T, z0, textura):
+    """
+    Vista (con distorsión) de un plano texturado z = z0 del sistema de la
+    cámara izquierda, solo en la región central de la imagen.
+    """
+    ys, xs = np.mgrid[300:780, 600:1320].astype(np.float64)
+    rays = cv2.undistortPoints(np.stack((xs, ys), -1).reshape(-1, 1, 2), K, D, criteria=UNDISTORT_CRITERIA)
+    d = np.hstack((rays.reshape(-1, 2), np.ones((xs.size, 1)))) @ R
+    c = -R.T @ np.ravel(T)
+    t = (z0 - c[2]) / d[:, 2]
+    mx = ((c[0] + t * d[:, 0]) * 400 / z0 + 1000).reshape(xs.shape).astype(np.float32)
+    my = ((c[1] + t * d[:, 1]) * 400 / z0 + 1000).reshape(xs.shape).astype(np.float32)
+    image = np.full((HEIGHT, WIDTH), 128, np.uint8)
+    image[300:780, 600:1320] = cv2.remap(textura, mx, my, cv2.INTER_LINEAR)
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+@pytest.fixture(scope="module")
+def undistorter():
+    return StereoUndistorter(BUNDLE.K1, BUNDLE.D1, BUNDLE.K2, BUNDLE.D2, BUNDLE.R, BUNDLE.T, cache_dir=None)
+
+
+@pytest.mark.parametrize("z0", [15.0, 40.0])
+def test_sgbm_depth_of_textured_plane(undistorter, z0):
+    rng = np.random.default_rng(0)
+    textura = cv2.GaussianBlur(rng.integers(0, 256, (2000, 2000), dtype=np.uint8), (0, 0), 1.5)
+    left = _render_plane(BUNDLE.K1, BUNDLE.D1, np.eye(3), np.zeros(3), z0, textura)
+    right = _render_plane(BUNDLE.K2, BUNDLE.D2, BUNDLE.R, BUNDLE.T, z0, textura)
+    estimator = SGBMDepthEstimator(undistorter)
+
+    # La rectificación mantiene una focal del orden de la de K1
+    assert undistorter.rectification_maps((WIDTH, HEIGHT))["P1"][0, 0] < 2 * BUNDLE.K1[0, 0]
+    t0 = time.perf_counter()
+    punto = estimator.locate(left, right, CENTER_BOX)
+    assert time.perf_counter() - t0 < 0.05
+    assert punto[2] == pytest.approx(z0, rel=0.05)
+
+
+class FakeDetector:
+    T = BUNDLE.T
+    to_output_units = staticmethod(lambda point: [int(v) for v in point])
+
+    def __init__(self, undistorter):
+        self.undistorter = undistorter
+
+    def detect_balls_batch(self, images, imgsz=None):
+        return [[{'centroide': (10.0, 10.0), 'bbox': (8.0, 8.0, 12.0, 12.0), 'confianza': 0.8}] for _ in images]
+
+
+def _cloud_frame(point):
+    image = np.zeros((20, 20, 3), dtype=np.uint8)
+    cloud = np.full((20, 20, 3), np.nan, dtype=np.float32)
+    cloud[6:14, 6:14] = point
+    return StereoFrame(0, 0.0, image, image, cloud)
+
+
+def test_zed_cloud_uses_factory_baseline_and_rotation(undistorter):
+    calibracion = ZEDCloudCalibration()
+    locator = DepthBallLocator(FakeDetector(undistorter), mode="zed", zed_calibration=calibracion)
+    frame = _cloud_frame([0.1, 0.0, 2.0])
+    # Sin los datos de la cámara abierta no se usa la nube
+    assert locator.detect_stereo_balls_frame(frame) == []
+
+    R = cv2.Rodrigues(np.array([0.0, 0.02, 0.0]))[0]
+    rotation = rectification_rotation(R, [-0.12, 0.0, 0.0])
+    calibracion.configure(0.12, rotation)
+    (pista,) = locator.detect_stereo_balls_frame(frame)
+    escala = np.linalg.norm(BUNDLE.T) / 0.12
+    np.testing.assert_allclose(pista['posicion'], rotation.T @ (np.array([0.1, 0.0, 2.0]) * escala), rtol=1e-5)
+
+
+def test_depths_out_of_range_are_rejected(undistorter):
+    locator = DepthBallLocator(FakeDetector(undistorter), mode="zed", zed_calibration=ZEDCloudCalibration(0.12))
+    # 0.1 m y 30 m con una distancia entre cámaras de 0.12 m
+    assert locator.detect_stereo_balls_frame(_cloud_frame([0.0, 0.0, 0.1])) == []
+    assert locator.detect_stereo_balls_frame(_cloud_frame([0.0, 0.0, 30.0])) == []
+    assert len(locator.detect_stereo_balls_frame(_cloud_frame([0.0, 0.0, 3.0]))) == 1
@@ -0,0 +1,101 @@
+import os
+import time
+
+import numpy as np
+
+from detection_cache import DetectionCache, image_key
+
+
+def _image(value, shape=(8, 8, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def test_image_key_depends_on_content_shape_and_extra():
+    key = image_key(_image(1))
+    assert key == image_key(_image(1).copy())
+    assert key != image_key(_image(2))
+    assert key != image_key(_image(1, (8, 4, 6)))
+    assert key != image_key(_image(1), 640)
+
+
+def test_put_get_and_namespace_miss(tmp_path):
+    cache = DetectionCache(str(tmp_path))
+    ns = cache.namespace({"detector": "yolo", "conf": 0.5})
+    assert ns == cache.namespace({"conf": 0.5, "detector": "yolo"})
+    otro = cache.namespace({"detector": "yolo", "conf": 0.6})
+    key = image_key(_image(1))
+    boxes = np.arange(12, dtype=np.float32).reshape(2, 6)
+
+    assert cache.get(ns, key) is None
+    cache.put(ns, key, boxes=boxes, labels=np.array(["Left", "Right"]))
+    entry = cache.get(ns, key)
+    np.testing.assert_array_equal(entry["boxes"], boxes)
+    assert list(entry["labels"]) == ["Left", "Right"]
+    # Otra firma del detector nunca recibe el resultado
+    assert cache.get(otro, key) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_entries_persist_across_instances(tmp_path):
+    cache = DetectionCache(str(tmp_path))
+    ns, key = cache.namespace({"d": 1}), image_key(_image(3))
+    cache.put(ns, key, boxes=np.ones((1, 6)))
+    # Resto de una escritura interrumpida
+    open(os.path.join(str(tmp_path), ns, "zz.123.tmp.npz"), "wb").close()
+
+    reabierta = DetectionCache(str(tmp_path))
+    assert reabierta.stats()["entries"] == 1
+    np.testing.assert_array_equal(reabierta.get(ns, key)["boxes"], np.ones((1, 6)))
+    assert not os.path.exists(os.path.join(str(tmp_path), ns, "zz.123.tmp.npz"))
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = DetectionCache(str(tmp_path))
+    ns = cache.namespace({"d": 1})
+    keys = [image_key(_image(i)) for i in range(3)]
+    for key in keys:
+        cache.put(ns, key, data=np.zeros(1000))
+    entry_bytes = cache.stats()["bytes"] // 3
+
+    # keys[0] pasa a ser la más reciente; al reducir el límite sale keys[1]
+    assert cache.get(ns, keys[0]) is not None
+    cache.max_bytes = 2 * entry_bytes + entry_bytes // 2
+    cache.put(ns, image_key(_image(9)), data=np.zeros(1000))
+    assert cache.get(ns, keys[1]) is None
+    assert cache.get(ns, keys[0]) is not None
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_lru_order_survives_restart(tmp_path):
+    cache = DetectionCache(str(tmp_path))
+    ns = cache.namespace({"d": 1})
+    keys = [image_key(_image(i)) for i in range(3)]
+    for key in keys:
+        cache.put(ns, key, data=np.zeros(1000))
+    entry_bytes = cache.stats()["bytes"] // 3
+    # El orden se guarda en la fecha de modificación
+    antigua = time.time() - 60
+    for i, key in enumerate(keys):
+        os.utime(cache._path(ns, key), (antigua + i, antigua + i))
+    os.utime(cache._path(ns, keys[0]))
+
+    reabierta = DetectionCache(str(tmp_path), max_bytes=2 * entry_bytes)
+    assert reabierta.get(ns, keys[1]) is None
+    assert reabierta.get(ns, keys[0]) is not None
+    assert reabierta.get(ns, keys[2]) is not None
+
+
+def test_invalidate_namespace_or_everything(tmp_path):
+    cache = DetectionCache(str(tmp_path))
+    a, b = cache.namespace({"d": "a"}), cache.namespace({"d": "b"})
+    key = image_key(_image(1))
+    cache.put(a, key, x=np.zeros(1))
+    cache.put(b, key, x=np.zeros(1))
+
+    cache.invalidate(a)
+    assert cache.get(a, key) is None
+    assert cache.get(b, key) is not None
+    cache.invalidate()
+    assert cache.get(b, key) is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+    assert os.listdir(str(tmp_path)) == []
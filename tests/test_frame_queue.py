@@ -0,0 +1,43 @@
+import threading
+import time
+
+import numpy as np
+
+from frame_queue import StereoFrameQueue
+
+
+def _fill(queue, count):
+    for i in range(count):
+        assert queue.put(np.zeros((2, 2), np.uint8), np.zeros((2, 2), np.uint8), i, float(i))
+
+
+def test_drop_oldest_discards_pending_frames():
+    queue = StereoFrameQueue((2, 2), capacity=2)
+    _fill(queue, 4)
+    assert queue.dropped == 2
+    assert [queue.get(timeout=0).frame_id for _ in range(2)] == [2, 3]
+
+
+def test_reserve_waits_when_consumer_holds_every_slot():
+    queue = StereoFrameQueue((2, 2), capacity=2)
+    _fill(queue, 2)
+    held = [queue.get(timeout=0), queue.get(timeout=0)]
+
+    # Nada que descartar: expira sin contar descartes en lugar de devolver None al momento
+    start = time.monotonic()
+    assert queue.reserve(timeout=0.05) is None
+    assert time.monotonic() - start >= 0.04
+    assert queue.dropped == 0
+
+    threading.Timer(0.05, queue.release, args=(held[0],)).start()
+    slot = queue.reserve(timeout=5)
+    assert slot is not None and queue.dropped == 0
+
+
+def test_reserve_returns_when_queue_is_closed():
+    queue = StereoFrameQueue((2, 2), capacity=2)
+    _fill(queue, 2)
+    queue.get(timeout=0)
+    queue.get(timeout=0)
+    threading.Timer(0.05, queue.close).start()
+    assert queue.reserve(timeout=5) is None
@@ -0,0 +1,38 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from frame_sources import ImagePairDirectorySource, VideoFileSource
+
+
+def test_video_timestamps_match_frame_positions(tmp_path):
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 32))
+    if not writer.isOpened():
+        pytest.skip("OpenCV sin codificador MJPG")
+    for i in range(5):
+        writer.write(np.full((32, 64, 3), i * 40, dtype=np.uint8))
+    writer.release()
+
+    with VideoFileSource(path, start_time=1000.0) as source:
+        frames = list(source)
+    assert [f.frame_id for f in frames] == [0, 1, 2, 3, 4]
+    np.testing.assert_allclose([f.timestamp for f in frames], [1000.0, 1000.1, 1000.2, 1000.3, 1000.4])
+    # Lado a lado: cada vista es la mitad del frame
+    assert frames[0].left.shape == (32, 32, 3)
+
+
+def test_image_pair_timestamps_are_absolute(tmp_path):
+    for side in ("left", "right"):
+        os.makedirs(tmp_path / side)
+        for i in (3, 4):
+            cv2.imwrite(str(tmp_path / side / f"img_{i:06d}.png"), np.zeros((8, 8, 3), dtype=np.uint8))
+    os.utime(tmp_path / "left" / "img_000003.png", (5000.0, 5000.0))
+
+    with ImagePairDirectorySource(str(tmp_path / "left"), str(tmp_path / "right"), fps=10) as source:
+        assert [(f.frame_id, f.timestamp) for f in source] == [(3, 5000.3), (4, 5000.4)]
+    with ImagePairDirectorySource(str(tmp_path / "left"), str(tmp_path / "right"), fps=10,
+                                  start_time=100.0) as source:
+        assert [f.timestamp for f in source] == pytest.approx([100.3, 100.4])
@@ -0,0 +1,15 @@
+from instrumentation import Metrics
+
+
+def test_prometheus_summary_has_cumulative_sum_and_count():
+    metrics = Metrics(window=2)
+    for seconds in (0.01, 0.02, 0.03):
+        metrics.observe("yolo", seconds)
+    metrics.incr("ball_misses", 2)
+
+    lines = metrics.to_prometheus().splitlines()
+    # _sum y _count cubren todas las muestras aunque la ventana solo guarde dos
+    assert 'v3d_span_seconds_sum{span="yolo"} 0.060000' in lines
+    assert 'v3d_span_seconds_count{span="yolo"} 3' in lines
+    assert 'v3d_span_seconds{span="yolo",quantile="0.5"} 0.025000' in lines
+    assert "v3d_ball_misses_total 2" in lines
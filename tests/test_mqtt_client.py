@@ -0,0 +1,87 @@
+from communication.local_broker import LocalBroker, LocalBrokerClient
+from communication.mqtt_client import DROP_NEWEST, MQTTClient
+
+
+def _client(broker, **kwargs):
+    return MQTTClient(client=LocalBrokerClient(broker), **kwargs)
+
+
+def _payloads(broker, topic):
+    return [payload for _, t, payload in broker.messages if t == topic]
+
+
+def test_buffers_while_offline_and_flushes_on_connect():
+    broker = LocalBroker()
+    mqtt = _client(broker)
+    assert mqtt.health()["state"] == "disconnected"
+    for i in range(3):
+        assert mqtt.publish("t", str(i))
+    assert mqtt.health()["pending"] == 3 and _payloads(broker, "t") == []
+
+    mqtt.connect()
+    assert mqtt.health()["state"] == "connected"
+    assert _payloads(broker, "t") == ["0", "1", "2"]
+    assert broker.retained["v3d/status"] == "online"
+    assert mqtt.flush(timeout=0.1)
+
+
+def test_broker_outage_reconnects_and_publishes_last_will():
+    broker = LocalBroker()
+    mqtt = _client(broker, min_backoff=2, max_backoff=20)
+    # El backoff exponencial se delega en el cliente (paho) con estos límites
+    assert mqtt.client.reconnect_delay == (2, 20)
+    mqtt.connect()
+
+    broker.set_online(False)
+    health = mqtt.health()
+    assert health["state"] == "reconnecting" and health["last_error"] == "disconnect 1"
+    assert broker.retained["v3d/status"] == "offline"
+    mqtt.publish("t", "durante la caída")
+    assert mqtt.health()["pending"] == 1
+
+    broker.set_online(True)
+    health = mqtt.health()
+    assert health["state"] == "connected" and health["reconnects"] == 1 and health["pending"] == 0
+    assert broker.retained["v3d/status"] == "online"
+    assert _payloads(broker, "t") == ["durante la caída"]
+
+
+def test_clean_disconnect_does_not_trigger_last_will():
+    broker = LocalBroker()
+    mqtt = _client(broker)
+    mqtt.connect()
+    mqtt.disconnect()
+    assert mqtt.health()["state"] == "disconnected"
+    assert _payloads(broker, "v3d/status") == ["online", "offline"]
+
+
+def test_bounded_buffer_drop_oldest():
+    mqtt = _client(LocalBroker(), buffer_size=2)
+    assert all(mqtt.publish("t", str(i)) for i in range(4))
+    assert mqtt.health()["dropped"] == 2
+    assert [payload for _, payload, _ in mqtt._buffer] == ["2", "3"]
+
+
+def test_bounded_buffer_drop_newest():
+    mqtt = _client(LocalBroker(), buffer_size=2, drop_policy=DROP_NEWEST)
+    assert [mqtt.publish("t", str(i)) for i in range(4)] == [True, True, False, False]
+    assert [payload for _, payload, _ in mqtt._buffer] == ["0", "1"]
+
+
+def test_new_messages_do_not_overtake_the_flush():
+    broker = LocalBroker()
+    mqtt = _client(broker)
+    for i in range(3):
+        mqtt.publish("t", f"viejo {i}")
+
+    # Un suscriptor que publica al recibir el primer mensaje del buffer, en mitad del vaciado
+    observer = LocalBrokerClient(broker)
+    observer.connect_async("local")
+    observer.loop_start()
+    observer.subscribe("t")
+    observer.on_message = lambda client, userdata, msg: (
+        mqtt.publish("t", "nuevo") if msg.payload == b"viejo 0" else None)
+
+    mqtt.connect()
+    assert _payloads(broker, "t") == ["viejo 0", "viejo 1", "viejo 2", "nuevo"]
+    assert mqtt.health()["pending"] == 0
@@ -0,0 +1,55 @@
+import random
+import threading
+import time
+
+import numpy as np
+
+from pipeline import StereoPipeline
+from stereo_frame import StereoFrame
+
+
+class SlowHands:
+    def count_fingers_frame(self, frame):
+        time.sleep(random.uniform(0, 0.01))
+        return frame.frame_id % 5, None
+
+
+class SlowBall:
+    to_output_units = staticmethod(lambda point: [int(v) for v in point])
+
+    def detect_stereo_balls_frame(self, frame, imgsz=None):
+        time.sleep(random.uniform(0, 0.01))
+        return [{'posicion': np.array([frame.frame_id, 0.0, 1.0])}]
+
+
+def _frame(frame_id):
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    return StereoFrame(frame_id, time.time(), image, image)
+
+
+def test_results_are_delivered_in_submission_order():
+    random.seed(0)
+    pipeline = StereoPipeline(SlowHands, SlowBall, hand_workers=3, ball_workers=3, max_in_flight=6)
+    delivered = []
+    lock = threading.Lock()
+
+    def on_result(result):
+        # Una entrega lenta no debe dejar pasar a otra por delante
+        time.sleep(random.uniform(0, 0.002))
+        with lock:
+            delivered.append(result.frame.frame_id)
+
+    for frame_id in range(200):
+        pipeline.submit(_frame(frame_id), on_result)
+    pipeline.close()
+    assert delivered == list(range(200))
+
+
+def test_skipped_hands_repeat_last_delivered_count():
+    pipeline = StereoPipeline(SlowHands, SlowBall, max_in_flight=2)
+    results = []
+    for frame_id in range(6):
+        pipeline.submit(_frame(frame_id), results.append, skip_hands=frame_id % 2 == 1)
+    pipeline.close()
+    assert [r.fingers for r in results] == [0, 0, 2, 2, 4, 4]
+    assert [r.centroide[0] for r in results] == list(range(6))
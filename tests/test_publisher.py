@@ -0,0 +1,82 @@
+import math
+import struct
+
+import numpy as np
+import pytest
+
+from communication.publisher import (STATE_STRUCT, decode_state, decode_tracks, decode_world_tracks, encode_state,
+                                     encode_tracks, encode_world_tracks)
+from track_smoothing import TrackState
+
+
+def test_state_round_trip():
+    payload = encode_state(7, 1000.25, [12, -3, 150], 3, publish_timestamp=1000.5)
+    assert len(payload) == STATE_STRUCT.size == 34
+    assert decode_state(payload) == {
+        "frame_id": 7, "capture_timestamp": 1000.25, "publish_timestamp": 1000.5,
+        "position": (12.0, -3.0, 150.0), "fingers": 3,
+    }
+
+
+def test_state_without_position_or_fingers():
+    state = decode_state(encode_state(2 ** 32 + 5, 1.0, None, None, publish_timestamp=2.0))
+    # frame_id se envía en 32 bits
+    assert state["frame_id"] == 5
+    assert state["position"] is None
+    assert state["fingers"] is None
+
+
+def test_state_rejects_other_versions():
+    payload = bytearray(encode_state(1, 1.0, None, None, publish_timestamp=1.0))
+    payload[0] = 99
+    with pytest.raises(ValueError):
+        decode_state(bytes(payload))
+
+
+def _state(track_id, coasting, offset):
+    return TrackState(track_id, 10.0, np.array([0.5, 0.25, 9.0]) + offset, np.array([1.0, 0.0, -2.0]),
+                      np.array([0.6, 0.25, 8.8]) + offset, coasting, hits=3)
+
+
+def test_tracks_round_trip():
+    payload = encode_tracks(42, 10.0, 10.05, [_state(1, False, 0.0), _state(70000, True, 1.0)])
+    decoded = decode_tracks(payload)
+    assert decoded["frame_id"] == 42
+    assert decoded["capture_timestamp"] == 10.0
+    assert decoded["publish_timestamp"] == 10.05
+    first, second = decoded["tracks"]
+    assert first["track_id"] == 1 and not first["coasting"]
+    assert first["position"] == (0.5, 0.25, 9.0)
+    assert first["velocity"] == (1.0, 0.0, -2.0)
+    assert first["prediction"] == pytest.approx((0.6, 0.25, 8.8))
+    # Los ids se envían en 16 bits
+    assert second["track_id"] == 70000 & 0xFFFF and second["coasting"]
+    assert second["position"] == (1.5, 1.25, 10.0)
+
+
+def test_tracks_empty_and_version_check():
+    payload = encode_tracks(1, 1.0, 1.0, [])
+    assert decode_tracks(payload)["tracks"] == []
+    with pytest.raises(ValueError):
+        decode_tracks(b"\x02" + payload[1:])
+
+
+def test_tracks_are_capped_at_255():
+    decoded = decode_tracks(encode_tracks(1, 1.0, 1.0, [_state(i, False, 0.0) for i in range(300)]))
+    assert len(decoded["tracks"]) == 255
+
+
+def test_world_tracks_round_trip():
+    pistas = [{"posicion": (1.0, 2.0, 3.0), "confianza": 0.5}, {"posicion": (-1.0, 0.0, 4.5), "confianza": 1.0}]
+    timestamp, decoded = decode_world_tracks(encode_world_tracks(123.5, pistas))
+    assert timestamp == 123.5
+    assert decoded == pistas
+
+
+def test_world_tracks_nan_and_version_check():
+    payload = encode_world_tracks(1.0, [{"posicion": (math.nan, 0.0, 1.0), "confianza": 0.0}])
+    _, (pista,) = decode_world_tracks(payload)
+    assert math.isnan(pista["posicion"][0])
+    assert decode_world_tracks(encode_world_tracks(1.0, []))[1] == []
+    with pytest.raises(ValueError):
+        decode_world_tracks(struct.pack("<B", 0) + payload[1:])
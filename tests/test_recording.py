@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+
+from recording import INDEX_DTYPE, INDEX_FILE, SessionStore, StereoRecorder, StereoRecording
+
+
+def _pairs(n, shape=(24, 32, 3)):
+    rng = np.random.default_rng(0)
+    return [(i, 1000.0 + i / 30, rng.integers(0, 256, shape, dtype=np.uint8),
+             rng.integers(0, 256, shape, dtype=np.uint8)) for i in range(n)]
+
+
+def _record(session_dir, pairs, **kwargs):
+    recorder = StereoRecorder(session_dir, max_pending=len(pairs), **kwargs)
+    for pair in pairs:
+        assert recorder.submit(*pair)
+    recorder.close()
+    return recorder
+
+
+@pytest.mark.parametrize("encoding", ["png", "raw"])
+def test_lossless_round_trip_across_chunks(tmp_path, encoding):
+    pairs = _pairs(7)
+    recorder = _record(str(tmp_path), pairs, encoding=encoding, chunk_records=3)
+    assert recorder.written == 7
+    assert os.path.exists(tmp_path / "chunk_000002.bin")
+
+    with StereoRecording(str(tmp_path)) as recording:
+        assert len(recording) == 7
+        assert list(recording.frame_ids) == list(range(7))
+        # Acceso aleatorio, en otro orden que el de grabación
+        for frame_id, timestamp, left, right in reversed(pairs):
+            frame = recording.read(frame_id)
+            assert frame.frame_id == frame_id
+            assert frame.timestamp == timestamp
+            np.testing.assert_array_equal(frame.left, left)
+            np.testing.assert_array_equal(frame.right, right)
+
+
+def test_jpg_round_trip_is_close(tmp_path):
+    shape = (24, 32, 3)
+    image = np.full(shape, 120, dtype=np.uint8)
+    _record(str(tmp_path), [(5, 1.0, image, image)], encoding="jpg", quality=95)
+    with StereoRecording(str(tmp_path)) as recording:
+        frame = recording[5]
+        assert frame.left.shape == shape
+        assert np.abs(frame.left.astype(int) - 120).max() <= 2
+        with pytest.raises(KeyError):
+            recording.read(6)
+
+
+def test_partial_index_entry_is_ignored(tmp_path):
+    _record(str(tmp_path), _pairs(3), encoding="raw")
+    with open(tmp_path / INDEX_FILE, "ab") as f:
+        f.write(b"\0" * (INDEX_DTYPE.itemsize // 2))
+    with StereoRecording(str(tmp_path)) as recording:
+        assert len(recording) == 3
+
+
+def test_existing_session_is_not_overwritten(tmp_path):
+    _record(str(tmp_path), _pairs(2), encoding="raw")
+    with pytest.raises(FileExistsError):
+        StereoRecorder(str(tmp_path), encoding="raw")
+    with StereoRecording(str(tmp_path)) as recording:
+        assert len(recording) == 2
+
+
+def test_empty_session_can_be_opened(tmp_path):
+    StereoRecorder(str(tmp_path)).close()
+    with StereoRecording(str(tmp_path)) as recording:
+        assert len(recording) == 0
+
+
+def test_rotate_keeps_most_recent_sessions(tmp_path):
+    store = SessionStore(str(tmp_path))
+    for name in ("a", "b", "c", "d"):
+        store.new_session(name)
+    # Resto de una rotación interrumpida
+    os.makedirs(tmp_path / (SessionStore.TRASH_PREFIX + "old"))
+
+    hilo = store.rotate(keep=2)
+    assert [os.path.basename(p) for p in store.sessions()] == ["session_c", "session_d"]
+    hilo.join()
+    assert sorted(os.listdir(tmp_path)) == ["session_c", "session_d"]
+    assert store.rotate(keep=2) is None
+
+
+def test_new_sessions_in_the_same_second_get_distinct_names(tmp_path):
+    store = SessionStore(str(tmp_path))
+    paths = [store.new_session() for _ in range(5)]
+    assert len(set(paths)) == 5
+    # El orden alfabético es el de creación
+    assert store.sessions() == paths
+
+    store.rotate(keep=2)
+    assert store.sessions() == paths[-2:]
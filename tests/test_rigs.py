@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from rigs import MultiRigTracker, RigConfig, RigDetection, RigRegistry, WorldFusion
+from stereo_frame import StereoFrame
+
+
+def _detection(rig, timestamp, *positions):
+    return RigDetection(rig, 0, timestamp, np.asarray(positions, dtype=np.float64).reshape(-1, 3),
+                        [1.0] * len(positions))
+
+
+def test_fusion_closes_windows_by_watermark_and_on_finish():
+    emitted = []
+    fusion = WorldFusion(["a", "b"], lambda t, pistas: emitted.append((t, pistas)), window=0.1)
+
+    fusion.add(_detection("a", 0.01, (0, 0, 1)))
+    fusion.add(_detection("a", 0.15, (0, 0, 1)))
+    # "b" aún no ha entregado nada: ninguna ventana se puede cerrar
+    assert emitted == []
+
+    fusion.add(_detection("b", 0.02, (0, 0, 1.2)))
+    assert emitted == []
+    fusion.add(_detection("b", 0.12))
+    # Ambos rigs han pasado de la ventana [0, 0.1): se funde y se emite
+    assert len(emitted) == 1
+    t, pistas = emitted[0]
+    assert t == pytest.approx(0.05)
+    assert len(pistas) == 1 and pistas[0]["rigs"] == ["a", "b"]
+    np.testing.assert_allclose(pistas[0]["posicion"], [0, 0, 1.1])
+
+    fusion.finish("a")
+    assert len(emitted) == 1
+    fusion.finish("b")
+    assert [t for t, _ in emitted] == pytest.approx([0.05, 0.15])
+
+
+def test_fusion_drops_late_detections():
+    emitted = []
+    fusion = WorldFusion(["a", "b"], lambda t, pistas: emitted.append(t), window=0.1)
+    fusion.add(_detection("a", 0.25, (0, 0, 1)))
+    fusion.add(_detection("b", 0.25, (0, 0, 1)))
+    fusion.add(_detection("a", 0.35, (0, 0, 1)))
+    fusion.add(_detection("b", 0.35, (0, 0, 1)))
+    assert emitted == pytest.approx([0.25])
+
+    # Ventana ya emitida (y anteriores): se descartan y no se vuelven a emitir
+    fusion.add(_detection("a", 0.21, (0, 0, 1)))
+    fusion.add(_detection("b", 0.05, (0, 0, 1)))
+    assert fusion.late_detections == 2
+    fusion.finish("a")
+    fusion.finish("b")
+    assert emitted == pytest.approx([0.25, 0.35])
+
+
+class _StubDetector:
+    """
+    Detector falso: la imagen izquierda lleva la coordenada z de la pelota.
+    """
+
+    def __init__(self, calibration_path=None):
+        self.calibration_path = calibration_path
+
+    def detect_stereo_balls_frame(self, frame):
+        z = float(frame.left[0, 0])
+        return [{"posicion": np.array([0.0, 0.0, z]), "confianza": 1.0}] if z > 0 else []
+
+
+def _frames(zs, period=0.1):
+    for i, z in enumerate(zs):
+        image = np.full((2, 2), z, dtype=np.float64)
+        # Marcas en mitad de cada ventana para no depender del redondeo en los bordes
+        yield StereoFrame(i, 100.03 + i * period, image, image)
+
+
+def test_multi_rig_tracker_runs_sources_and_fuses_in_world_frame():
+    registry = RigRegistry()
+    registry.add(RigConfig("norte", "norte.npz"))
+    # El rig sur está desplazado 1 unidad en x respecto al sistema del mundo
+    registry.add(RigConfig("sur", "sur.npz", t_world=[1.0, 0.0, 0.0]))
+
+    calibraciones = []
+
+    def factory(calibration_path):
+        calibraciones.append(calibration_path)
+        return _StubDetector(calibration_path)
+
+    emitted = []
+    tracker = MultiRigTracker(registry, on_tracks=lambda t, pistas: emitted.append((t, pistas)),
+                              window=0.1, merge_distance=0.5, detector_factory=factory)
+    tracker.run(sources={"norte": _frames([2.0, 2.0, 0.0]), "sur": _frames([2.0, 0.0, 0.0])})
+
+    assert sorted(calibraciones) == ["norte.npz", "sur.npz"]
+    # Los frames sin pelota también cierran su ventana (con una lista vacía)
+    assert [t for t, _ in emitted] == pytest.approx([100.05, 100.15, 100.25])
+    # Primer frame: un punto por rig, a 1 unidad entre sí (más que merge_distance)
+    assert sorted(tuple(p["posicion"]) for p in emitted[0][1]) == [(0.0, 0.0, 2.0), (1.0, 0.0, 2.0)]
+    assert [p["rigs"] for p in emitted[1][1]] == [["norte"]]
+    assert emitted[2][1] == []
+    assert tracker.fusion.late_detections == 0
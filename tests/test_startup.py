@@ -0,0 +1,20 @@
+import pytest
+
+from startup import StartupError, StartupTimer
+
+
+def test_failing_phase_is_reported_by_name():
+    def fallo():
+        raise ValueError("sin modelo")
+
+    timer = StartupTimer()
+    with pytest.raises(StartupError) as info:
+        timer.run_concurrently({"camera": lambda: "zed", "models": fallo})
+    assert info.value.phase == "models"
+    assert isinstance(info.value.__cause__, ValueError)
+    # Las demás fases terminan y se miden igualmente
+    assert set(timer.phases) == {"camera", "models"}
+
+
+def test_results_by_phase():
+    assert StartupTimer().run_concurrently({"a": lambda: 1, "b": lambda: 2}) == {"a": 1, "b": 2}
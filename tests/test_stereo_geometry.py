@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+import pytest
+
+from stereo_geometry import StereoGeometry, to_output_units
+from stereo_matching import epipolar_distances
+
+
+def _rig():
+    K = np.array([[700.0, 0.0, 640.0], [0.0, 700.0, 360.0], [0.0, 0.0, 1.0]])
+    R, _ = cv2.Rodrigues(np.array([0.01, -0.02, 0.005]))
+    T = np.array([-0.12, 0.002, 0.001])
+    tx = np.array([[0.0, -T[2], T[1]], [T[2], 0.0, -T[0]], [-T[1], T[0], 0.0]])
+    K_inv = np.linalg.inv(K)
+    F = K_inv.T @ tx @ R @ K_inv
+    P1 = K @ np.hstack((np.eye(3), np.zeros((3, 1))))
+    P2 = K @ np.hstack((R, T.reshape(3, 1)))
+    return StereoGeometry(P1, P2, R, T, F)
+
+
+def _puntos(n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack((rng.uniform(-1, 1, n), rng.uniform(-0.5, 0.5, n), rng.uniform(2, 8, n)))
+
+
+def test_exact_correspondences_round_trip():
+    geometry = _rig()
+    puntos = _puntos()
+    pts_l, pts_r = geometry.project(puntos)
+
+    result = geometry.evaluate(pts_l, pts_r)
+    np.testing.assert_allclose(result.points, puntos, atol=1e-6)
+    assert result.reprojection_error.max() < 1e-6
+    assert result.epipolar_residual.max() < 1e-6
+    assert result.in_front.all() and result.valid.all()
+    assert result.summary()["valid"] == len(puntos)
+
+
+def test_thresholds_reject_noisy_pairs():
+    geometry = _rig()
+    pts_l, pts_r = geometry.project(_puntos(10))
+    # Desplazamiento vertical: rompe la restricción epipolar en los 3 primeros pares
+    pts_r = pts_r.copy()
+    pts_r[:3, 1] += 20.0
+
+    result = geometry.evaluate(pts_l, pts_r, max_reprojection_error=1.0, max_epipolar_residual=1.0)
+    assert not result.valid[:3].any()
+    assert result.valid[3:].all()
+    assert (result.epipolar_residual[:3] > 5.0).all()
+    # Sin umbrales solo se exige que queden delante de las cámaras
+    assert result.in_front.all() and geometry.evaluate(pts_l, pts_r).valid.all()
+
+
+def test_constructor_thresholds_are_defaults():
+    geometry = _rig()
+    pts_l, pts_r = geometry.project(_puntos(5))
+    pts_r = pts_r + [0.0, 20.0]
+    geometry.max_epipolar_residual = 1.0
+    assert not geometry.evaluate(pts_l, pts_r).valid.any()
+    assert geometry.evaluate(pts_l, pts_r, max_epipolar_residual=100.0).valid.all()
+
+
+def test_points_behind_the_cameras_are_not_valid():
+    geometry = _rig()
+    puntos = _puntos(4)
+    puntos[0, 2] = -3.0
+    pts_l, pts_r = geometry.project(puntos)
+    result = geometry.evaluate(pts_l, pts_r)
+    assert list(result.in_front) == [False, True, True, True]
+    assert list(result.valid) == [False, True, True, True]
+    assert result.summary()["in_front"] == 3
+
+
+def test_paired_residual_is_diagonal_of_all_pairs():
+    geometry = _rig()
+    pts_l, pts_r = geometry.project(_puntos(8))
+    rng = np.random.default_rng(1)
+    pts_l = pts_l + rng.normal(0, 2, pts_l.shape)
+    np.testing.assert_allclose(geometry.epipolar_residual(pts_l, pts_r),
+                               np.diag(epipolar_distances(geometry.F, pts_l, pts_r)))
+
+
+def test_depths_in_both_cameras():
+    geometry = _rig()
+    puntos = _puntos(5)
+    z_l, z_r = geometry.depths(puntos)
+    np.testing.assert_allclose(z_l, puntos[:, 2])
+    np.testing.assert_allclose(z_r, (puntos @ geometry.R.T + geometry.T)[:, 2])
+
+
+def test_empty_input():
+    result = _rig().evaluate(np.empty((0, 2)), np.empty((0, 2)))
+    assert len(result) == 0
+    assert result.points.shape == (0, 3)
+    assert result.valid.dtype == bool
+    assert result.summary() == {"count": 0, "in_front": 0, "valid": 0}
+
+
+def test_output_units():
+    assert to_output_units([0.5, -0.256, 9.9]) == [50, -25, 9]
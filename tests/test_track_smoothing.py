@@ -0,0 +1,42 @@
+import numpy as np
+
+from track_smoothing import BallTrackSmoother
+
+
+def _seguir(smoother, velocidad, frames=30, fps=30):
+    for i in range(frames):
+        t = i / fps
+        smoother.update(t, [[velocidad * t, 0.0, 10.0]])
+    return t
+
+
+def test_fast_ball_keeps_a_single_track():
+    smoother = BallTrackSmoother()
+    # 30 unidades/s a 30 fps: 1 unidad entre frames, ya desde la segunda medida
+    _seguir(smoother, 30.0)
+    states = smoother.states()
+    assert len(states) == 1 and states[0].hits == 30
+    np.testing.assert_allclose(states[0].velocity, [30.0, 0.0, 0.0], atol=0.5)
+
+
+def test_gate_grows_with_time_since_last_measurement():
+    def tracks_after(gap, salto):
+        smoother = BallTrackSmoother()
+        t = _seguir(smoother, 3.0) + gap
+        smoother.update(t, [[3.0 * t + salto, 0.0, 10.0]])
+        return len(smoother.states())
+
+    # El mismo desvío abre una pista nueva en el frame siguiente, pero no tras una pérdida de 0.4 s
+    assert tracks_after(1 / 30, 0.6) == 2
+    assert tracks_after(0.4, 0.6) == 1
+    assert tracks_after(0.4, 3.0) == 2
+
+
+def test_simultaneous_balls_get_separate_tracks():
+    smoother = BallTrackSmoother()
+    for i in range(10):
+        t = i / 30
+        smoother.update(t, [[3.0 * t, 0.0, 10.0], [-3.0 * t, 2.0, 10.0]])
+    states = smoother.states()
+    assert [s.hits for s in states] == [10, 10]
+    assert sorted(np.sign(s.velocity[0]) for s in states) == [-1.0, 1.0]